@@ -1,10 +1,22 @@
-from typing import Dict, Any
-from app.db_tool import lookup_patient_by_name
-from app.rag import get_rag_chain
-from app.logger_conf import logger
+import asyncio
+import importlib
+import os
+from typing import Any, AsyncIterator, Dict, Optional
+from app.db_tool import lookup_patient_by_name, suggest_patients_by_name
+from app.intent import classify_intent
+from app.logger_conf import clip, logger
+from app.metrics import span
 # from app.web_search import ddg_search
-from app.web_search import web_search_combined
 import re
+import weakref
+
+# opt-in: RAG questions also start a web search, so a "not found in reference" answer doesn't
+# pay for two sequential round trips. Off by default: every search is billed by the providers
+# and sends the question to them even when RAG answers. The search starts only after
+# CLINICAL_SPECULATIVE_WEB_DELAY_S, so quick RAG answers cancel it before any request goes out.
+CLINICAL_SPECULATIVE_WEB = os.getenv("CLINICAL_SPECULATIVE_WEB", "0") == "1"
+CLINICAL_SPECULATIVE_WEB_DELAY_S = float(os.getenv("CLINICAL_SPECULATIVE_WEB_DELAY_S", "2"))
+CLINICAL_RAG_DEADLINE_S = float(os.getenv("CLINICAL_RAG_DEADLINE_S", "25"))
 
 # Receptionist Agent
 def receptionist_handle_message(session: Dict[str, Any], message: str) -> Dict[str, Any]:
@@ -12,7 +24,7 @@ def receptionist_handle_message(session: Dict[str, Any], message: str) -> Dict[s
     session: dict to maintain minimal state (e.g., {'stage': 'ask_name', 'patient': None })
     """
     stage = session.get("stage", "ask_name")
-    logger.info("Receptionist handling message at stage %s: %s", stage, message)
+    logger.info("Receptionist handling message at stage %s: %s", stage, clip(message))
 
     if stage == "ask_name":
         # ask patient's name
@@ -23,6 +35,14 @@ def receptionist_handle_message(session: Dict[str, Any], message: str) -> Dict[s
         name = message.strip()
         results = lookup_patient_by_name(name)
         if not results:
+            # likely a misspelling: offer the closest names instead of starting over
+            suggestions = suggest_patients_by_name(name)
+            if suggestions:
+                session["stage"] = "disambiguate"
+                session["candidates"] = suggestions
+                names = [r['patient_name'] for r in suggestions]
+                logger.info("No exact match for '%s'; suggesting %s", name, names)
+                return {"reply": f"I couldn't find '{name}' exactly. Did you mean: {', '.join(names)}? Please reply with your full name.", "session": session}
             session["stage"] = "ask_name"
             logger.info("Patient not found for name: %s", name)
             return {"reply": f"Sorry, I couldn't find a record for '{name}'. Could you please confirm the full name?", "session": session}
@@ -45,6 +65,8 @@ def receptionist_handle_message(session: Dict[str, Any], message: str) -> Dict[s
         # try to match
         candidates = session.get("candidates", [])
         name = message.strip().lower()
+        if len(candidates) == 1 and name in ("yes", "y", "yeah", "yep", "correct", "that's me"):
+            name = candidates[0]['patient_name'].lower()
         for c in candidates:
             if c['patient_name'].lower() == name or str(c['id']) == name:
                 session['patient'] = c
@@ -55,7 +77,7 @@ def receptionist_handle_message(session: Dict[str, Any], message: str) -> Dict[s
     # Default: if stage idle and message seems clinical -> route to clinical agent
     if stage == "idle":
         if is_clinical_question(message):
-            logger.info("Routing to Clinical Agent for message: %s", message)
+            logger.info("Routing to Clinical Agent for message: %s", clip(message))
             return {"reply": "This sounds medical. Connecting you to the Clinical Agent...", "handoff": True, "session": session}
         else:
             # Non-clinical conversation: ask simple follow-up question
@@ -63,70 +85,198 @@ def receptionist_handle_message(session: Dict[str, Any], message: str) -> Dict[s
 
 def is_clinical_question(text: str) -> bool:
     """
-    Improved heuristic to detect clinical/intention-to-search/questions about latest research.
-    Returns True for symptom questions, medication/dose, and explicit "latest/research/study" queries.
+    Detect clinical/intention-to-search/questions about latest research: symptom questions,
+    medication/dose, and explicit "latest/research/study" queries (see app.intent).
     """
-    if not text:
-        return False
-    textl = text.lower()
-
-    # symptom/urgent keywords (existing)
-    clinical_triggers = [
-        "pain", "swelling", "shortness of breath", "dyspnea", "urine",
-        "medication", "dose", "fever", "bleeding", "worsen", "dizziness",
-        "edema", "leg swelling", "ankle swelling", "fluid retention"
-    ]
-    if any(k in textl for k in clinical_triggers):
-        return True
-
-    # research / latest information keywords (new)
-    research_triggers = [
-        "latest", "recent", "research", "study", "studies", "trial", "evidence",
-        "meta-analysis", "systematic review", "what's new", "what is new",
-        "guidelines", "safety", "side effects"
-    ]
-    if any(k in textl for k in research_triggers):
-        return True
-
-    # drug-specific triggers (domain-specific; helpful)
-    drug_triggers = ["sglt2", "sglt2i", "sglt2 inhibitor", "dapagliflozin", "empagliflozin", "canagliflozin", "ertugliflozin"]
-    if any(k in textl for k in drug_triggers):
-        return True
-
-    # question style heuristics
-    if textl.strip().startswith(("should i", "what should i", "do i need", "is it ok", "is it safe")):
-        return True
-
-    return False
+    return classify_intent(text).clinical
 
 # Clinical Agent
 # from app.web_search import ddg_search
 
-def clinical_handle_query(session: Dict[str, Any], question: str) -> Dict[str, Any]:
-    logger.info("Clinical agent handling question: %s", question)
-    qa = get_rag_chain()
+def _citations(src_docs) -> list:
+    citations = []
+    for i, doc in enumerate(src_docs, start=1):
+        excerpt = (doc.page_content[:300]).replace("\n", " ")
+        citations.append({"ref": f"ref#{i}", "excerpt": excerpt})
+    return citations
+
+def _needs_web(answer_text: str) -> bool:
+    return not answer_text.strip() or "not found in reference" in answer_text.lower()
+
+def plan_clinical_query(question: str) -> str:
+    """
+    Decide up front how to answer:
+        "web"  questions about latest research/trials: the reference book can't answer them,
+               so skip retrieval and the LLM call and go straight to web search
+        "rag"  everything else: RAG, optionally with a speculative web search running
+               alongside (CLINICAL_SPECULATIVE_WEB) in case the reference has no answer
+    """
+    return "web" if classify_intent(question).wants_latest else "rag"
+
+def load_clinical_stack():
+    """
+    Import the clinical stack and build the RAG chain. langchain, FAISS, numpy and httpx
+    are only imported here (on a worker thread, or by the startup warm-up), so importing
+    this module and the receptionist path stay free of them; the clinical helpers below
+    import from the already loaded modules.
+    """
+    from app import semantic_cache, web_search  # noqa: F401
+    from app.rag import get_rag_chain
+    return get_rag_chain()
+
+# speculative search task -> event that ends its grace delay early (RAG already gave up)
+_skip_delay: "weakref.WeakKeyDictionary[asyncio.Task, asyncio.Event]" = weakref.WeakKeyDictionary()
+
+async def _delayed_web_search(question: str, delay: float, go: asyncio.Event) -> list:
+    from app.web_search import aweb_search_combined
+    try:
+        await asyncio.wait_for(go.wait(), delay)
+    except asyncio.TimeoutError:
+        pass
+    return await aweb_search_combined(question)
+
+def _start_speculative_web_search(question: str) -> Optional[asyncio.Task]:
+    if not CLINICAL_SPECULATIVE_WEB:
+        return None
+    go = asyncio.Event()
+    task = asyncio.create_task(_delayed_web_search(question, CLINICAL_SPECULATIVE_WEB_DELAY_S, go))
+    _skip_delay[task] = go
+    return task
+
+async def _web_only(question: str) -> list:
+    # "web" plans need neither the index nor the LLM: don't wait for the clinical stack to load
+    await asyncio.to_thread(importlib.import_module, "app.web_search")
+    from app.web_search import aweb_search_combined
+    return await aweb_search_combined(question)
+
+async def _web_results(task: Optional[asyncio.Task], question: str) -> list:
+    from app.web_search import aweb_search_combined
+    # the speculative search has usually finished (or is close) by the time RAG gives up
+    if task is None:
+        return await aweb_search_combined(question)
+    go = _skip_delay.get(task)
+    if go is not None:
+        go.set()
+    return await task
+
+def _cancel(task: Optional[asyncio.Task]):
+    # the RAG answer won: drop the web search (a provider may still bill the request)
+    if task is not None and not task.done():
+        task.cancel()
+
+async def _semantic_lookup(question: str):
+    """
+    (question embedding, cache hit) for `question`; the embedding is None when the cache is off.
+    """
+    from app.rag import embed_question, loaded_index_version
+    from app.semantic_cache import SEMANTIC_CACHE_ENABLED, semantic_cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return None, None
+    # embedding may be a network call: keep it off the event loop
+    question_emb = await asyncio.to_thread(embed_question, question)
+    hit = semantic_cache.lookup(question_emb, loaded_index_version())
+    if hit:
+        logger.info("Semantic cache hit (%.3f) for question: %s", hit["similarity"], clip(hit["question"]))
+    return question_emb, hit
+
+async def clinical_handle_query(session: Dict[str, Any], question: str) -> Dict[str, Any]:
+    logger.info("Clinical agent handling question: %s", clip(question))
+    web_task = None
     try:
-        # use .invoke if chain supports it
-        result = qa.invoke({"query": question}) if hasattr(qa, "invoke") else qa({"query": question})
+        plan = plan_clinical_query(question)
+        logger.info("Clinical plan: %s", plan)
+        if plan == "web":
+            return {"answer": None, "sources": [], "web": True, "web_results": await _web_only(question)}
+
+        # first call imports langchain and loads the index and models: keep it off the event loop
+        qa = await asyncio.to_thread(load_clinical_stack)
+        from app.rag import loaded_index_version, span_callbacks
+        from app.semantic_cache import semantic_cache
+
+        # near-duplicate questions reuse an earlier answer from the same index version
+        question_emb, hit = await _semantic_lookup(question)
+        if hit:
+            return {"answer": hit["answer"], "sources": hit["sources"], "web": False, "cached": True}
+
+        web_task = _start_speculative_web_search(question)
+        try:
+            with span("rag.qa"):
+                result = await asyncio.wait_for(qa.ainvoke({"query": question}, config={"callbacks": span_callbacks}),
+                                                CLINICAL_RAG_DEADLINE_S)
+        except asyncio.TimeoutError:
+            logger.warning("RAG missed its %.1fs deadline; answering from web search", CLINICAL_RAG_DEADLINE_S)
+            return {"answer": None, "sources": [], "web": True, "web_results": await _web_results(web_task, question)}
         answer_text = result.get("result") or result.get("answer") or ""
-        src_docs = result.get("source_documents", [])
-        citations = []
-        for i, doc in enumerate(src_docs, start=1):
-            excerpt = (doc.page_content[:300]).replace("\n", " ")
-            citations.append({"ref": f"ref#{i}", "excerpt": excerpt})
-
-        # If the user explicitly asked for 'latest' or 'research' OR RAG did not find anything,
-        # perform a DuckDuckGo search as fallback.
-        question_l = question.lower()
-        wants_latest = any(k in question_l for k in ["latest", "recent", "research", "study", "studies", "trial", "evidence"])
-        if wants_latest or not answer_text.strip() or "not found in reference" in answer_text.lower():
-            web_results = web_search_combined(question)
+        citations = _citations(result.get("source_documents", []))
+
+        # RAG did not find anything: use the web search
+        if _needs_web(answer_text):
+            web_results = await _web_results(web_task, question)
             return {"answer": None, "sources": citations, "web": True, "web_results": web_results}
 
+        if question_emb is not None:
+            semantic_cache.store(question, question_emb, answer_text, citations, loaded_index_version())
         return {"answer": answer_text, "sources": citations, "web": False}
     except Exception as e:
         logger.exception("Clinical agent error: %s", e)
         return {"answer": None, "error": str(e)}
+    finally:
+        _cancel(web_task)
+
+async def clinical_stream_query(session: Dict[str, Any], question: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming clinical_handle_query. Yields events:
+        {"type": "token", "text": ...}                       answer text as the LLM generates it
+        {"type": "done", "answer", "sources", "web", ...}    final result, same shape as clinical_handle_query
+        {"type": "error", "error": ...}
+    """
+    logger.info("Clinical agent streaming question: %s", clip(question))
+    web_task = None
+    try:
+        plan = plan_clinical_query(question)
+        logger.info("Clinical plan: %s", plan)
+        if plan == "web":
+            yield {"type": "done", "answer": None, "sources": [], "web": True, "web_results": await _web_only(question)}
+            return
+        await asyncio.to_thread(load_clinical_stack)
+        from app.rag import aretrieve, astream_answer, loaded_index_version
+        from app.semantic_cache import semantic_cache
+
+        question_emb, hit = await _semantic_lookup(question)
+        if hit:
+            yield {"type": "token", "text": hit["answer"]}
+            yield {"type": "done", "answer": hit["answer"], "sources": hit["sources"], "web": False, "cached": True}
+            return
+
+        web_task = _start_speculative_web_search(question)
+        # streamed tokens can't be taken back, so the deadline covers retrieval only
+        try:
+            docs = await asyncio.wait_for(aretrieve(question), CLINICAL_RAG_DEADLINE_S)
+        except asyncio.TimeoutError:
+            logger.warning("Retrieval missed its %.1fs deadline; answering from web search", CLINICAL_RAG_DEADLINE_S)
+            web_results = await _web_results(web_task, question)
+            yield {"type": "done", "answer": None, "sources": [], "web": True, "web_results": web_results}
+            return
+        citations = _citations(docs)
+        parts = []
+        async for token in astream_answer(question, docs):
+            parts.append(token)
+            yield {"type": "token", "text": token}
+        answer_text = "".join(parts)
+
+        if _needs_web(answer_text):
+            web_results = await _web_results(web_task, question)
+            # the streamed "not found" text was shown as it came; the result itself has no answer
+            yield {"type": "done", "answer": None, "sources": citations, "web": True, "web_results": web_results}
+            return
+        if question_emb is not None:
+            semantic_cache.store(question, question_emb, answer_text, citations, loaded_index_version())
+        yield {"type": "done", "answer": answer_text, "sources": citations, "web": False}
+    except Exception as e:
+        logger.exception("Clinical agent error: %s", e)
+        yield {"type": "error", "error": str(e)}
+    finally:
+        _cancel(web_task)
 
 def web_search_placeholder(query: str):
     """
@@ -0,0 +1,107 @@
+"""
+Approximate-nearest-neighbour FAISS index construction and query-time tuning.
+
+FAISS_INDEX_TYPE selects the index published by index_builder:
+    flat      exact search (IndexFlatL2, what FAISS.from_texts builds)
+    ivf_flat  inverted lists over k-means cells, full vectors   (tune FAISS_NPROBE)
+    hnsw      HNSW graph over full vectors                      (tune FAISS_EF_SEARCH)
+    ivf_pq    inverted lists + product-quantized codes; smallest memory (tune FAISS_NPROBE)
+
+IVF/PQ quantizers are trained on a random sample of at most FAISS_TRAIN_SAMPLE vectors.
+Query-time knobs are read from the environment by rag.load_vectorstore.
+"""
+import os
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from app.logger_conf import logger
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))  # 0 = ~4*sqrt(n)
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "0"))  # 0 = pick a sub-quantizer count that divides dim
+FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "100000"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "0"))  # 0 = leave index default
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "0"))
+
+
+def _nlist(n: int) -> int:
+    if FAISS_NLIST:
+        return FAISS_NLIST
+    # ~4*sqrt(n) cells, but keep >= 39 training points per centroid (FAISS warns below that)
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+
+def _pq_m(dim: int) -> int:
+    if FAISS_PQ_M:
+        return FAISS_PQ_M
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dim % m == 0 and dim // m >= 4:
+            return m
+    return 1
+
+
+def factory_string(kind: str, dim: int, n: int) -> str:
+    if kind == "flat":
+        return "Flat"
+    if kind == "ivf_flat":
+        return f"IVF{_nlist(n)},Flat"
+    if kind == "hnsw":
+        return f"HNSW{FAISS_HNSW_M}"
+    if kind == "ivf_pq":
+        return f"IVF{_nlist(n)},PQ{_pq_m(dim)}x8"
+    raise ValueError(f"Unknown FAISS index type '{kind}'. Choose one of: {', '.join(INDEX_TYPES)}")
+
+
+def make_index(kind: str, vectors: np.ndarray, seed: int = 1234) -> faiss.Index:
+    """
+    Build a `kind` index over `vectors` (n x dim float32, row order = FAISS ids), training
+    on a sample when the index type needs it.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    spec = factory_string(kind, dim, n)
+    index = faiss.index_factory(dim, spec)
+    if kind == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = vectors if n <= FAISS_TRAIN_SAMPLE else vectors[rng.choice(n, FAISS_TRAIN_SAMPLE, replace=False)]
+        logger.info("Training %s index on %d of %d vectors", spec, len(sample), n)
+        index.train(sample)
+    index.add(vectors)
+    logger.info("Built %s index with %d vectors", spec, index.ntotal)
+    return index
+
+
+def is_flat(index: faiss.Index) -> bool:
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlat)
+
+
+def apply_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """
+    Set nprobe (IVF) / efSearch (HNSW) on `index`, defaulting to FAISS_NPROBE / FAISS_EF_SEARCH.
+    Parameters that don't apply to the index type are ignored.
+    """
+    nprobe = FAISS_NPROBE if nprobe is None else nprobe
+    ef_search = FAISS_EF_SEARCH if ef_search is None else ef_search
+    if nprobe:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+            logger.info("FAISS nprobe=%d", nprobe)
+        except RuntimeError:
+            pass
+    if ef_search:
+        hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+        if hnsw is not None:
+            hnsw.efSearch = ef_search
+            logger.info("FAISS efSearch=%d", ef_search)
+
+
+def index_nbytes(index: faiss.Index) -> int:
+    """Serialized size of the index, a close proxy for its resident memory."""
+    return int(faiss.serialize_index(index).nbytes)
@@ -0,0 +1,104 @@
+"""
+Sparse BM25 retrieval over the chunk store.
+
+index_builder adds an FTS5 table `chunks_fts` (external content over `chunks`, rowid =
+FAISS position) to every published chunks.sqlite; SQLite's inverted index and built-in
+bm25() ranking then serve keyword queries. This catches exact drug names and lab terms
+("dapagliflozin", "eGFR") that dense embeddings tend to blur.
+"""
+import os
+import re
+import sqlite3
+from typing import List, Tuple
+
+from app.db_pool import SharedReader
+from app.logger_conf import logger
+
+FTS_TABLE = "chunks_fts"
+BM25_MAX_TERMS = int(os.getenv("BM25_MAX_TERMS", "16"))
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+(?:[-'][0-9a-z]+)*")
+# dropped from queries only (the index keeps them); they add postings, not signal
+_STOPWORDS = frozenset(
+    "a an and are as at be been but by can could do does did for from had has have how i if in into is it its "
+    "me my of on or our should so than that the their them then there these they this to was we were what when "
+    "where which who why will with would you your".split()
+)
+
+
+def build_bm25_index(chunk_store_path: str) -> bool:
+    """
+    Add the chunks_fts table to a freshly written chunks.sqlite. Returns False (and the
+    index is served dense-only) when SQLite lacks FTS5.
+    """
+    conn = sqlite3.connect(chunk_store_path)
+    try:
+        conn.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            "text, content='chunks', content_rowid='pos', tokenize='unicode61 remove_diacritics 2')"
+        )
+        conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        logger.warning("FTS5 unavailable, BM25 index not built: %s", e)
+        return False
+    finally:
+        conn.close()
+    logger.info("Built BM25 index in %s", chunk_store_path)
+    return True
+
+
+def fts_query(text: str) -> str:
+    """
+    Turn free text into an FTS5 OR-query of quoted terms (quoting keeps user input from
+    being parsed as FTS syntax). Empty string when nothing searchable is left.
+    """
+    terms = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        if tok in _STOPWORDS or tok in terms:
+            continue
+        terms.append(tok)
+        if len(terms) >= BM25_MAX_TERMS:
+            break
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+class BM25Index:
+    """
+    Read side of chunks_fts; search() returns (FAISS position, score) best first. Like
+    SQLiteDocstore it opens the file up front, so serving survives the version being pruned.
+    """
+
+    def __init__(self, chunk_store_path: str):
+        self.path = chunk_store_path
+        self._reader = SharedReader(chunk_store_path) if os.path.exists(chunk_store_path) else None
+
+    @property
+    def available(self) -> bool:
+        if self._reader is None:
+            return False
+        return self._reader.fetchone("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)) is not None
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        match = fts_query(query)
+        if not match:
+            return []
+        # bm25() is lower-is-better; negate so larger scores rank first
+        rows = self._reader.fetchall(
+            f"SELECT rowid, -bm25({FTS_TABLE}) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? ORDER BY rank LIMIT ?",
+            (match, k),
+        )
+        return [(int(pos), float(score)) for pos, score in rows]
+
+
+if __name__ == "__main__":
+    # backfill the BM25 table into an index published before it existed
+    import argparse
+    from app.corpus import resolve_index_dir
+    from app.mmap_store import CHUNK_STORE_FILE
+    ap = argparse.ArgumentParser(description="Add the BM25 table to an existing index version.")
+    ap.add_argument("index_dir", nargs="?", default=None, help="index version dir (default: live version)")
+    args = ap.parse_args()
+    index_dir = args.index_dir or resolve_index_dir(os.getenv("FAISS_INDEX_PATH", "./data/faiss_index"))
+    build_bm25_index(os.path.join(index_dir, CHUNK_STORE_FILE))
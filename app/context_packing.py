@@ -0,0 +1,241 @@
+"""
+Context packing for the "stuff" prompt: the retriever hands over more candidates than
+the prompt needs and pack() turns them into a smaller context.
+
+    dedupe   drop chunks whose text is already contained in another candidate
+    merge    join chunks of the same page that overlap (the splitter's chunk_overlap),
+             so the shared ~100 characters are sent once
+    mmr      greedy maximal marginal relevance: relevance from the retriever's rank,
+             redundancy as word-set Jaccard similarity to the chunks already picked
+    budget   stop at CONTEXT_TOKEN_BUDGET tokens; the chunk that crosses the budget is
+             cut to fit if at least CONTEXT_MIN_TAIL_TOKENS remain. Unset, the budget is
+             the size of the unpacked context (the first RETRIEVAL_K candidates), so the
+             prompt is never smaller than what the chain sent before packing
+
+Tokens are counted with tiktoken (CONTEXT_TOKENIZER) once load_tokenizer() has loaded it,
+which the startup warm-up does, otherwise estimated as 4 characters per token. Requests
+never load it: tiktoken downloads its BPE file on first use. The file is read from
+TIKTOKEN_CACHE_DIR (default data/tiktoken_cache, filled by scripts/fetch_tokenizer.py),
+so deploys without network access can ship it. Token counts before (the first RETRIEVAL_K
+candidates, what the chain sent before) and after packing go to
+postdischarge_context_tokens_total in /metrics.
+"""
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.logger_conf import logger
+from app.metrics import counter, record_span
+from app.retrieval import RETRIEVAL_K
+
+CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "1") != "0"
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "8"))
+# None = the token count of the unpacked context; 0 = no budget
+CONTEXT_TOKEN_BUDGET = int(os.environ["CONTEXT_TOKEN_BUDGET"]) if os.getenv("CONTEXT_TOKEN_BUDGET") else None
+CONTEXT_MIN_TAIL_TOKENS = int(os.getenv("CONTEXT_MIN_TAIL_TOKENS", "64"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_MIN_OVERLAP = int(os.getenv("CONTEXT_MIN_OVERLAP", "20"))  # chars for two chunks to count as adjacent
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")
+TOKENIZER_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data",
+                                   "tiktoken_cache")
+SEPARATOR = "\n\n"  # how the "stuff" chain joins documents
+
+CONTEXT_TOKENS = counter("postdischarge_context_tokens", "Prompt context tokens before and after packing", ("stage",))
+
+_WORD_RE = re.compile(r"\w+")
+
+
+_enc = None
+_enc_lock = threading.Lock()
+_enc_tried = False
+
+
+def load_tokenizer():
+    """
+    Load the CONTEXT_TOKENIZER encoding (once; called by the warm-up). Returns None when
+    tiktoken or its BPE file is unavailable, and counting stays on the estimate.
+    """
+    global _enc, _enc_tried
+    with _enc_lock:
+        if not _enc_tried:
+            _enc_tried = True
+            os.environ.setdefault("TIKTOKEN_CACHE_DIR", TOKENIZER_CACHE_DIR)
+            try:
+                import tiktoken
+                _enc = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+            except Exception as e:
+                logger.warning("tiktoken encoding %s unavailable, estimating 4 chars per token: %s",
+                               CONTEXT_TOKENIZER, e)
+    return _enc
+
+
+def _encoding():
+    # never loads: the first load may download the BPE file
+    return _enc
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    enc = _encoding()
+    if enc is not None:
+        ids = enc.encode(text, disallowed_special=())
+        return text if len(ids) <= max_tokens else enc.decode(ids[:max_tokens])
+    limit = max_tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > limit // 2 else limit]
+
+
+def _page_key(doc: Document) -> Optional[Tuple[Any, Any]]:
+    meta = doc.metadata or {}
+    if meta.get("source") is None or meta.get("page") is None:
+        return None
+    return meta["source"], meta["page"]
+
+
+def _overlap(a: str, b: str, min_chars: int) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b` (0 if below min_chars)."""
+    longest = min(len(a), len(b))
+    start = a.find(b[:min_chars], len(a) - longest)
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(b[:min_chars], start + 1)
+    return 0
+
+
+def _merged(first: Document, second: Document, overlap: int) -> Document:
+    meta = dict(first.metadata or {})
+    ids = meta.get("chunk_ids") or [meta.get("chunk_id")]
+    meta["chunk_ids"] = ids + ((second.metadata or {}).get("chunk_ids") or [(second.metadata or {}).get("chunk_id")])
+    return Document(page_content=first.page_content + second.page_content[overlap:], metadata=meta)
+
+
+def dedupe_and_merge(docs: Sequence[Document], min_overlap: int = CONTEXT_MIN_OVERLAP) -> List[Document]:
+    """
+    Best-first candidates with duplicates removed and overlapping same-page chunks joined.
+    A surviving or merged chunk keeps the rank of its best-ranked part.
+    """
+    ranked: List[Tuple[int, Document]] = []
+    for rank, doc in enumerate(docs):
+        text = doc.page_content.strip()
+        if not text or any(text in kept.page_content for _, kept in ranked):
+            continue
+        swallowed = [r for r, kept in ranked if kept.page_content.strip() in text]
+        ranked = [(r, kept) for r, kept in ranked if r not in swallowed]
+        ranked.append((min(swallowed + [rank]), doc))
+
+    merged = True
+    while merged:
+        merged = False
+        for i, (rank_a, a) in enumerate(ranked):
+            key = _page_key(a)
+            for j, (rank_b, b) in enumerate(ranked):
+                if i == j or key is None or _page_key(b) != key:
+                    continue
+                n = _overlap(a.page_content, b.page_content, min_overlap)
+                if n:
+                    ranked = [item for k, item in enumerate(ranked) if k not in (i, j)]
+                    ranked.append((min(rank_a, rank_b), _merged(a, b, n)))
+                    merged = True
+                    break
+            if merged:
+                break
+    return [doc for _, doc in sorted(ranked, key=lambda item: item[0])]
+
+
+def _words(text: str) -> frozenset:
+    return frozenset(w.lower() for w in _WORD_RE.findall(text))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def mmr_select(docs: Sequence[Document], budget: int = 0, max_chunks: int = RETRIEVAL_K,
+               lambda_: float = CONTEXT_MMR_LAMBDA, min_tail: int = CONTEXT_MIN_TAIL_TOKENS) -> List[Document]:
+    """
+    Pick up to `max_chunks` of the best-first `docs` by maximal marginal relevance within
+    `budget` tokens (0 = no budget).
+    """
+    n = len(docs)
+    candidates = [(1.0 - i / n, doc, _words(doc.page_content), count_tokens(doc.page_content))
+                  for i, doc in enumerate(docs)]
+    picked: List[Document] = []
+    picked_words: List[frozenset] = []
+    remaining = budget if budget > 0 else None
+    while candidates and len(picked) < max_chunks:
+        best = max(range(len(candidates)), key=lambda c: lambda_ * candidates[c][0] - (1 - lambda_) * max(
+            (_jaccard(candidates[c][2], w) for w in picked_words), default=0.0))
+        _, doc, words, tokens = candidates.pop(best)
+        if remaining is None or tokens <= remaining:
+            picked.append(doc)
+            picked_words.append(words)
+            if remaining is not None:
+                remaining -= tokens
+        elif remaining >= min_tail:
+            picked.append(Document(page_content=truncate_tokens(doc.page_content, remaining),
+                                   metadata={**(doc.metadata or {}), "truncated": True}))
+            break
+        # otherwise keep looking for a smaller chunk that still fits
+    return picked
+
+
+def pack(docs: Sequence[Document], budget: Optional[int] = CONTEXT_TOKEN_BUDGET, max_chunks: int = RETRIEVAL_K,
+         lambda_: float = CONTEXT_MMR_LAMBDA) -> Tuple[List[Document], Dict[str, int]]:
+    """
+    Packed context documents for best-first retriever candidates, and token counts of the
+    unpacked context (first `max_chunks` candidates as they come) vs the packed one.
+    `budget` None packs into the unpacked context's size.
+    """
+    raw_tokens = count_tokens(SEPARATOR.join(d.page_content for d in docs[:max_chunks]))
+    packed = mmr_select(dedupe_and_merge(docs), raw_tokens if budget is None else budget, max_chunks, lambda_)
+    stats = {
+        "candidates": len(docs),
+        "chunks": len(packed),
+        "raw_tokens": raw_tokens,
+        "packed_tokens": count_tokens(SEPARATOR.join(d.page_content for d in packed)),
+    }
+    return packed, stats
+
+
+class PackingRetriever(BaseRetriever):
+    """
+    Wraps the chain's retriever (asked for CONTEXT_CANDIDATES documents) and returns the
+    packed documents, so the "stuff" chain and the streaming path send the same context.
+    """
+    base: Any
+    budget: Optional[int] = CONTEXT_TOKEN_BUDGET
+    max_chunks: int = RETRIEVAL_K
+    lambda_: float = CONTEXT_MMR_LAMBDA
+
+    def _pack(self, query: str, docs: List[Document]) -> List[Document]:
+        t0 = time.perf_counter()
+        packed, stats = pack(docs, self.budget, self.max_chunks, self.lambda_)
+        record_span("rag.pack", time.perf_counter() - t0)
+        CONTEXT_TOKENS.inc("raw", amount=stats["raw_tokens"])
+        CONTEXT_TOKENS.inc("packed", amount=stats["packed_tokens"])
+        logger.debug("Context packing for %r: %s", query, stats)
+        return packed
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._pack(query, self.base.invoke(query))
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        return self._pack(query, await self.base.ainvoke(query))
@@ -0,0 +1,150 @@
+"""
+Corpus manifest and versioned, atomically published FAISS index directories.
+
+Layout under FAISS_INDEX_PATH:
+
+    CURRENT              -> name of the live version, e.g. "v00004"
+    v00004/index.faiss   (plus index.pkl, manifest.json, ...)
+    v00003/...           previous version, kept for readers still loading it
+
+A new index is written to a hidden temp dir, renamed into place, and only then is
+CURRENT swapped with os.replace(), so a concurrent load never sees a partial index.
+Older layouts with index.faiss directly in FAISS_INDEX_PATH are still readable.
+
+The manifest records, per document, the file hash and for every page its text hash
+and the ids of the chunks it produced, which is what lets incremental builds add,
+replace and delete chunks page by page.
+"""
+import glob
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from app.logger_conf import logger
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "2"))
+
+
+def corpus_paths(default_pdf: str) -> List[str]:
+    """
+    Documents to index: CORPUS_PATHS (os.pathsep-separated files or directories of PDFs),
+    falling back to the single NEPHRO_PDF_PATH document.
+    """
+    raw = os.getenv("CORPUS_PATHS")
+    entries = [p for p in raw.split(os.pathsep) if p.strip()] if raw else [default_pdf]
+    paths = []
+    for entry in entries:
+        if os.path.isdir(entry):
+            paths.extend(sorted(glob.glob(os.path.join(entry, "**", "*.pdf"), recursive=True)))
+        else:
+            paths.append(entry)
+    return paths
+
+
+def doc_key(path: str) -> str:
+    # the resolved path, not the file name: same-named documents in different folders are distinct
+    return os.path.normcase(os.path.realpath(path))
+
+
+def rekey_manifest(manifest: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Move documents recorded under an older key (manifests used to key on the file name)
+    to doc_key(path). Returns {old key: new key} for the documents moved.
+    """
+    docs = manifest["documents"]
+    moved = {}
+    for key, entry in list(docs.items()):
+        new = doc_key(entry["path"]) if entry.get("path") else key
+        if new != key and new not in docs:
+            docs[new] = docs.pop(key)
+            moved[key] = new
+    return moved
+
+
+def page_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def new_manifest(chunker: Dict[str, Any]) -> Dict[str, Any]:
+    return {"version": 0, "chunker": chunker, "documents": {}}
+
+
+def resolve_index_dir(root: str) -> str:
+    """
+    Directory holding the live index: the version named in CURRENT, else `root` itself (legacy layout).
+    """
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        if name:
+            return os.path.join(root, name)
+    except FileNotFoundError:
+        pass
+    return root
+
+
+def index_version(root: str) -> str:
+    """
+    Opaque identifier of the live index; changes whenever a new index is published.
+    """
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        legacy = os.path.join(root, "index.faiss")
+        return f"legacy-{int(os.path.getmtime(legacy))}" if os.path.exists(legacy) else "none"
+
+
+def load_manifest(index_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _existing_versions(root: str) -> List[int]:
+    out = []
+    for name in os.listdir(root):
+        if name.startswith("v") and name[1:].isdigit() and os.path.isdir(os.path.join(root, name)):
+            out.append(int(name[1:]))
+    return sorted(out)
+
+
+def publish_index(root: str, save: Callable[[str], None], manifest: Dict[str, Any]) -> str:
+    """
+    Write a new index version with `save(dir)` plus the manifest, then atomically make it live.
+    Returns the new version directory.
+    """
+    os.makedirs(root, exist_ok=True)
+    versions = _existing_versions(root)
+    version = (versions[-1] if versions else 0) + 1
+    name = f"v{version:05d}"
+    tmp = os.path.join(root, f".{name}.tmp")
+    final = os.path.join(root, name)
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    save(tmp)
+    manifest["version"] = version
+    manifest["created_at"] = datetime.now(timezone.utc).isoformat()
+    with open(os.path.join(tmp, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, final)
+
+    pointer_tmp = os.path.join(root, f".{CURRENT_FILE}.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(root, CURRENT_FILE))
+    logger.info("Published index version %s at %s", name, final)
+
+    for old in _existing_versions(root)[:-INDEX_KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(root, f"v{old:05d}"), ignore_errors=True)
+    return final
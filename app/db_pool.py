@@ -0,0 +1,135 @@
+"""
+Shared SQLite connection manager.
+
+Every thread gets one long-lived connection per database file, opened lazily on
+first use (SharedReader instead opens one read-only connection up front and shares
+it). Connections run in WAL mode with pragmas tuned for a read-heavy lookup workload
+and keep a large statement cache, so the fixed SQL used by the lookup helpers is
+compiled once per connection instead of once per call.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+from app.logger_conf import logger
+
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "16384"))
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(64 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_lock = threading.Lock()
+# (thread ident, abs path, readonly) -> connection, so close_all() can reach every thread's handle
+_registry: Dict[Tuple[int, str, bool], sqlite3.Connection] = {}
+_generation = 0
+
+
+def _configure(conn: sqlite3.Connection, readonly: bool):
+    if not readonly:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def _prune_dead_threads():
+    # connections owned by threads that have exited would otherwise stay open forever
+    alive = {t.ident for t in threading.enumerate()}
+    for key in [k for k in _registry if k[0] not in alive]:
+        try:
+            _registry.pop(key).close()
+        except Exception:
+            pass
+
+
+def _open(path: str, readonly: bool) -> sqlite3.Connection:
+    if readonly:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True,
+                               cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    else:
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        conn = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    _configure(conn, readonly)
+    return conn
+
+
+def get_connection(path: str, readonly: bool = False) -> sqlite3.Connection:
+    """
+    Return this thread's connection to `path`, opening and configuring it on first use.
+    Callers must not close the returned connection; use close_all() instead.
+    """
+    if getattr(_local, "generation", None) != _generation:
+        _local.conns = {}
+        _local.generation = _generation
+    abspath = os.path.abspath(path)
+    key = (abspath, readonly)
+    conn = _local.conns.get(key)
+    if conn is None:
+        conn = _open(abspath, readonly)
+        _local.conns[key] = conn
+        with _lock:
+            _prune_dead_threads()
+            _registry[(threading.get_ident(), abspath, readonly)] = conn
+        logger.debug("Opened SQLite connection to %s (readonly=%s)", abspath, readonly)
+    return conn
+
+
+@contextmanager
+def transaction(path: str) -> Iterator[sqlite3.Connection]:
+    """
+    Yield the pooled connection for `path` and commit on success / roll back on error.
+    """
+    conn = get_connection(path)
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def close_all():
+    """
+    Close every pooled connection (all threads). Threads transparently reopen on next use.
+    """
+    global _generation
+    with _lock:
+        _generation += 1
+        for conn in _registry.values():
+            try:
+                conn.close()
+            except Exception:
+                pass
+        _registry.clear()
+
+
+class SharedReader:
+    """
+    One read-only connection opened now and shared by all threads (a lock serializes
+    them), for files that may be deleted while in use, like a pruned index version: the
+    open handle keeps reading the deleted file, where a thread opening it later would fail.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        self._conn = _open(self.path, readonly=True)
+
+    def fetchall(self, sql: str, params: Tuple[Any, ...] = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def fetchone(self, sql: str, params: Tuple[Any, ...] = ()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
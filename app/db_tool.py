@@ -1,59 +1,283 @@
-import sqlite3
 import json
 import os
+import sqlite3
+import threading
 from typing import Optional, Dict, Any, List
+from app.cache import TTLCache
+from app.db_pool import get_connection, transaction
 from app.logger_conf import logger
+from app.metrics import timed
+from app.name_index import patient_name_index
 
 DB_PATH = os.getenv("SQLITE_DB_PATH", "../data/patients.db")
+PATIENT_CACHE_SIZE = int(os.getenv("PATIENT_CACHE_SIZE", "1024"))
+PATIENT_CACHE_TTL_S = float(os.getenv("PATIENT_CACHE_TTL_S", "300"))
 
-def init_db(json_path: str = "../data/patients.json"):
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
+# decoded patient records keyed by id; entries carry the row version so updates invalidate them
+patient_cache = TTLCache(maxsize=PATIENT_CACHE_SIZE, ttl=PATIENT_CACHE_TTL_S)
+
+# fixed SQL strings so the per-connection statement cache can reuse the compiled statements
+# lookups only read (id, name, version); `data` is fetched and decoded for cache misses only
+_SQL_EXACT = "SELECT id, patient_name, version FROM patients WHERE name_norm = ?"
+_SQL_FTS = """
+SELECT p.id, p.patient_name, p.version FROM patients_fts f JOIN patients p ON p.id = f.rowid
+WHERE patients_fts MATCH ? ORDER BY f.rank
+"""
+# trigram FTS needs at least 3 characters; shorter fragments (or builds without FTS5) scan instead
+_SQL_LIKE = "SELECT id, patient_name, version FROM patients WHERE name_norm LIKE ?"
+
+_FTS_DDL = [
+    """CREATE VIRTUAL TABLE patients_fts USING fts5(
+        patient_name, content='patients', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN
+        INSERT INTO patients_fts(rowid, patient_name) VALUES (new.id, new.patient_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN
+        INSERT INTO patients_fts(patients_fts, rowid, patient_name) VALUES ('delete', old.id, old.patient_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE OF patient_name ON patients BEGIN
+        INSERT INTO patients_fts(patients_fts, rowid, patient_name) VALUES ('delete', old.id, old.patient_name);
+        INSERT INTO patients_fts(rowid, patient_name) VALUES (new.id, new.patient_name);
+    END""",
+]
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+_fts_available = False
+
+def normalize_name(name: Optional[str]) -> str:
+    """Lower-case and collapse whitespace; the form stored in patients.name_norm."""
+    return " ".join((name or "").lower().split())
+
+# fields that identify a patient record in the source system, in order of preference
+RECORD_ID_FIELDS = ("patient_id", "mrn", "id")
+
+def record_key(record: Dict[str, Any]) -> Optional[str]:
+    """
+    Idempotency key of a source record (patients.record_key): its source identifier, or
+    None when it has none. Names are not unique, so never the name.
+    """
+    for field in RECORD_ID_FIELDS:
+        if record.get(field) not in (None, ""):
+            return f"{field}:{record[field]}"
+    return None
+
+def ensure_schema(conn: sqlite3.Connection):
+    """
+    Create the patients table, its normalized-name index and the trigram FTS5 table
+    (plus sync triggers), migrating DBs created before these existed.
+    """
+    global _fts_available
+    conn.execute("""
     CREATE TABLE IF NOT EXISTS patients (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         patient_name TEXT,
-        data JSON
+        data JSON,
+        name_norm TEXT,
+        version INTEGER NOT NULL DEFAULT 0
     )
     """)
-    conn.commit()
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(patients)")]
+    if "name_norm" not in cols:
+        logger.info("Migrating patients table: adding name_norm column")
+        conn.execute("ALTER TABLE patients ADD COLUMN name_norm TEXT")
+    if "version" not in cols:
+        conn.execute("ALTER TABLE patients ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    rows = conn.execute("SELECT id, patient_name FROM patients WHERE name_norm IS NULL").fetchall()
+    if rows:
+        conn.executemany("UPDATE patients SET name_norm = ? WHERE id = ?",
+                         [(normalize_name(name), pid) for pid, name in rows])
+    if "record_key" not in cols:
+        logger.info("Migrating patients table: adding record_key column")
+        conn.execute("ALTER TABLE patients ADD COLUMN record_key TEXT")
+    # name_norm was unique in earlier versions; several patients can share a name
+    conn.execute("DROP INDEX IF EXISTS uq_patients_name_norm")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_patients_name_norm ON patients(name_norm)")
+    # earlier versions re-inserted the seed file on every startup; exact copies (same name and
+    # data) carry nothing the first one doesn't, so only those are removed
+    dupes = conn.execute("""
+    DELETE FROM patients WHERE id NOT IN (SELECT MIN(id) FROM patients GROUP BY patient_name, data)
+    """).rowcount
+    if dupes:
+        logger.info("Removed %d duplicate patient rows left by earlier imports", dupes)
+    # content-hash keys from an earlier version don't survive an edit of the record
+    conn.execute("UPDATE patients SET record_key = NULL WHERE record_key LIKE 'sha256:%'")
+    rows = conn.execute("SELECT id, data FROM patients WHERE record_key IS NULL ORDER BY id").fetchall()
+    if rows:
+        # rows without a source id keep a NULL key until an import with their id adopts them (app.ingest)
+        taken = {k for (k,) in conn.execute("SELECT record_key FROM patients WHERE record_key IS NOT NULL")}
+        keyed = []
+        for pid, data in rows:
+            try:
+                key = record_key(json.loads(data)) if data else None
+            except (TypeError, ValueError, AttributeError):
+                key = None
+            if key is not None and key not in taken:
+                taken.add(key)
+                keyed.append((key, pid))
+        conn.executemany("UPDATE patients SET record_key = ? WHERE id = ?", keyed)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_patients_record_key ON patients(record_key)")
+    # name_norm is set in Python by every app write path (app.ingest), so it always matches
+    # normalize_name(). Earlier versions filled it in with triggers: drop them, and re-normalize
+    # what they stored (lower(trim()) kept runs of inner whitespace). Other clients writing
+    # patients must set name_norm; rows they insert without it are filled in by the NULL
+    # backfill above on the next startup.
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'patients_name_norm_ai'").fetchone():
+        fixed = [(normalize_name(name), pid) for pid, name, norm in
+                 conn.execute("SELECT id, patient_name, name_norm FROM patients") if norm != normalize_name(name)]
+        conn.executemany("UPDATE patients SET name_norm = ? WHERE id = ?", fixed)
+        if fixed:
+            logger.info("Re-normalized %d patient names stored by the old name_norm trigger", len(fixed))
+        conn.execute("DROP TRIGGER IF EXISTS patients_name_norm_ai")
+        conn.execute("DROP TRIGGER IF EXISTS patients_name_norm_au")
+    # inserts, renames and deletes, replayed by NameIndex.sync to keep the fuzzy name index current
+    conn.execute("CREATE TABLE IF NOT EXISTS patient_name_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, id INTEGER NOT NULL)")
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS patients_changes_ai AFTER INSERT ON patients BEGIN
+        INSERT INTO patient_name_changes (id) VALUES (new.id);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS patients_changes_au AFTER UPDATE OF patient_name ON patients
+    WHEN new.patient_name IS NOT old.patient_name BEGIN
+        INSERT INTO patient_name_changes (id) VALUES (new.id);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS patients_changes_ad AFTER DELETE ON patients BEGIN
+        INSERT INTO patient_name_changes (id) VALUES (old.id);
+    END
+    """)
+    # cached patient dicts carry the name too, so a rename must also invalidate them
+    conn.execute("DROP TRIGGER IF EXISTS patients_version_au")
+    conn.execute("""
+    CREATE TRIGGER patients_version_au AFTER UPDATE OF data, patient_name ON patients BEGIN
+        UPDATE patients SET version = old.version + 1 WHERE id = new.id;
+    END
+    """)
+
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'patients_fts'").fetchone()
+    if exists:
+        _fts_available = True
+        return
+    try:
+        for ddl in _FTS_DDL:
+            conn.execute(ddl)
+        conn.execute("INSERT INTO patients_fts(patients_fts) VALUES ('rebuild')")
+        _fts_available = True
+        logger.info("Created trigram FTS index for patient names")
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5 / trigram tokenizer (< 3.34): keep the LIKE fallback
+        _fts_available = False
+        logger.warning("FTS5 trigram index unavailable, falling back to LIKE scans: %s", e)
+
+def _ensure_ready():
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            with transaction(DB_PATH) as conn:
+                ensure_schema(conn)
+            _schema_ready = True
+
+def init_db(json_path: str = "../data/patients.json"):
+    """
+    Create/migrate the schema and upsert patients from `json_path` (JSON array or JSONL).
+    The import is skipped when the file's content hash matches the last successful load.
+    """
+    global _schema_ready
+    from app.ingest import ingest_patients
+
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    with transaction(DB_PATH) as conn:
+        ensure_schema(conn)
+    _schema_ready = True
 
     # load JSON sample patients
     if os.path.exists(json_path):
-        with open(json_path, "r", encoding="utf-8") as f:
-            patients = json.load(f)
-        for p in patients:
-            try:
-                c.execute("INSERT INTO patients (patient_name, data) VALUES (?, ?)",
-                          (p.get("patient_name"), json.dumps(p)))
-            except Exception as e:
-                logger.exception("Error inserting patient: %s", e)
-        conn.commit()
-        logger.info("Loaded sample patients into DB.")
-    conn.close()
+        try:
+            ingest_patients(json_path, DB_PATH)
+        except Exception as e:
+            logger.exception("Error loading patients from %s: %s", json_path, e)
+
+    added = patient_name_index.sync(get_connection(DB_PATH))
+    logger.info("Name index updated with %d patients (%d total)", added, len(patient_name_index))
+
+def _search_rows(conn: sqlite3.Connection, name: str) -> List[tuple]:
+    norm = normalize_name(name)
+    rows = conn.execute(_SQL_EXACT, (norm,)).fetchall()
+    if rows or not norm:
+        return rows
+    # try fuzzy match substring
+    if _fts_available and len(norm) >= 3:
+        phrase = '"' + norm.replace('"', '""') + '"'
+        return conn.execute(_SQL_FTS, (phrase,)).fetchall()
+    return conn.execute(_SQL_LIKE, (f"%{norm}%",)).fetchall()
+
+def _materialize(conn: sqlite3.Connection, rows: List[tuple]) -> List[Dict[str, Any]]:
+    """
+    Turn (id, patient_name, version) rows into patient dicts, decoding `data` only for
+    ids that are not cached at that version. The returned dicts are shared; don't mutate.
+    """
+    out: List[Optional[Dict[str, Any]]] = []
+    missing = {}
+    for i, (pid, name, version) in enumerate(rows):
+        hit = patient_cache.get(pid, version=version)
+        out.append(hit)
+        if hit is None:
+            missing[pid] = (i, name, version)
+    if missing:
+        marks = ",".join("?" * len(missing))
+        for pid, data in conn.execute(f"SELECT id, data FROM patients WHERE id IN ({marks})", list(missing)):
+            i, name, version = missing[pid]
+            patient = {"id": pid, "patient_name": name, "data": json.loads(data)}
+            patient_cache.put(pid, patient, version=version)
+            out[i] = patient
+    return [p for p in out if p is not None]
+
+def get_patients_by_ids(ids: List[int]) -> List[Dict[str, Any]]:
+    """Fetch patients by id, preserving the order of `ids`."""
+    if not ids:
+        return []
+    conn = get_connection(DB_PATH)
+    marks = ",".join("?" * len(ids))
+    rows = conn.execute(f"SELECT id, patient_name, version FROM patients WHERE id IN ({marks})", list(ids)).fetchall()
+    by_id = {r[0]: r for r in rows}
+    return _materialize(conn, [by_id[i] for i in ids if i in by_id])
+
+def patient_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/eviction counters of the decoded-patient cache."""
+    return patient_cache.stats()
+
+@timed("db.suggest_patients")
+def suggest_patients_by_name(name: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Typo-tolerant fallback for lookup_patient_by_name: ranked patients whose names are
+    within a small edit distance of `name`, closest first.
+    """
+    try:
+        _ensure_ready()
+        # picks up patients added, renamed or deleted since the last call (one indexed range read)
+        patient_name_index.sync(get_connection(DB_PATH))
+        matches = patient_name_index.search(name, limit=limit)
+        results = get_patients_by_ids([pid for pid, _, _ in matches])
+        logger.info("Fuzzy name match for '%s' returned %d candidates", name, len(results))
+        return results
+    except Exception as e:
+        logger.exception("Fuzzy name match error: %s", e)
+        return []
 
+@timed("db.lookup_patient")
 def lookup_patient_by_name(name: str) -> List[Dict[str, Any]]:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
     try:
-        c.execute("SELECT id, patient_name, data FROM patients WHERE LOWER(patient_name) = ?", (name.lower(),))
-        rows = c.fetchall()
-        if not rows:
-            # try fuzzy match substring
-            c.execute("SELECT id, patient_name, data FROM patients WHERE LOWER(patient_name) LIKE ?", (f"%{name.lower()}%",))
-            rows = c.fetchall()
-        results = []
-        for r in rows:
-            results.append({
-                "id": r[0],
-                "patient_name": r[1],
-                "data": json.loads(r[2])
-            })
+        _ensure_ready()
+        conn = get_connection(DB_PATH)
+        rows = _search_rows(conn, name)
+        results = _materialize(conn, rows)
         logger.info("DB lookup for '%s' returned %d results", name, len(results))
         return results
     except Exception as e:
         logger.exception("DB lookup error: %s", e)
         return []
-    finally:
-        conn.close()
@@ -0,0 +1,151 @@
+"""
+Persistent, content-addressed embedding cache.
+
+Vectors are stored in SQLite keyed by (model key, sha256 of the text) as packed
+float32, so re-indexing only embeds chunks whose text (or embedding model/deployment)
+actually changed. Query embeddings are kept only in a bounded in-memory LRU with a TTL
+(EMBED_QUERY_CACHE_SIZE, EMBED_QUERY_CACHE_TTL_S): questions are unbounded and can hold
+patient details, so they are never written to disk.
+"""
+import hashlib
+import os
+import threading
+from array import array
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+from app.cache import TTLCache
+from app.db_pool import get_connection, transaction
+from app.logger_conf import logger
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "./data/embedding_cache.sqlite")
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") != "0"
+EMBED_QUERY_CACHE_SIZE = int(os.getenv("EMBED_QUERY_CACHE_SIZE", "1024"))
+EMBED_QUERY_CACHE_TTL_S = float(os.getenv("EMBED_QUERY_CACHE_TTL_S", "3600"))
+_IN_CHUNK = 500  # stay well below SQLite's bound-parameter limit
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def model_key(embeddings) -> str:
+    """
+    Identify the embedding model/deployment behind a LangChain embeddings object.
+    Vectors from different models must never be mixed, so this is part of every cache key.
+    """
+    for attr in ("deployment", "azure_deployment", "model_name", "model"):
+        value = getattr(embeddings, attr, None)
+        if value:
+            return f"{type(embeddings).__name__}:{value}"
+    return type(embeddings).__name__
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = EMBED_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    def _conn(self):
+        conn = get_connection(self.path)
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    conn.execute("""
+                    CREATE TABLE IF NOT EXISTS embeddings (
+                        model TEXT NOT NULL,
+                        text_sha256 BLOB NOT NULL,
+                        dim INTEGER NOT NULL,
+                        vector BLOB NOT NULL,
+                        PRIMARY KEY (model, text_sha256)
+                    ) WITHOUT ROWID
+                    """)
+                    # earlier versions also persisted query embeddings here
+                    dropped = conn.execute("DELETE FROM embeddings WHERE model LIKE '%:query'").rowcount
+                    conn.commit()
+                    if dropped:
+                        logger.info("Removed %d persisted query embeddings from %s", dropped, self.path)
+                    self._ready = True
+        return conn
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        hashes = [text_hash(t) for t in texts]
+        found = {}
+        conn = self._conn()
+        unique = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique), _IN_CHUNK):
+            part = unique[i:i + _IN_CHUNK]
+            marks = ",".join("?" * len(part))
+            for h, blob in conn.execute(
+                f"SELECT text_sha256, vector FROM embeddings WHERE model = ? AND text_sha256 IN ({marks})",
+                [model, *part],
+            ):
+                found[h] = array("f", blob).tolist()
+        out = [found.get(h) for h in hashes]
+        hit = sum(v is not None for v in out)
+        self.hits += hit
+        self.misses += len(out) - hit
+        return out
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        rows = [(model, text_hash(t), len(v), array("f", v).tobytes()) for t, v in zip(texts, vectors)]
+        self._conn()
+        with transaction(self.path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_sha256, dim, vector) VALUES (?, ?, ?, ?)", rows
+            )
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain Embeddings wrapper that consults an EmbeddingCache before calling the
+    wrapped model. `embed_fn` overrides how cache misses are embedded (e.g. through an
+    EmbeddingScheduler); it defaults to the wrapped model's embed_documents.
+    """
+
+    def __init__(self, inner: Embeddings, cache: Optional[EmbeddingCache] = None,
+                 embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None):
+        self.inner = inner
+        self.cache = cache or EmbeddingCache()
+        self.embed_fn = embed_fn or inner.embed_documents
+        self.model = model_key(inner)
+        self.embedded = 0  # texts actually sent to the model
+        # keyed by the text's hash so raw questions aren't kept around
+        self.query_cache = TTLCache(maxsize=EMBED_QUERY_CACHE_SIZE, ttl=EMBED_QUERY_CACHE_TTL_S)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(self.model, texts)
+        miss = [i for i, v in enumerate(vectors) if v is None]
+        if miss:
+            # embed each distinct missing text once
+            todo = list(dict.fromkeys(texts[i] for i in miss))
+            fresh = self.embed_fn(todo)
+            self.embedded += len(todo)
+            self.cache.put_many(self.model, todo, fresh)
+            by_text = dict(zip(todo, fresh))
+            for i in miss:
+                vectors[i] = by_text[texts[i]]
+        return vectors  # type: ignore[return-value]
+
+    def embed_query(self, text: str) -> List[float]:
+        # some models embed queries differently from documents, so queries get their own cache
+        key = text_hash(text)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            return cached
+        vector = self.inner.embed_query(text)
+        self.embedded += 1
+        self.query_cache.put(key, vector)
+        return vector
+
+
+def with_cache(embeddings: Embeddings, embed_fn=None) -> Embeddings:
+    """Wrap `embeddings` in a CachedEmbeddings unless EMBED_CACHE_ENABLED=0."""
+    if not EMBED_CACHE_ENABLED:
+        return embeddings
+    logger.info("Embedding cache enabled at %s", EMBED_CACHE_PATH)
+    return CachedEmbeddings(embeddings, embed_fn=embed_fn)
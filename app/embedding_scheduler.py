@@ -0,0 +1,156 @@
+"""
+Batched, concurrent embedding with client-side rate limiting.
+
+EmbeddingScheduler wraps any `embed_fn(list_of_texts) -> list_of_vectors` (an Azure
+OpenAIEmbeddings.embed_documents, a local sentence-transformers encode, or a raw HTTP
+call) and:
+  - groups texts into batches of `batch_size`,
+  - runs up to `max_concurrency` batches at once,
+  - paces requests and estimated tokens through token buckets so we stay under the
+    deployment's RPM/TPM quota instead of bouncing off 429s,
+  - retries failed batches with exponential backoff + jitter, honouring Retry-After,
+  - reports progress with tqdm.
+Vectors come back in input order.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional, Sequence
+
+from app.logger_conf import logger
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+EMBED_REQUESTS_PER_MIN = float(os.getenv("EMBED_REQUESTS_PER_MIN", "0"))  # 0 = unlimited
+EMBED_TOKENS_PER_MIN = float(os.getenv("EMBED_TOKENS_PER_MIN", "0"))  # 0 = unlimited
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_BACKOFF_BASE_S = float(os.getenv("EMBED_BACKOFF_BASE_S", "1.0"))
+EMBED_BACKOFF_MAX_S = 60.0
+
+EmbedFn = Callable[[List[str]], List[List[float]]]
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars per token for English; good enough for pacing against a TPM quota
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, bursting up to `capacity`.
+    acquire() blocks until the requested amount is available.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0):
+        if self.rate <= 0:
+            return
+        # a single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class EmbeddingScheduler:
+    def __init__(self, embed_fn: EmbedFn, batch_size: Optional[int] = None,
+                 max_concurrency: Optional[int] = None, requests_per_min: Optional[float] = None,
+                 tokens_per_min: Optional[float] = None, max_retries: Optional[int] = None,
+                 backoff_base: Optional[float] = None, progress: bool = True):
+        self.embed_fn = embed_fn
+        self.batch_size = max(1, batch_size or EMBED_BATCH_SIZE)
+        self.max_concurrency = max(1, max_concurrency or EMBED_MAX_CONCURRENCY)
+        self.max_retries = EMBED_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = EMBED_BACKOFF_BASE_S if backoff_base is None else backoff_base
+        self.progress = progress
+        rpm = EMBED_REQUESTS_PER_MIN if requests_per_min is None else requests_per_min
+        tpm = EMBED_TOKENS_PER_MIN if tokens_per_min is None else tokens_per_min
+        # allow a burst of roughly one second's worth (at least one full batch of requests)
+        self._requests = TokenBucket(rpm / 60.0, capacity=max(1.0, rpm / 60.0, self.max_concurrency)) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm / 60.0, capacity=max(tpm / 60.0, 1.0)) if tpm > 0 else None
+        self.calls = 0
+        self.retries = 0
+
+    def _run_batch(self, batch: List[str]) -> List[List[float]]:
+        tokens = sum(estimate_tokens(t) for t in batch)
+        attempt = 0
+        while True:
+            if self._requests:
+                self._requests.acquire(1)
+            if self._tokens:
+                self._tokens.acquire(tokens)
+            try:
+                self.calls += 1
+                vectors = self.embed_fn(batch)
+                if len(vectors) != len(batch):
+                    raise RuntimeError(f"embedding backend returned {len(vectors)} vectors for {len(batch)} texts")
+                return vectors
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.error("Embedding batch failed after %d attempts: %s", attempt, e)
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(EMBED_BACKOFF_MAX_S, self.backoff_base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                self.retries += 1
+                logger.warning("Embedding batch failed (%s); retry %d/%d in %.1fs", e, attempt, self.max_retries, delay)
+                time.sleep(delay)
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """
+        Embed `texts`, returning one vector per text in the same order.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        batches = [(i, texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+        out: List[Optional[List[float]]] = [None] * len(texts)
+
+        bar = None
+        if self.progress:
+            from tqdm import tqdm
+            bar = tqdm(total=len(texts), desc="embedding", unit="chunk")
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                futures = {pool.submit(self._run_batch, b): (i, len(b)) for i, b in batches}
+                try:
+                    for fut in as_completed(futures):
+                        i, n = futures[fut]
+                        out[i:i + n] = fut.result()
+                        if bar:
+                            bar.update(n)
+                except BaseException:
+                    # one batch exhausted its retries: don't keep paying for the rest
+                    for fut in futures:
+                        fut.cancel()
+                    raise
+        finally:
+            if bar:
+                bar.close()
+        return out  # type: ignore[return-value]
@@ -0,0 +1,165 @@
+"""
+Micro-batching worker for local (sentence-transformers) embeddings.
+
+Request threads used to call the local model one question at a time, so N concurrent
+questions meant N single-text forward passes competing for the same CPU cores. Here
+callers submit texts and get a concurrent.futures.Future; one worker thread takes the
+first waiting text, keeps collecting until EMBED_WORKER_MAX_BATCH texts or
+EMBED_WORKER_MAX_WAIT_MS have passed, and runs a single batched forward pass.
+rag.py uses it for the local fallback unless EMBED_WORKER_ENABLED=0.
+
+    LOCAL_EMBED_RUNTIME   torch      sentence-transformers on CPU (default)
+                          onnx       ONNX Runtime export of the same model
+                          onnx-int8  dynamically int8-quantized ONNX export (LOCAL_EMBED_ONNX_FILE)
+
+The ONNX runtimes need sentence-transformers >= 3.2 with `optimum[onnxruntime]`.
+Quantized vectors differ slightly from the fp32 ones, so the runtime is part of
+model_name (and therefore of the embedding cache key).
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+from app.logger_conf import logger
+
+EMBED_WORKER_ENABLED = os.getenv("EMBED_WORKER_ENABLED", "1") != "0"
+EMBED_WORKER_MAX_BATCH = int(os.getenv("EMBED_WORKER_MAX_BATCH", "32"))
+EMBED_WORKER_MAX_WAIT_MS = float(os.getenv("EMBED_WORKER_MAX_WAIT_MS", "5"))
+LOCAL_EMBED_RUNTIMES = ("torch", "onnx", "onnx-int8")
+LOCAL_EMBED_RUNTIME = os.getenv("LOCAL_EMBED_RUNTIME", "torch")
+LOCAL_EMBED_ONNX_FILE = os.getenv("LOCAL_EMBED_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+
+EncodeFn = Callable[[List[str]], List[List[float]]]
+
+
+class EmbeddingWorker:
+    """
+    Collects submitted texts into micro-batches for `encode_fn` on a daemon thread.
+    A batch that raises, or returns a vector count other than its size, fails every
+    future in it.
+    """
+
+    def __init__(self, encode_fn: EncodeFn, max_batch: int = EMBED_WORKER_MAX_BATCH,
+                 max_wait_ms: float = EMBED_WORKER_MAX_WAIT_MS, name: str = "embedding-worker"):
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+        self.largest_batch = 0
+        self.busy_s = 0.0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def submit_many(self, texts: Sequence[str]) -> List[Future]:
+        return [self.submit(t) for t in texts]
+
+    def embed(self, text: str, timeout: Optional[float] = None) -> List[float]:
+        return self.submit(text).result(timeout)
+
+    def _collect(self, first: tuple) -> List[tuple]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # let _run see the stop marker after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            # callers that gave up (future cancelled) are dropped before encoding
+            batch = [(t, f) for t, f in self._collect(first) if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            t0 = time.perf_counter()
+            try:
+                vectors = self.encode_fn([t for t, _ in batch])
+                if len(vectors) != len(batch):
+                    # zip() would leave the unmatched futures waiting forever
+                    raise ValueError(f"encode_fn returned {len(vectors)} vectors for {len(batch)} texts")
+            except Exception as e:
+                logger.exception("Embedding batch of %d failed: %s", len(batch), e)
+                for _, f in batch:
+                    f.set_exception(e)
+                continue
+            finally:
+                with self._stats_lock:
+                    self.batches += 1
+                    self.texts += len(batch)
+                    self.largest_batch = max(self.largest_batch, len(batch))
+                    self.busy_s += time.perf_counter() - t0
+            for (_, f), v in zip(batch, vectors):
+                f.set_result(v)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "texts": self.texts,
+                "avg_batch": self.texts / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "busy_s": round(self.busy_s, 3),
+                "queued": self._queue.qsize(),
+            }
+
+
+def load_sentence_transformer(model_name: str, runtime: str = LOCAL_EMBED_RUNTIME):
+    if runtime not in LOCAL_EMBED_RUNTIMES:
+        raise ValueError(f"Unknown local embedding runtime '{runtime}'. Choose one of: {', '.join(LOCAL_EMBED_RUNTIMES)}")
+    from sentence_transformers import SentenceTransformer
+    if runtime == "torch":
+        return SentenceTransformer(model_name, device="cpu")
+    model_kwargs = {"file_name": LOCAL_EMBED_ONNX_FILE} if runtime == "onnx-int8" else None
+    return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    LangChain Embeddings over a local sentence-transformers model, with every call
+    (queries from request threads, document batches from the index builder) going
+    through one EmbeddingWorker.
+    """
+
+    def __init__(self, model_name: str, runtime: str = LOCAL_EMBED_RUNTIME, **worker_kwargs):
+        self.runtime = runtime
+        self.model_name = model_name if runtime == "torch" else f"{model_name}@{runtime}"
+        self.model = load_sentence_transformer(model_name, runtime)
+        self.worker = EmbeddingWorker(self._encode, **worker_kwargs)
+        logger.info("Local embedding worker started (%s, max batch %d, max wait %.1f ms)",
+                    self.model_name, self.worker.max_batch, self.worker.max_wait * 1000)
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True,
+                                 show_progress_bar=False).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [f.result() for f in self.worker.submit_many(texts)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.worker.embed(text)
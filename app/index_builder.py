@@ -1,14 +1,14 @@
 """
-Chunk the nephrology PDF, create embeddings with Azure OpenAI and build a FAISS index.
+Chunk the nephrology PDF (and any other corpus documents), create embeddings with Azure
+OpenAI and build a FAISS index, either from scratch or incrementally.
 """
 import os
+import uuid
 from pathlib import Path
-from typing import List
-import pdfplumber
+from typing import Any, Dict, List, Optional
 from tqdm import tqdm
-import nltk
-nltk.download('punkt')
-from nltk.tokenize import sent_tokenize
+import faiss
+import numpy as np
 
 # try this replacement in your code
 from langchain_openai import AzureOpenAIEmbeddings
@@ -19,6 +19,15 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from app.logger_conf import logger
+from app.ann_index import FAISS_INDEX_TYPE, INDEX_TYPES, is_flat, make_index
+from app.corpus import (corpus_paths, doc_key, load_manifest, new_manifest, page_hash, publish_index, rekey_manifest,
+                        resolve_index_dir)
+from app.ingest import file_sha256
+from app.bm25 import build_bm25_index
+from app.mmap_store import CHUNK_STORE_FILE, export_chunk_store
+from app.embedding_cache import CachedEmbeddings, with_cache
+from app.embedding_scheduler import EMBED_BATCH_SIZE, EmbeddingScheduler
+from app.pdf_extract import PDF_ENGINE, PDF_ENGINES, iter_pdf_pages, page_count
 
 AZURE_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
 AZURE_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -26,48 +35,210 @@ EMBED_DEPLOY = os.getenv("AZURE_OPENAI_EMBED_DEPLOYMENT")
 INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "./data/faiss_index")
 PDF_PATH = os.getenv("NEPHRO_PDF_PATH", "./data/comprehensive-clinical-nephrology.pdf")
 OPENAI_API_VERSION = os.getenv("OPENAI_API_VERSION", "2024-12-01-preview")
+# "azure" (default) or "local" (sentence-transformers, same model as the rag.py fallback)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "azure")
+# chunks are handed to the vector store in batches so only one batch of texts is pending at a time;
+# each batch is then split into EMBED_BATCH_SIZE requests and embedded concurrently
+INDEX_ADD_BATCH = int(os.getenv("INDEX_ADD_BATCH", "1024"))
+CHUNKER = {"chunk_size": 800, "chunk_overlap": 100}
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    text = []
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            ptext = page.extract_text()
-            if ptext:
-                text.append(ptext)
-    return "\n\n".join(text)
+def extract_text_from_pdf(pdf_path: str, engine: Optional[str] = None) -> str:
+    return "\n\n".join(text for _, text in iter_pdf_pages(pdf_path, engine=engine) if text)
 
-def chunk_text(text: str) -> List[str]:
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800,
-        chunk_overlap=100,
+def _make_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNKER["chunk_size"],
+        chunk_overlap=CHUNKER["chunk_overlap"],
         separators=["\n\n", "\n", ".", "!", "?"]
     )
-    return splitter.split_text(text)
-
-def build_faiss_index():
-    os.makedirs(INDEX_PATH, exist_ok=True)
-    logger.info("Extracting text from %s", PDF_PATH)
-    text = extract_text_from_pdf(PDF_PATH)
-    if not text:
-        raise RuntimeError("No text extracted from nephrology PDF.")
-    logger.info("Chunking text ...")
-    chunks = chunk_text(text)
-    logger.info("Chunks created: %d", len(chunks))
 
+def chunk_text(text: str) -> List[str]:
+    return _make_splitter().split_text(text)
+
+def make_embeddings():
+    """
+    Embeddings client for index builds. Batching, concurrency and retries are handled by
+    EmbeddingScheduler, so the client sends whole batches and does not retry on its own.
+    """
+    if EMBED_BACKEND == "local":
+        from app.rag import _make_fallback_local_embeddings
+        return _make_fallback_local_embeddings()
     # LangChain OpenAIEmbeddings (Azure): specify deployment name in client args
-    embeddings = AzureOpenAIEmbeddings(
+    return AzureOpenAIEmbeddings(
         deployment=EMBED_DEPLOY,
-        chunk_size=1,
+        chunk_size=EMBED_BATCH_SIZE,
+        max_retries=0,
         openai_api_key=AZURE_API_KEY,
         azure_endpoint=AZURE_ENDPOINT,
         # openai_api_type="azure",
         openai_api_version=OPENAI_API_VERSION
     )
 
-    logger.info("Embedding chunks and building FAISS index...")
-    vectorstore = FAISS.from_texts(chunks, embeddings)
-    vectorstore.save_local(INDEX_PATH)
-    logger.info("FAISS index saved to %s", INDEX_PATH)
+def build_faiss_index(engine: Optional[str] = None, incremental: bool = False, paths: Optional[List[str]] = None,
+                      index_type: Optional[str] = None):
+    """
+    Build (or, with incremental=True, update) the FAISS index over the corpus documents and
+    publish it as a new version under INDEX_PATH.
+
+    Incremental mode starts from the live index and its manifest: unchanged documents are
+    skipped by file hash, changed documents are compared page by page, and only chunks of
+    new/changed pages are embedded and added while chunks of changed, removed or dropped
+    pages are deleted by id.
+
+    Updates always happen on an exact flat index; it is converted to `index_type`
+    (FAISS_INDEX_TYPE: flat, ivf_flat, hnsw, ivf_pq) just before publishing.
+    """
+    engine = engine or PDF_ENGINE
+    index_type = index_type or FAISS_INDEX_TYPE
+    paths = paths or corpus_paths(PDF_PATH)
+
+    # cache misses go through the batching scheduler; hits never reach the embedding backend
+    base_embeddings = make_embeddings()
+    scheduler = EmbeddingScheduler(base_embeddings.embed_documents)
+    embeddings = with_cache(base_embeddings, embed_fn=scheduler.embed)
+    embed_texts = embeddings.embed_documents if isinstance(embeddings, CachedEmbeddings) else scheduler.embed
+
+    vectorstore, manifest = None, None
+    if incremental:
+        current = resolve_index_dir(INDEX_PATH)
+        manifest = load_manifest(current)
+        if manifest is None:
+            logger.info("No corpus manifest in %s; doing a full build", current)
+        elif manifest.get("chunker") != CHUNKER:
+            logger.info("Chunker settings changed (%s -> %s); doing a full build", manifest.get("chunker"), CHUNKER)
+            manifest = None
+        else:
+            vectorstore = FAISS.load_local(current, embeddings, allow_dangerous_deserialization=True)
+            if not is_flat(vectorstore.index):
+                _restore_flat_index(vectorstore, embed_texts)
+            logger.info("Loaded index version %s (%d chunks) for incremental update",
+                        manifest.get("version"), len(vectorstore.index_to_docstore_id))
+            moved = rekey_manifest(manifest)
+            for old_key, new_key in moved.items():
+                for prev in manifest["documents"][new_key]["pages"].values():
+                    for cid in prev["chunk_ids"]:
+                        doc = vectorstore.docstore.search(cid)
+                        if hasattr(doc, "metadata"):
+                            doc.metadata["source"] = new_key
+            if moved:
+                logger.info("Re-keyed %d documents by path: %s", len(moved), moved)
+    if manifest is None:
+        manifest = new_manifest(CHUNKER)
+
+    splitter = _make_splitter()
+    stale_ids: List[str] = []
+    added = 0
+    pending: Dict[str, list] = {"texts": [], "metas": [], "ids": []}
+
+    def flush():
+        nonlocal vectorstore, added
+        if pending["texts"]:
+            vectorstore = _add_batch(vectorstore, pending["texts"], pending["metas"], embeddings, embed_texts, pending["ids"])
+            added += len(pending["texts"])
+            pending["texts"], pending["metas"], pending["ids"] = [], [], []
+
+    keys = set()
+    for path in paths:
+        key = doc_key(path)
+        keys.add(key)
+        sha = file_sha256(path)
+        old = manifest["documents"].get(key)
+        if old and old.get("sha256") == sha:
+            logger.info("%s unchanged, skipping", path)
+            continue
+
+        old_pages = old["pages"] if old else {}
+        new_pages = {}
+        logger.info("Extracting text from %s (engine=%s)", path, engine)
+        n_pages = page_count(path, engine)
+        for page_no, text in tqdm(iter_pdf_pages(path, engine=engine, total=n_pages), total=n_pages, desc=os.path.basename(path)):
+            pkey = str(page_no)
+            h = page_hash(text or "")
+            prev = old_pages.get(pkey)
+            if prev and prev["hash"] == h:
+                new_pages[pkey] = prev
+                continue
+            if prev:
+                stale_ids.extend(prev["chunk_ids"])
+            chunk_ids = []
+            for chunk in (splitter.split_text(text) if text and text.strip() else []):
+                # ids only need to be unique; the manifest remembers which page owns them
+                cid = uuid.uuid4().hex
+                chunk_ids.append(cid)
+                pending["texts"].append(chunk)
+                pending["metas"].append({"source": key, "page": page_no, "chunk_id": cid})
+                pending["ids"].append(cid)
+                if len(pending["texts"]) >= INDEX_ADD_BATCH:
+                    flush()
+            new_pages[pkey] = {"hash": h, "chunk_ids": chunk_ids}
+        for pkey, prev in old_pages.items():
+            if pkey not in new_pages:
+                stale_ids.extend(prev["chunk_ids"])
+        manifest["documents"][key] = {"path": path, "sha256": sha, "pages": new_pages}
+    flush()
+
+    for key in [k for k in manifest["documents"] if k not in keys]:
+        logger.info("Document %s is no longer in the corpus; removing its chunks", key)
+        for prev in manifest["documents"].pop(key)["pages"].values():
+            stale_ids.extend(prev["chunk_ids"])
+
+    if stale_ids and vectorstore is not None:
+        vectorstore.delete(stale_ids)
+    if vectorstore is None or not vectorstore.index_to_docstore_id:
+        raise RuntimeError("No text extracted from the corpus documents.")
+    if not added and not stale_ids and incremental:
+        logger.info("Corpus unchanged; keeping the current index")
+        return
+
+    logger.info("Chunks added: %d, removed: %d, total: %d (%d embedding requests, %d retries)",
+                added, len(stale_ids), len(vectorstore.index_to_docstore_id), scheduler.calls, scheduler.retries)
+    if isinstance(embeddings, CachedEmbeddings):
+        logger.info("Embedding cache: %d hits, %d chunks embedded", embeddings.cache.hits, embeddings.embedded)
+
+    if index_type != "flat":
+        flat = vectorstore.index
+        vectorstore.index = make_index(index_type, flat.reconstruct_n(0, flat.ntotal))
+    manifest["index_type"] = index_type
+
+    def save(index_dir: str):
+        vectorstore.save_local(index_dir)
+        export_chunk_store(vectorstore, index_dir)
+        build_bm25_index(os.path.join(index_dir, CHUNK_STORE_FILE))
+
+    final = publish_index(INDEX_PATH, save, manifest)
+    logger.info("FAISS index saved to %s", final)
+
+def _restore_flat_index(vectorstore, embed_texts):
+    """
+    Swap an ANN index for an exact flat one so chunks can be added/removed by id. Vectors
+    come from the embedding cache (the published index may be lossy, e.g. IVF-PQ), so this
+    normally makes no embedding calls.
+    """
+    n = vectorstore.index.ntotal
+    texts = [vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]).page_content for i in range(n)]
+    vectors = np.asarray(embed_texts(texts), dtype="float32")
+    flat = faiss.IndexFlatL2(vectorstore.index.d)
+    flat.add(vectors)
+    vectorstore.index = flat
+    logger.info("Restored exact flat index (%d vectors) for incremental update", n)
+
+def _add_batch(vectorstore, texts: List[str], metas: List[Dict[str, Any]], embeddings, embed_texts, ids: List[str]):
+    text_embeddings = list(zip(texts, embed_texts(texts)))
+    if vectorstore is None:
+        return FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metas, ids=ids)
+    vectorstore.add_embeddings(text_embeddings, metadatas=metas, ids=ids)
+    return vectorstore
 
 if __name__ == "__main__":
-    build_faiss_index()
+    import argparse
+    ap = argparse.ArgumentParser(description="Build the FAISS index from the nephrology PDF / corpus.")
+    ap.add_argument("--engine", choices=PDF_ENGINES, default=None,
+                    help="PDF text extraction backend (default: $PDF_ENGINE or pdfplumber)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="update the live index in place of a full rebuild (only changed pages are embedded)")
+    ap.add_argument("--index-type", choices=INDEX_TYPES, default=None,
+                    help="FAISS index to publish (default: $FAISS_INDEX_TYPE or flat)")
+    ap.add_argument("paths", nargs="*", help="documents to index (default: $CORPUS_PATHS or $NEPHRO_PDF_PATH)")
+    args = ap.parse_args()
+    build_faiss_index(engine=args.engine, incremental=args.incremental, paths=args.paths or None,
+                      index_type=args.index_type)
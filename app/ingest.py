@@ -0,0 +1,201 @@
+"""
+Streaming, idempotent patient ingestion.
+
+Records are read incrementally from a JSON array or JSONL file, normalised, and
+upserted in batched transactions keyed on patients.record_key: the record's patient_id /
+mrn / id, so re-running an import updates changed records instead of duplicating them.
+Records without one are counted and skipped, not imported. Patients who share a name
+stay separate rows. Rows loaded before records had ids (NULL record_key) are adopted by
+the first import of the same record with an id. The sha256 of every successfully loaded
+file is recorded in `ingest_meta`; loading the same content again is a no-op unless forced.
+"""
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional
+
+from app.db_pool import get_connection, transaction
+from app.db_tool import DB_PATH, RECORD_ID_FIELDS, ensure_schema, normalize_name, record_key
+from app.name_index import patient_name_index
+from app.logger_conf import logger
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+_READ_SIZE = 1 << 16
+
+_SQL_UPSERT = """
+INSERT INTO patients (patient_name, name_norm, record_key, data) VALUES (?, ?, ?, ?)
+ON CONFLICT(record_key) DO UPDATE SET patient_name = excluded.patient_name, name_norm = excluded.name_norm,
+    data = excluded.data
+WHERE patients.data IS NOT excluded.data
+"""
+# a row loaded without an id takes the key of the same record now that it has one
+_SQL_ADOPT = "UPDATE OR IGNORE patients SET record_key = ? WHERE id = ? AND record_key IS NULL"
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _content_key(record: Dict[str, Any]) -> str:
+    # what a record without its id looks like, to recognise rows loaded before it had one
+    rest = {k: v for k, v in record.items() if k not in RECORD_ID_FIELDS}
+    return hashlib.sha256(json.dumps(rest, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def _legacy_rows(conn) -> Dict[str, int]:
+    legacy = {}
+    for pid, data in conn.execute("SELECT id, data FROM patients WHERE record_key IS NULL"):
+        try:
+            record = json.loads(data)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(record, dict):
+            legacy.setdefault(_content_key(record), pid)
+    return legacy
+
+
+def _iter_json_array(f) -> Iterator[Dict[str, Any]]:
+    # incremental decode of `[ {...}, {...} ]` without holding the whole document
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    started = False
+    eof = False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if not started and pos < len(buf):
+            if buf[pos] != "[":
+                raise ValueError("Expected a JSON array of patient records")
+            started = True
+            pos += 1
+            continue
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                if buf[pos:].strip():
+                    raise
+                return
+            chunk = f.read(_READ_SIZE)
+            if not chunk:
+                eof = True
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield obj
+        pos = end
+
+
+def _iter_jsonl(f) -> Iterator[Dict[str, Any]]:
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_patient_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield patient dicts from a JSON array or JSONL (one object per line) file.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        if head == "[":
+            yield from _iter_json_array(f)
+        else:
+            yield from _iter_jsonl(f)
+
+
+def _ensure_meta(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS ingest_meta (
+        source TEXT PRIMARY KEY,
+        sha256 TEXT,
+        rows INTEGER,
+        loaded_at TEXT
+    )
+    """)
+
+
+def ingest_patients(path: str, db_path: str, batch_size: Optional[int] = None, force: bool = False) -> Dict[str, Any]:
+    """
+    Upsert all patients in `path` into `db_path`. Returns stats
+    (read, changed, skipped_invalid, missing_id, seconds, rows_per_sec, skipped).
+    """
+    batch_size = batch_size or INGEST_BATCH_SIZE
+    source = os.path.abspath(path)
+    digest = file_sha256(path)
+
+    with transaction(db_path) as conn:
+        ensure_schema(conn)
+        _ensure_meta(conn)
+        row = conn.execute("SELECT sha256 FROM ingest_meta WHERE source = ?", (source,)).fetchone()
+        legacy = _legacy_rows(conn)
+    if row and row[0] == digest and not force:
+        logger.info("Patient source %s unchanged (sha256 %s...), skipping import", path, digest[:12])
+        return {"skipped": True, "read": 0, "changed": 0, "skipped_invalid": 0, "missing_id": 0,
+                "seconds": 0.0, "rows_per_sec": 0.0}
+
+    start = time.perf_counter()
+    read = changed = invalid = missing_id = 0
+    batch = []
+    adopt = []
+
+    def flush():
+        nonlocal changed
+        with transaction(db_path) as c:
+            if adopt:
+                c.executemany(_SQL_ADOPT, adopt)
+            cur = c.executemany(_SQL_UPSERT, batch)
+            changed += max(cur.rowcount, 0)
+        batch.clear()
+        adopt.clear()
+
+    for p in iter_patient_records(path):
+        read += 1
+        name = (p.get("patient_name") or "").strip() if isinstance(p, dict) else ""
+        if not name:
+            invalid += 1
+            continue
+        key = record_key(p)
+        if key is None:
+            missing_id += 1
+            continue
+        if legacy:
+            pid = legacy.pop(_content_key(p), None)
+            if pid is not None:
+                adopt.append((key, pid))
+        batch.append((name, normalize_name(name), key, json.dumps(p)))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    with transaction(db_path) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO ingest_meta (source, sha256, rows, loaded_at) VALUES (?, ?, ?, ?)",
+            (source, digest, read, datetime.now(timezone.utc).isoformat()),
+        )
+
+    if patient_name_index.loaded and os.path.abspath(db_path) == os.path.abspath(DB_PATH):
+        patient_name_index.sync(get_connection(db_path))
+
+    elapsed = time.perf_counter() - start
+    rate = read / elapsed if elapsed > 0 else 0.0
+    if missing_id:
+        logger.warning("%s: %d records without %s were not imported", path, missing_id, "/".join(RECORD_ID_FIELDS))
+    logger.info("Ingested %s: %d records read, %d inserted/updated, %d invalid in %.2fs (%.0f rows/sec)",
+                path, read, changed, invalid, elapsed, rate)
+    return {"skipped": False, "read": read, "changed": changed, "skipped_invalid": invalid,
+            "missing_id": missing_id, "seconds": elapsed, "rows_per_sec": rate}
@@ -0,0 +1,161 @@
+"""
+Intent classification for incoming patient messages, shared by both agents.
+
+Every trigger phrase is looked up in the lower-cased message with a C-level substring test,
+as the former per-keyword `k in text` scans did, but each phrase is tested once for all
+intents, and a phrase that contains a shorter one ("leg swelling", "swelling") is only
+tested when the shorter one matched. The outcome is a structured Intent:
+
+    kind          symptom | medication | research | question | small_talk (first match wins)
+    clinical      route to the clinical agent (any trigger, or a "should I / is it safe" question)
+    wants_latest  asks for current research, so web search instead of the reference book
+
+With INTENT_EMBEDDING_FALLBACK=1, messages without any trigger are compared to a few
+example phrases per intent using a small local sentence-transformers model.
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from app.logger_conf import logger
+
+INTENT_EMBEDDING_FALLBACK = os.getenv("INTENT_EMBEDDING_FALLBACK", "0") == "1"
+INTENT_EMBEDDING_MODEL = os.getenv("INTENT_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+INTENT_EMBEDDING_THRESHOLD = float(os.getenv("INTENT_EMBEDDING_THRESHOLD", "0.55"))
+
+KINDS = ("symptom", "medication", "research", "question", "small_talk")
+
+TRIGGERS: Dict[str, List[str]] = {
+    "symptom": [
+        "pain", "swelling", "shortness of breath", "dyspnea", "urine", "fever", "bleeding", "worsen",
+        "dizziness", "edema", "leg swelling", "ankle swelling", "fluid retention",
+    ],
+    "medication": [
+        "medication", "dose",
+        "sglt2", "sglt2i", "sglt2 inhibitor", "dapagliflozin", "empagliflozin", "canagliflozin", "ertugliflozin",
+    ],
+    "research": [
+        "latest", "recent", "research", "study", "studies", "trial", "evidence", "meta-analysis",
+        "systematic review", "what's new", "what is new", "guidelines", "safety", "side effects",
+    ],
+}
+# narrower than "research": these send the clinical agent to web search
+LATEST_TRIGGERS = ["latest", "recent", "research", "study", "studies", "trial", "evidence"]
+QUESTION_PREFIXES = ("should i", "what should i", "do i need", "is it ok", "is it safe")
+
+
+@dataclass(frozen=True)
+class Intent:
+    kind: str
+    clinical: bool
+    wants_latest: bool
+    categories: FrozenSet[str]
+    matches: Tuple[str, ...]
+
+
+def _build() -> Tuple[Tuple[str, ...], Dict[str, Tuple[str, ...]], Dict[str, FrozenSet[str]]]:
+    labels: Dict[str, set] = {}
+    for kind, phrases in TRIGGERS.items():
+        for p in phrases:
+            labels.setdefault(p, set()).add(kind)
+    for p in LATEST_TRIGGERS:
+        labels.setdefault(p, set()).add("latest")
+    # roots contain no other phrase; every other phrase can only match where one of its roots does
+    roots = [p for p in labels if not any(q != p and q in p for q in labels)]
+    longer: Dict[str, list] = {r: [] for r in roots}
+    for p in labels:
+        if p not in longer:
+            longer[next(r for r in roots if r in p)].append(p)
+    return tuple(roots), {r: tuple(ps) for r, ps in longer.items() if ps}, {p: frozenset(v) for p, v in labels.items()}
+
+
+_ROOTS, _LONGER, _LABELS = _build()
+_SMALL_TALK = Intent("small_talk", False, False, frozenset(), ())
+
+
+@lru_cache(maxsize=1024)
+def _intent(matches: Tuple[str, ...], question: bool) -> Intent:
+    # keyed on the trigger phrases found, never on message text: a handful of combinations
+    categories = frozenset().union(*[_LABELS[m] for m in matches])
+    if question:
+        categories |= {"question"}
+    kind = next((k for k in KINDS[:-1] if k in categories), None)
+    if kind is None:
+        return Intent("small_talk", False, False, categories, matches)
+    return Intent(kind, True, "latest" in categories, categories, matches)
+
+
+def classify_intent(text: Optional[str]) -> Intent:
+    """
+    Classify `text` with one substring test per trigger phrase at most. `matches` lists the
+    phrases found, each shorter phrase before the longer ones containing it.
+    """
+    if not text:
+        return _SMALL_TALK
+    textl = text.lower()
+    matches = [p for p in _ROOTS if p in textl]
+    for root in matches[:]:
+        if root in _LONGER:
+            matches.extend(p for p in _LONGER[root] if p in textl)
+    intent = _intent(tuple(matches), textl.lstrip().startswith(QUESTION_PREFIXES))
+    if intent.clinical or not INTENT_EMBEDDING_FALLBACK:
+        return intent
+    classifier = _embedding_classifier()
+    kind = classifier.classify(text) if classifier else None
+    if kind is None:
+        return intent
+    return Intent(kind, True, False, frozenset({kind}), intent.matches)
+
+
+class _EmbeddingClassifier:
+    """
+    Nearest-prototype classifier over sentence embeddings of a few example phrases.
+    """
+
+    EXAMPLES = {
+        "symptom": ["my ankles are puffy", "I feel out of breath", "I can't sleep because my legs hurt",
+                    "I feel light-headed when I stand up", "I have not been peeing much"],
+        "medication": ["can I take ibuprofen", "I forgot my pills this morning", "when should I take my tablets",
+                       "can I stop my water pills"],
+        "research": ["what do new papers say about this drug", "are there new treatments for kidney disease"],
+        "small_talk": ["thanks", "hello there", "ok bye", "that's all for today", "good morning"],
+    }
+
+    def __init__(self, model_name: str = INTENT_EMBEDDING_MODEL, threshold: float = INTENT_EMBEDDING_THRESHOLD):
+        import numpy as np
+        from sentence_transformers import SentenceTransformer
+        self._np = np
+        self.threshold = threshold
+        self.model = SentenceTransformer(model_name)
+        self.labels, phrases = [], []
+        for kind, examples in self.EXAMPLES.items():
+            self.labels.extend([kind] * len(examples))
+            phrases.extend(examples)
+        self.vectors = self.model.encode(phrases, normalize_embeddings=True)
+
+    def classify(self, text: str) -> Optional[str]:
+        v = self.model.encode([text], normalize_embeddings=True)[0]
+        sims = self.vectors @ v
+        best = int(self._np.argmax(sims))
+        kind = self.labels[best]
+        if sims[best] < self.threshold or kind == "small_talk":
+            return None
+        return kind
+
+
+_classifier = None
+_classifier_failed = False
+
+
+def _embedding_classifier() -> Optional[_EmbeddingClassifier]:
+    global _classifier, _classifier_failed
+    if _classifier is None and not _classifier_failed:
+        try:
+            logger.info("Loading intent embedding classifier (%s)", INTENT_EMBEDDING_MODEL)
+            _classifier = _EmbeddingClassifier()
+        except Exception as e:
+            # keyword matching alone still works; don't retry the load on every message
+            _classifier_failed = True
+            logger.warning("Intent embedding fallback unavailable: %s", e)
+    return _classifier
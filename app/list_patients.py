@@ -1,7 +1,10 @@
-import sqlite3
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.db_pool import get_connection, close_all
+
 load_dotenv()
 
 DB = os.getenv("SQLITE_DB_PATH", "./data/patients.db")
@@ -11,10 +14,9 @@ print("Inspecting DB:", DB)
 if not os.path.exists(DB):
     print("DB does not exist at:", DB)
 else:
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
+    conn = get_connection(DB, readonly=True)
     try:
-        rows = c.execute("SELECT id, patient_name FROM patients ORDER BY id LIMIT 200").fetchall()
+        rows = conn.execute("SELECT id, patient_name FROM patients ORDER BY id LIMIT 200").fetchall()
         if rows:
             print("\n--- Patients in DB ---")
             for r in rows:
@@ -24,4 +26,4 @@ else:
     except Exception as e:
         print("\nError reading DB:", e)
     finally:
-        conn.close()
+        close_all()
@@ -1,22 +1,233 @@
+"""
+Logging for the API and scripts: the `postdischarge` logger hands records to a bounded
+in-memory queue, and a QueueListener thread writes them out, so request threads never
+wait on disk I/O or log rotation.
+
+    LOG_FILE              rotating log file (JSON lines unless LOG_FORMAT=text)
+    LOG_LEVEL             default level, DEBUG
+    LOG_LEVELS            per-module overrides by module file name, e.g. "rag=INFO,retrieval=WARNING"
+    LOG_CONSOLE_LEVEL     level of the console (text) output, INFO
+    LOG_DEBUG_RATE        DEBUG records allowed per second per call site (0 = no limit);
+                          the number left out is reported on the next one as "suppressed"
+    LOG_QUEUE_SIZE        records waiting for the writer; beyond this they are dropped and counted
+    LOG_BATCH_SIZE        the file is flushed once the queue is drained or after this many records
+    LOG_TEXT_CHARS        patient messages are clipped to this length in log lines (see clip())
+"""
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
 import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict
 
 LOG_FILE = os.getenv("LOG_FILE", "app_logs/system.log")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_CONSOLE_LEVEL = os.getenv("LOG_CONSOLE_LEVEL", "INFO")
+LOG_DEBUG_RATE = float(os.getenv("LOG_DEBUG_RATE", "20"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+LOG_TEXT_CHARS = int(os.getenv("LOG_TEXT_CHARS", "120"))
 os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
 
+# attributes every LogRecord has; anything else came from `extra=` and goes into the JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "suppressed"}
+
+
+def clip(text, limit: int = LOG_TEXT_CHARS) -> str:
+    """`text` shortened for a log line (patient messages can be long and are logged on every call)."""
+    text = str(text)
+    return text if len(text) <= limit else f"{text[:limit]}... ({len(text)} chars)"
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        module, _, level = item.partition("=")
+        levels[module.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, module, msg, thread, plus any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                out[key] = value
+        if getattr(record, "suppressed", 0):
+            out["suppressed"] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, default=str, ensure_ascii=False)
+
+
+class RecordFilter(logging.Filter):
+    """
+    Per-module levels (by record.module, the file name) and a per-call-site token bucket
+    for DEBUG records, applied on the calling thread before anything is queued.
+    """
+
+    def __init__(self, default: int, levels: Dict[str, int], debug_rate: float = LOG_DEBUG_RATE):
+        super().__init__()
+        self.default = default
+        self.levels = levels
+        self.debug_rate = debug_rate
+        self._lock = threading.Lock()
+        self._buckets: Dict[tuple, list] = {}  # call site -> [tokens, last refill, suppressed]
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.levels.get(record.module, self.default):
+            return False
+        if record.levelno >= logging.INFO or not self.debug_rate:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.debug_rate, now, 0]
+            bucket[0] = min(self.debug_rate, bucket[0] + (now - bucket[1]) * self.debug_rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] -= 1
+            record.suppressed, bucket[2] = bucket[2], 0
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the caller: when the queue is full the record is
+    dropped and counted. Messages are rendered here, on the calling thread, so the
+    writer doesn't see mutable arguments after they changed.
+    """
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that writes into a large buffer and only flushes every
+    `batch_size` records or when flush() is called (the listener does that whenever the
+    queue runs empty), instead of one write + flush per record.
+    """
+
+    def __init__(self, filename: str, batch_size: int = LOG_BATCH_SIZE, **kwargs):
+        self.batch_size = batch_size
+        self.pending = 0
+        super().__init__(filename, **kwargs)
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, encoding=self.encoding, errors=self.errors, buffering=1 << 16)
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+            self.pending += 1
+            if self.pending >= self.batch_size:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        super().flush()
+        self.pending = 0
+
+
+class BatchingQueueListener(QueueListener):
+    def dequeue(self, block: bool):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            # burst over: write out what has been buffered before waiting for more
+            for handler in self.handlers:
+                handler.flush()
+            return self.queue.get(block)
+
+
+def text_formatter() -> logging.Formatter:
+    return logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+
+def _build():
+    levels = parse_levels(LOG_LEVELS)
+    default = logging.getLevelName(LOG_LEVEL.upper())
+    console_level = logging.getLevelName(LOG_CONSOLE_LEVEL.upper())
+
+    file_handler = BatchedRotatingFileHandler(LOG_FILE, maxBytes=5*1024*1024, backupCount=5, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else text_formatter())
+    file_handler.setLevel(logging.DEBUG)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(text_formatter())
+    stream_handler.setLevel(console_level)
+
+    record_filter = RecordFilter(default, levels)
+    queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(record_filter)
+    listener = BatchingQueueListener(queue_handler.queue, file_handler, stream_handler, respect_handler_level=True)
+    # records below every configured level are skipped before a LogRecord is even built
+    lowest = min([default, *levels.values()])
+    return queue_handler, listener, record_filter, lowest
+
+
 logger = logging.getLogger("postdischarge")
-logger.setLevel(logging.DEBUG)
+_queue_handler, _listener, _record_filter, _lowest = _build()
+logger.setLevel(_lowest)
+logger.addHandler(_queue_handler)
+_listener.start()
+
+
+def stop_logging():
+    """Write out everything still queued and stop the writer thread (also runs at exit)."""
+    if _listener._thread is not None:
+        _listener.stop()
 
-formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
 
-file_handler = RotatingFileHandler(LOG_FILE, maxBytes=5*1024*1024, backupCount=5)
-file_handler.setFormatter(formatter)
-file_handler.setLevel(logging.DEBUG)
+atexit.register(stop_logging)
 
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(formatter)
-stream_handler.setLevel(logging.INFO)
 
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
+def log_stats() -> Dict[str, int]:
+    return {"queued": _queue_handler.queue.qsize(), "dropped": _queue_handler.dropped,
+            "suppressed": _record_filter.suppressed}
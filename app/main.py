@@ -1,18 +1,113 @@
-from fastapi import FastAPI
+import asyncio
+import json
+import sys
+import threading
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Any
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from app.logger_conf import logger
-from app.agents import receptionist_handle_message, clinical_handle_query
-from app.db_tool import init_db
+from app.logger_conf import log_stats, logger
+from app.agents import receptionist_handle_message, clinical_handle_query, clinical_stream_query
+from app.db_tool import init_db, patient_cache_stats
+from app.metrics import (PROFILING_ENABLED, REQUEST_SECONDS, SamplingProfiler, end_trace, register_gauges,
+                         render_prometheus, server_timing, start_trace, stats_gauges, summarize_trace)
+from app.session_store import make_session_store
+from app.warmup import Warmup
 
 app = FastAPI(title="PostDischarge POC API")
 
-# minimal in-memory session store (for POC)
-SESSIONS = {}
+# bounded, TTL-evicted session store; SESSION_BACKEND=sqlite/redis shares it across workers
+session_store = make_session_store()
+# preloads the RAG pipeline in the background after startup; see /health/ready
+warmup = Warmup()
+
+def _loaded(module: str):
+    # clinical-only modules are imported with the RAG stack (warm-up / first clinical
+    # question); a stats call or metrics scrape shouldn't be what loads them
+    return sys.modules.get(module)
+
+def _cache_stats() -> Dict[str, Any]:
+    sc = _loaded("app.semantic_cache")
+    return {"patients": patient_cache_stats(), "semantic_answers": sc.semantic_cache.stats() if sc else {},
+            "sessions": session_store.stats()}
+
+def _breaker_gauges():
+    ws = _loaded("app.web_search")
+    out = {}
+    for provider, s in (ws.web_search_stats() if ws else {}).items():
+        for state in ("closed", "half_open", "open"):
+            out[(("provider", provider), ("stat", state))] = 1.0 if s["state"] == state else 0.0
+        out[(("provider", provider), ("stat", "rejected"))] = float(s["rejected"])
+    return out
+
+register_gauges("postdischarge_cache", "Cache and session store counters", lambda: stats_gauges(_cache_stats()))
+register_gauges("postdischarge_logging", "Log records waiting to be written, dropped (queue full) and rate-limited",
+                lambda: {(("stat", k),): float(v) for k, v in log_stats().items()})
+register_gauges("postdischarge_web_breaker", "Web search circuit breaker state (1 = current) and rejected calls",
+                _breaker_gauges)
+
+_profile_lock = threading.Lock()
+
+def _wants_profile(request: Request) -> bool:
+    return PROFILING_ENABLED and "1" in (request.headers.get("x-profile"), request.query_params.get("profile"))
+
+def _finish_request(request: Request, status: int, elapsed: float, trace, profiler):
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(elapsed, request.method, getattr(route, "path", "unmatched"), str(status))
+    if trace:
+        logger.info("%s %s %d in %.1f ms; spans (ms): %s", request.method, request.url.path, status, elapsed * 1000,
+                    {k: round(v, 1) for k, v in summarize_trace(trace).items()})
+    if profiler is None:
+        return None
+    profiler.stop()
+    _profile_lock.release()
+    path = profiler.dump(f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}")
+    logger.info("Profile of %s %s (%d samples) written to %s", request.method, request.url.path, profiler.samples, path)
+    return path
+
+async def _traced_body(body, request: Request, status: int, t0: float, trace, profiler):
+    # streamed responses (SSE) are timed to the last chunk, not to when the headers went out
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        _finish_request(request, status, time.perf_counter() - t0, trace, profiler)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Latency histogram per route, a Server-Timing header with the request's spans, and
+    (PROFILING_ENABLED) a folded-stack profile for requests sent with X-Profile: 1.
+    Streamed responses are measured when their body ends and get no Server-Timing header,
+    since the headers go out before the work is done.
+    """
+    token = start_trace()
+    # the profiler samples every thread, so profile one request at a time
+    profiler = SamplingProfiler().start() if _wants_profile(request) and _profile_lock.acquire(blocking=False) else None
+    t0 = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except BaseException:
+        _finish_request(request, 500, time.perf_counter() - t0, end_trace(token), profiler)
+        raise
+    # the list stays shared with the endpoint's context, so spans recorded while a body streams still land in it
+    trace = end_trace(token)
+    if "content-length" not in response.headers:
+        response.body_iterator = _traced_body(response.body_iterator, request, response.status_code, t0, trace,
+                                              profiler)
+        return response
+    elapsed = time.perf_counter() - t0
+    response.headers["Server-Timing"] = server_timing(trace, elapsed)
+    path = _finish_request(request, response.status_code, elapsed, trace, profiler)
+    if path is not None:
+        response.headers["X-Profile-File"] = path
+    return response
 
 class MessageIn(BaseModel):
     session_id: str
@@ -22,22 +117,65 @@ class MessageIn(BaseModel):
 def startup_event():
     # initialize DB from data/patients.json if not present
     init_db(json_path=os.getenv("PATIENTS_JSON_PATH", "../data/patients.json"))
+    warmup.start()
     logger.info("API started")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # close the web search connection pool (only loaded if a clinical question ran)
+    ws = _loaded("app.web_search")
+    if ws is not None:
+        await ws.aclose_clients()
+
+@app.get("/health/live")
+def health_live():
+    # the process is up and serving requests
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+def health_ready():
+    # 503 until the RAG pipeline is loaded (by the warm-up, its retries or a request), so load
+    # balancers can hold traffic back
+    report = warmup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
 @app.post("/receptionist/message")
 def receptionist_message(msg: MessageIn):
     sid = msg.session_id
-    if sid not in SESSIONS:
-        SESSIONS[sid] = {"stage": "ask_name"}
-    session = SESSIONS[sid]
+    session = session_store.get(sid) or {"stage": "ask_name"}
     res = receptionist_handle_message(session, msg.message)
     # save session back
-    SESSIONS[sid] = session
+    session_store.save(sid, session)
     return res
 
 @app.post("/clinical/query")
-def clinical_query(msg: MessageIn):
+async def clinical_query(msg: MessageIn):
     sid = msg.session_id
-    session = SESSIONS.get(sid, {})
-    res = clinical_handle_query(session, msg.message)
+    session = await asyncio.to_thread(session_store.get, sid) or {}
+    res = await clinical_handle_query(session, msg.message)
     return res
+
+@app.post("/clinical/stream")
+async def clinical_stream(msg: MessageIn):
+    """
+    Server-sent events: one `data: {json}` line per clinical_stream_query event, so the
+    UI can show answer tokens as soon as the LLM produces them.
+    """
+    session = await asyncio.to_thread(session_store.get, msg.session_id) or {}
+
+    async def events():
+        async for event in clinical_stream_query(session, msg.message):
+            yield f"data: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/stats/cache")
+def cache_stats():
+    # hit rates of the patient record cache, the clinical semantic answer cache and the session store
+    return _cache_stats()
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus text format: request/span latency histograms, cache and breaker gauges
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,305 @@
+"""
+Request tracing, Prometheus metrics and an opt-in sampling profiler.
+
+    with span("db.lookup_patient"): ...        time a block
+    @timed("embedding.query")                  time a function (sync or async)
+
+Every span is observed in the postdischarge_span_seconds{span=...} histogram and, inside
+a traced request (start_trace / end_trace, done by the API middleware), appended to that
+request's trace so it can be logged and returned as a Server-Timing header.
+render_prometheus() renders all histograms and counters plus whatever the registered
+collectors report (cache sizes, circuit breaker states, ...) in the Prometheus text format.
+
+With PROFILING_ENABLED=1 a request can ask to be profiled (X-Profile: 1 or ?profile=1):
+a SamplingProfiler records the Python stacks of busy threads every PROFILE_INTERVAL_MS
+while it runs and writes them in the folded format used by flamegraph.pl / speedscope.
+"""
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "app_logs/profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with labels, rendered like prometheus_client's.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts, sum, count]
+
+    @property
+    def family(self) -> str:
+        return self.name
+
+    def observe(self, value: float, *labelvalues: str):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for labelvalues, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield (self.name + "_bucket",
+                       _labels(self.labelnames + ("le",), labelvalues + (repr(float(bound)),)), cumulative)
+            yield self.name + "_bucket", _labels(self.labelnames + ("le",), labelvalues + ("+Inf",)), count
+            yield self.name + "_sum", _labels(self.labelnames, labelvalues), total
+            yield self.name + "_count", _labels(self.labelnames, labelvalues), count
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    @property
+    def family(self) -> str:
+        # samples are <name>_total, and HELP/TYPE must name the family the samples belong to
+        return self.name + "_total"
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        with self._lock:
+            snapshot = list(self._values.items())
+        for labelvalues, value in snapshot:
+            yield self.name + "_total", _labels(self.labelnames, labelvalues), value
+
+
+_metrics: List = []
+# name -> (help, fn returning {labels dict as tuple of pairs: value}); rendered as gauges
+_collectors: Dict[str, Tuple[str, Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]]] = {}
+
+
+def histogram(name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+    metric = Histogram(name, help, labelnames, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def counter(name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    metric = Counter(name, help, labelnames)
+    _metrics.append(metric)
+    return metric
+
+
+def register_gauges(name: str, help: str, fn: Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]):
+    """
+    Gauge family read at scrape time: fn() returns {(("label", "value"), ...): number}.
+    Registering the same name again replaces the collector.
+    """
+    _collectors[name] = (help, fn)
+
+
+def stats_gauges(stats: Dict[str, Dict], **labels: str) -> Dict[Tuple[Tuple[str, str], ...], float]:
+    """
+    Flatten {"cache name": {"hits": 3, "hit_rate": 0.5, ...}} into gauge samples labelled
+    cache/stat, skipping non-numeric values.
+    """
+    out = {}
+    for cache, values in stats.items():
+        for stat, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                key = tuple(labels.items()) + (("cache", cache), ("stat", stat))
+                out[key] = float(value)
+    return out
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.family} {metric.help}")
+        lines.append(f"# TYPE {metric.family} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+    for name, (help, fn) in list(_collectors.items()):
+        try:
+            values = fn()
+        except Exception:
+            # a broken collector (e.g. Redis down) must not take the whole scrape with it
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for pairs, value in values.items():
+            names, labelvalues = zip(*pairs) if pairs else ((), ())
+            lines.append(f"{name}{_labels(names, labelvalues)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+SPAN_SECONDS = histogram("postdischarge_span_seconds", "Duration of instrumented operations", ("span",))
+REQUEST_SECONDS = histogram("postdischarge_http_request_seconds", "API request latency", ("method", "route", "status"))
+SPAN_ERRORS = counter("postdischarge_span_errors", "Instrumented operations that raised", ("span",))
+
+_trace: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("postdischarge_trace", default=None)
+
+
+def record_span(name: str, seconds: float):
+    SPAN_SECONDS.observe(seconds, name)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((name, seconds))
+
+
+@contextmanager
+def span(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SPAN_ERRORS.inc(name)
+        raise
+    finally:
+        record_span(name, time.perf_counter() - t0)
+
+
+def timed(name: str):
+    """
+    Decorator form of span() for plain and async functions.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_trace():
+    """
+    Collect this context's spans from now on; returns a token for end_trace. Tasks and
+    threads started from here (asyncio.create_task, asyncio.to_thread) share the trace.
+    """
+    return _trace.set([])
+
+
+def end_trace(token) -> List[Tuple[str, float]]:
+    trace = _trace.get()
+    _trace.reset(token)
+    # the same list, even while empty: spans of a body that is still streaming are appended to it
+    return trace if trace is not None else []
+
+
+def summarize_trace(trace: List[Tuple[str, float]]) -> Dict[str, float]:
+    """Total milliseconds per span name, in first-seen order."""
+    out: Dict[str, float] = {}
+    for name, seconds in trace:
+        out[name] = out.get(name, 0.0) + seconds * 1000
+    return out
+
+
+def server_timing(trace: List[Tuple[str, float]], total_s: float) -> str:
+    parts = [f"{name};dur={ms:.1f}" for name, ms in summarize_trace(trace).items()]
+    parts.append(f"total;dur={total_s * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# innermost frames of threads that are just waiting (locks, queues, selectors)
+_IDLE_FRAMES = {"wait", "select", "poll", "epoll", "_wait_for_tstate_lock", "accept", "get", "sleep", "_worker"}
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stack of every busy thread each `interval_ms` from a background
+    thread (sys._current_frames, so no tracing overhead on the profiled code) and tallies
+    them as folded stacks: "thread;module:function;module:function count".
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self.stacks: _Tally = _Tally()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or frame.f_code.co_name in _IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    module = frame.f_globals.get("__name__", "?")
+                    stack.append(f"{module}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def dump(self, name: str, directory: str = PROFILE_DIR) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.folded())
+        return path
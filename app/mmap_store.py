@@ -0,0 +1,120 @@
+"""
+Zero-copy index storage for serving.
+
+Next to LangChain's index.faiss / index.pkl, every published index version gets a
+`chunks.sqlite` file holding chunk text and metadata by FAISS position. Serving then:
+  - reads index.faiss with FAISS memory-mapping flags, so vector data is paged in from
+    the OS page cache on demand and shared between all uvicorn workers, and
+  - looks chunks up in SQLite by position instead of unpickling the whole docstore
+    (and the position -> id dict) into every worker.
+index.pkl is still written because incremental builds need the mutable docstore.
+"""
+import json
+import os
+import sqlite3
+from collections.abc import Mapping
+from typing import Any, Iterator
+
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from app.db_pool import SharedReader
+from app.logger_conf import logger
+
+CHUNK_STORE_FILE = "chunks.sqlite"
+INDEX_FILE = "index.faiss"
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") != "0"
+
+
+def export_chunk_store(vectorstore: FAISS, index_dir: str):
+    """
+    Write chunks.sqlite for `vectorstore` into `index_dir` (rows keyed by FAISS position).
+    """
+    path = os.path.join(index_dir, CHUNK_STORE_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+    # a one-off writer; pooled connections are for the long-lived readers
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("CREATE TABLE chunks (pos INTEGER PRIMARY KEY, doc_id TEXT, text TEXT NOT NULL, metadata TEXT)")
+        rows = []
+        for pos, doc_id in vectorstore.index_to_docstore_id.items():
+            doc = vectorstore.docstore.search(doc_id)
+            rows.append((int(pos), str(doc_id), doc.page_content, json.dumps(doc.metadata)))
+            if len(rows) >= 5000:
+                conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+                rows.clear()
+        if rows:
+            conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+    logger.info("Wrote chunk store with %d chunks to %s", len(vectorstore.index_to_docstore_id), path)
+
+
+def has_chunk_store(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, CHUNK_STORE_FILE))
+
+
+class SQLiteDocstore(Docstore):
+    """
+    Read-only docstore over chunks.sqlite; ids are FAISS positions. The file is opened when
+    the index is loaded: later rebuilds may prune this version's directory while it is served.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._reader = SharedReader(path)
+
+    def search(self, search: Any):
+        row = self._reader.fetchone("SELECT doc_id, text, metadata FROM chunks WHERE pos = ?", (int(search),))
+        if row is None:
+            return f"ID {search} not found."
+        doc_id, text, metadata = row
+        return Document(page_content=text, metadata=json.loads(metadata or "{}"), id=doc_id)
+
+    def delete(self, ids):
+        raise NotImplementedError("SQLiteDocstore is read-only; rebuild the index to change it")
+
+
+class _PositionMap(Mapping):
+    """index_to_docstore_id for SQLiteDocstore: position i maps to docstore key i."""
+
+    def __init__(self, n: int):
+        self._n = n
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not 0 <= i < self._n:
+            raise KeyError(i)
+        return i
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self._n))
+
+    def __len__(self) -> int:
+        return self._n
+
+
+def read_index(path: str) -> faiss.Index:
+    """
+    Read a FAISS index memory-mapped where the FAISS build supports it (IVF lists, and
+    flat codes on FAISS >= 1.10), falling back to a normal read.
+    """
+    if FAISS_MMAP:
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError as e:
+            logger.warning("Memory-mapped read of %s failed (%s); reading into RAM", path, e)
+    return faiss.read_index(path)
+
+
+def load_mmap_vectorstore(index_dir: str, embeddings) -> FAISS:
+    index = read_index(os.path.join(index_dir, INDEX_FILE))
+    docstore = SQLiteDocstore(os.path.join(index_dir, CHUNK_STORE_FILE))
+    return FAISS(embedding_function=embeddings, index=index, docstore=docstore,
+                 index_to_docstore_id=_PositionMap(index.ntotal))
@@ -0,0 +1,203 @@
+"""
+In-memory typo-tolerant index over patient names.
+
+Names are broken into padded character trigrams per token and kept in an inverted
+index. A query first collects candidates sharing enough trigrams to possibly be
+within the edit budget (q-gram lemma: one edit destroys at most 3 trigrams, an
+adjacent transposition at most 4), then
+verifies them with a bounded Levenshtein distance against the full name and its
+individual tokens, so "jon smtih" and just "pitman" both resolve.
+"""
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+GRAM = 3
+# patient_name_changes rows kept after a sync (at least 1, so MAX(seq) survives), enough for
+# other processes' indexes to catch up incrementally
+NAME_CHANGES_KEEP = max(1, int(os.getenv("NAME_CHANGES_KEEP", "10000")))
+
+
+def _tokens(name: str) -> List[str]:
+    return name.lower().split()
+
+
+def _grams(tokens: List[str]) -> Set[str]:
+    out = set()
+    for t in tokens:
+        padded = f"${t}$"
+        if len(padded) < GRAM:
+            out.add(padded)
+            continue
+        for i in range(len(padded) - GRAM + 1):
+            out.add(padded[i:i + GRAM])
+    return out
+
+
+def bounded_levenshtein(a: str, b: str, k: int) -> int:
+    """
+    Edit distance (adjacent transpositions count as one edit) between a and b,
+    or k + 1 as soon as it is known to exceed k.
+    """
+    if abs(len(a) - len(b)) > k:
+        return k + 1
+    if len(a) < len(b):
+        a, b = b, a
+    pprev = None
+    prev = list(range(len(b) + 1))
+    prev_min = 0
+    for i, ca in enumerate(a, start=1):
+        cur = [i] + [0] * len(b)
+        row_min = i
+        for j, cb in enumerate(b, start=1):
+            cost = 0 if ca == cb else 1
+            v = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if pprev is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                v = min(v, pprev[j - 2] + 1)
+            cur[j] = v
+            if v < row_min:
+                row_min = v
+        # a transposition can reach back two rows, so both must be over budget to stop early
+        if row_min > k and prev_min > k:
+            return k + 1
+        pprev, prev, prev_min = prev, cur, row_min
+    return prev[-1] if prev[-1] <= k else k + 1
+
+
+def default_budget(query: str) -> int:
+    # roughly one typo per 4 characters, capped so short names don't match everything
+    return max(1, min(3, len(query.replace(" ", "")) // 4))
+
+
+class NameIndex:
+    """
+    Thread-safe trigram index of (patient id, name). Loaded once from the patients
+    table, then kept current by sync(), which replays the patient_name_changes log
+    (written by triggers on insert, rename and delete) since the last sync. sync() also
+    trims the log to its last NAME_CHANGES_KEEP rows; an index whose unreplayed rows were
+    trimmed (by another process) reloads from the patients table instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._names: Dict[int, str] = {}
+        self._tokens: Dict[int, List[str]] = {}
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._seq = 0
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, pid: int, name: Optional[str]):
+        if not name:
+            return
+        toks = _tokens(name)
+        with self._lock:
+            if pid in self._names:
+                self._remove_locked(pid)
+            self._names[pid] = name
+            self._tokens[pid] = toks
+            for g in _grams(toks):
+                self._postings[g].add(pid)
+
+    def remove(self, pid: int):
+        with self._lock:
+            self._remove_locked(pid)
+
+    def _remove_locked(self, pid: int):
+        toks = self._tokens.pop(pid, None)
+        self._names.pop(pid, None)
+        if toks is None:
+            return
+        for g in _grams(toks):
+            ids = self._postings.get(g)
+            if ids is not None:
+                ids.discard(pid)
+                if not ids:
+                    del self._postings[g]
+
+    def sync(self, conn: sqlite3.Connection) -> int:
+        """
+        Apply patient inserts, renames and deletes logged since the last sync (everything
+        on the first call). Returns the number of patients (re)indexed or removed.
+        """
+        with self._sync_lock:
+            # read the log position first: changes racing with the reads below are replayed next time
+            low, seq = conn.execute("SELECT MIN(seq), COALESCE(MAX(seq), 0) FROM patient_name_changes").fetchone()
+            if self.loaded and low is not None and low > self._seq + 1:
+                self.loaded = False
+            if not self.loaded:
+                rows = conn.execute("SELECT id, patient_name FROM patients").fetchall()
+                with self._lock:
+                    self._names.clear()
+                    self._tokens.clear()
+                    self._postings.clear()
+                for pid, name in rows:
+                    self.add(pid, name)
+                self._seq, self.loaded = seq, True
+                self._trim(conn, seq - NAME_CHANGES_KEEP)
+                return len(rows)
+            if seq == self._seq:
+                return 0
+            changed = {pid for (pid,) in conn.execute(
+                "SELECT DISTINCT id FROM patient_name_changes WHERE seq > ? AND seq <= ?", (self._seq, seq))}
+            current = dict(conn.execute(
+                "SELECT id, patient_name FROM patients WHERE id IN "
+                "(SELECT id FROM patient_name_changes WHERE seq > ? AND seq <= ?)", (self._seq, seq)))
+            for pid in changed:
+                if current.get(pid):
+                    self.add(pid, current[pid])
+                else:
+                    self.remove(pid)
+            self._seq = seq
+            self._trim(conn, seq - NAME_CHANGES_KEEP)
+            return len(changed)
+
+    @staticmethod
+    def _trim(conn: sqlite3.Connection, upto: int):
+        if upto <= 0:
+            return
+        try:
+            conn.execute("DELETE FROM patient_name_changes WHERE seq <= ?", (upto,))
+            conn.commit()
+        except sqlite3.OperationalError:
+            # read-only or busy database: the next sync trims instead
+            conn.rollback()
+
+    def search(self, query: str, max_distance: Optional[int] = None, limit: int = 5) -> List[Tuple[int, str, int]]:
+        """
+        Return up to `limit` (id, name, distance) tuples within `max_distance` edits,
+        best match first.
+        """
+        q_tokens = _tokens(query)
+        if not q_tokens:
+            return []
+        q = " ".join(q_tokens)
+        k = default_budget(q) if max_distance is None else max_distance
+        q_grams = _grams(q_tokens)
+        need = max(1, len(q_grams) - (GRAM + 1) * k)
+
+        with self._lock:
+            shared: Dict[int, int] = defaultdict(int)
+            for g in q_grams:
+                for pid in self._postings.get(g, ()):
+                    shared[pid] += 1
+            cands = [(pid, n, self._names[pid], self._tokens[pid]) for pid, n in shared.items() if n >= need]
+
+        scored = []
+        for pid, n, name, toks in cands:
+            d = bounded_levenshtein(q, " ".join(toks), k)
+            if len(q_tokens) == 1:
+                for t in toks:
+                    d = min(d, bounded_levenshtein(q, t, k))
+            if d <= k:
+                scored.append((d, -n, name, pid))
+        scored.sort()
+        return [(pid, name, d) for d, _, name, pid in scored[:limit]]
+
+
+patient_name_index = NameIndex()
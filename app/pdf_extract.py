@@ -0,0 +1,96 @@
+"""
+Parallel, page-streaming PDF text extraction.
+
+The page range is split into small fixed-size tasks that run in a process pool;
+iter_pdf_pages() yields (page_number, text) in page order as tasks finish, keeping
+at most a few tasks in flight so memory stays bounded regardless of PDF size.
+Workers are recycled periodically because pdfplumber's per-page caches grow.
+
+This module is deliberately light (no langchain/embedding imports) since every
+pool worker imports it.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Iterator, List, Optional, Tuple
+
+PDF_ENGINES = ("pdfplumber", "pymupdf4llm")
+PDF_ENGINE = os.getenv("PDF_ENGINE", "pdfplumber")
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+PDF_TASKS_PER_CHILD = int(os.getenv("PDF_TASKS_PER_CHILD", "8"))
+
+
+def page_count(pdf_path: str, engine: str = PDF_ENGINE) -> int:
+    if engine == "pymupdf4llm":
+        import pymupdf
+        with pymupdf.open(pdf_path) as doc:
+            return doc.page_count
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def _extract_pdfplumber(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    import pdfplumber
+    out = []
+    # pdfplumber page numbers are 1-based
+    with pdfplumber.open(pdf_path, pages=list(range(start + 1, end + 1))) as pdf:
+        for page in pdf.pages:
+            out.append((page.page_number, page.extract_text() or ""))
+            # drop cached layout objects; they dominate memory on large books
+            close = getattr(page, "close", None) or getattr(page, "flush_cache", None)
+            if close:
+                close()
+    return out
+
+
+def _extract_pymupdf4llm(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    import pymupdf4llm
+    chunks = pymupdf4llm.to_markdown(pdf_path, pages=list(range(start, end)), page_chunks=True, show_progress=False)
+    return [(start + i + 1, c.get("text") or "") for i, c in enumerate(chunks)]
+
+
+def extract_page_range(engine: str, pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Extract pages [start, end) (0-based) and return [(1-based page number, text)].
+    """
+    if engine == "pymupdf4llm":
+        return _extract_pymupdf4llm(pdf_path, start, end)
+    if engine == "pdfplumber":
+        return _extract_pdfplumber(pdf_path, start, end)
+    raise ValueError(f"Unknown PDF engine '{engine}'. Choose one of: {', '.join(PDF_ENGINES)}")
+
+
+def iter_pdf_pages(pdf_path: str, engine: Optional[str] = None, workers: Optional[int] = None,
+                   pages_per_task: Optional[int] = None, total: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Lazily yield (page_number, text) for every page of `pdf_path`, in order.
+    """
+    engine = engine or PDF_ENGINE
+    workers = max(1, workers or PDF_WORKERS)
+    step = max(1, pages_per_task or PDF_PAGES_PER_TASK)
+    n_pages = total if total is not None else page_count(pdf_path, engine)
+    ranges = [(s, min(s + step, n_pages)) for s in range(0, n_pages, step)]
+
+    if workers == 1 or len(ranges) <= 1:
+        for s, e in ranges:
+            yield from extract_page_range(engine, pdf_path, s, e)
+        return
+
+    # spawn (not fork) so workers can be recycled and don't inherit the parent's heap
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                             max_tasks_per_child=PDF_TASKS_PER_CHILD) as pool:
+        pending = deque()
+        todo = iter(ranges)
+        for s, e in todo:
+            pending.append(pool.submit(extract_page_range, engine, pdf_path, s, e))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            pages = pending.popleft().result()
+            nxt = next(todo, None)
+            if nxt is not None:
+                pending.append(pool.submit(extract_page_range, engine, pdf_path, *nxt))
+            yield from pages
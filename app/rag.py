@@ -1,10 +1,22 @@
 import os
+import json
 import logging
-from typing import Optional
+import threading
+import time
+from typing import AsyncIterator, List, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
 from app.logger_conf import logger
+from app.metrics import record_span, timed
+from app.ann_index import apply_search_params
+from app.corpus import index_version, resolve_index_dir
+from app.embedding_cache import with_cache
+from app.mmap_store import has_chunk_store, load_mmap_vectorstore
+from app.retrieval import make_retriever
+from app.embedding_scheduler import EMBED_BATCH_SIZE
+from app.embedding_worker import EMBED_WORKER_ENABLED, LocalEmbeddings
+from app.context_packing import CONTEXT_CANDIDATES, CONTEXT_PACKING_ENABLED, PackingRetriever
 
 # langchain imports 
 import os
@@ -14,11 +26,12 @@ from langchain_community.vectorstores import FAISS
 from langchain_openai import AzureChatOpenAI
 from langchain_classic.chains import RetrievalQA
 from langchain_classic.prompts import PromptTemplate
+from langchain_core.callbacks import BaseCallbackHandler
 from dotenv import load_dotenv
 load_dotenv()
 # try to import sentence-transformers for local fallback
 try:
-    from sentence_transformers import SentenceTransformer
+    import sentence_transformers  # noqa: F401  (needed by HuggingFaceEmbeddings)
     from langchain.embeddings import HuggingFaceEmbeddings
     _hf_available = True
 except Exception:
@@ -31,80 +44,67 @@ AZURE_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 CHAT_DEPLOY = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT")
 EMBED_DEPLOY = os.getenv("AZURE_OPENAI_EMBED_DEPLOYMENT")
 OPENAI_API_VERSION = os.getenv("OPENAI_API_VERSION", "2024-06-01")
+LOCAL_EMBED_MODEL = os.getenv("LOCAL_EMBED_MODEL", "all-MiniLM-L6-v2")
+EMBED_PROBE_CACHE = os.getenv("EMBED_PROBE_CACHE", "./data/embedding_backend.json")
 
 _cached_vectorstore = None
 _cached_qa = None
+_cached_components = None
+_cached_index_version = None
+_cached_index_dir = None
+_load_lock = threading.RLock()
 
-def _try_make_azure_embeddings():
+# constructor signatures accepted by different langchain-openai versions, tried in order
+_AZURE_EMBED_SIGNATURES = [
+    ("deployment+azure_endpoint+api_version", lambda: dict(deployment=EMBED_DEPLOY, azure_endpoint=AZURE_ENDPOINT)),
+    ("deployment_name+azure_endpoint+api_version", lambda: dict(deployment_name=EMBED_DEPLOY, azure_endpoint=AZURE_ENDPOINT)),
+    ("azure_deployment+azure_endpoint+api_version", lambda: dict(azure_deployment=EMBED_DEPLOY, azure_endpoint=AZURE_ENDPOINT)),
+    ("deployment+openai_api_base+api_version", lambda: dict(deployment=EMBED_DEPLOY, openai_api_base=AZURE_ENDPOINT)),
+    ("model+azure_endpoint+api_version", lambda: dict(model=EMBED_DEPLOY, azure_endpoint=AZURE_ENDPOINT)),
+]
+
+def _probe_fingerprint() -> str:
     """
-    Try multiple constructor signatures for OpenAIEmbeddings to handle different langchain/openai versions.
-    Returns an embeddings object on success, or raises the last exception on failure.
+    What the probe result depends on: library version and Azure settings (not the key itself).
     """
-    errs = []
-    # Attempt 1: common signature used in many examples
     try:
-        emb = AzureOpenAIEmbeddings(
-            deployment=EMBED_DEPLOY,
-            openai_api_key=AZURE_KEY,
-            azure_endpoint=AZURE_ENDPOINT,
-            openai_api_version=OPENAI_API_VERSION
-        )
-        logger.info("OpenAIEmbeddings constructed with (deployment, azure_endpoint, openai_api_version).")
-        return emb
-    except Exception as e:
-        errs.append(("deployment+azure_endpoint+api_version", e))
+        from importlib.metadata import version
+        lib = version("langchain-openai")
+    except Exception:
+        lib = "unknown"
+    return "|".join(str(v) for v in (lib, AZURE_ENDPOINT, EMBED_DEPLOY, OPENAI_API_VERSION, bool(AZURE_KEY)))
 
-    # Attempt 2: alias names some versions expect
+def _read_probe_cache() -> Optional[dict]:
     try:
-        emb = AzureOpenAIEmbeddings(
-            deployment_name=EMBED_DEPLOY,
-            openai_api_key=AZURE_KEY,
-            azure_endpoint=AZURE_ENDPOINT,
-            openai_api_version=OPENAI_API_VERSION
-        )
-        logger.info("OpenAIEmbeddings constructed with (deployment_name, azure_endpoint, openai_api_version).")
-        return emb
-    except Exception as e:
-        errs.append(("deployment_name+azure_endpoint+api_version", e))
+        with open(EMBED_PROBE_CACHE, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached if cached.get("fingerprint") == _probe_fingerprint() else None
 
-    # Attempt 3: older alias 'azure_deployment' or 'azure_deployment_name'
+def _write_probe_cache(result: dict):
     try:
-        emb = AzureOpenAIEmbeddings(
-            azure_deployment=EMBED_DEPLOY,
-            openai_api_key=AZURE_KEY,
-            azure_endpoint=AZURE_ENDPOINT,
-            openai_api_version=OPENAI_API_VERSION
-        )
-        logger.info("OpenAIEmbeddings constructed with (azure_deployment, azure_endpoint, openai_api_version).")
-        return emb
-    except Exception as e:
-        errs.append(("azure_deployment+azure_endpoint+api_version", e))
+        os.makedirs(os.path.dirname(EMBED_PROBE_CACHE) or ".", exist_ok=True)
+        tmp = EMBED_PROBE_CACHE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dict(result, fingerprint=_probe_fingerprint()), f)
+        os.replace(tmp, EMBED_PROBE_CACHE)
+    except OSError as e:
+        logger.warning("Could not cache embedding backend probe result: %s", e)
 
-    # Attempt 4: some versions expect 'deployment' but 'azure_endpoint' named `openai_api_base` (less likely)
-    try:
-        emb = AzureOpenAIEmbeddings(
-            deployment=EMBED_DEPLOY,
-            openai_api_key=AZURE_KEY,
-            openai_api_base=AZURE_ENDPOINT,
-            openai_api_version=OPENAI_API_VERSION
-        )
-        logger.info("OpenAIEmbeddings constructed with (deployment, openai_api_base, openai_api_version).")
-        return emb
-    except Exception as e:
-        errs.append(("deployment+openai_api_base+api_version", e))
-
-    # Attempt 5: try 'model' param (some versions prefer model instead of deployment)
-    try:
-        emb = AzureOpenAIEmbeddings(
-            model=EMBED_DEPLOY,
-            openai_api_key=AZURE_KEY,
-            azure_endpoint=AZURE_ENDPOINT,
-            openai_api_version=OPENAI_API_VERSION
-        )
-        logger.info("OpenAIEmbeddings constructed with (model, azure_endpoint, openai_api_version).")
-        return emb
-    except Exception as e:
-        errs.append(("model+azure_endpoint+api_version", e))
+def _try_make_azure_embeddings(signatures=None):
+    """
+    Try multiple constructor signatures for OpenAIEmbeddings to handle different langchain/openai versions.
+    Returns (embeddings, signature name) on success, or raises RuntimeError when none works.
+    """
+    errs = []
+    for name, kwargs in signatures or _AZURE_EMBED_SIGNATURES:
+        try:
+            emb = AzureOpenAIEmbeddings(openai_api_key=AZURE_KEY, openai_api_version=OPENAI_API_VERSION, **kwargs())
+            logger.info("OpenAIEmbeddings constructed with (%s).", name)
+            return emb, name
+        except Exception as e:
+            errs.append((name, e))
 
     # If none worked, raise a combined error (but keep the list for debugging)
     logger.error("All attempts to construct Azure OpenAI embeddings failed. Attempts and errors:")
@@ -119,53 +119,158 @@ def _make_fallback_local_embeddings():
     """
     if not _hf_available:
         raise RuntimeError("No Azure embeddings available and sentence-transformers not installed. Install sentence-transformers to use local fallback.")
-    # pick a small local model (adjust if you have others)
-    model_name = "all-MiniLM-L6-v2"
-    logger.info("Using local SentenceTransformer model for embeddings: %s", model_name)
-    hf = SentenceTransformer(model_name)
-    return HuggingFaceEmbeddings(model_name=model_name)
+    logger.info("Using local SentenceTransformer model for embeddings: %s", LOCAL_EMBED_MODEL)
+    if EMBED_WORKER_ENABLED:
+        # concurrent questions share batched forward passes (EMBED_WORKER_*, LOCAL_EMBED_RUNTIME)
+        return LocalEmbeddings(LOCAL_EMBED_MODEL)
+    # HuggingFaceEmbeddings loads the model itself; batched encode sends EMBED_BATCH_SIZE texts per forward pass
+    return HuggingFaceEmbeddings(model_name=LOCAL_EMBED_MODEL, encode_kwargs={"batch_size": EMBED_BATCH_SIZE})
+
+def make_embeddings():
+    """
+    Azure embeddings, or the local model when Azure can't be constructed. The backend
+    (and Azure constructor signature) that worked is remembered in EMBED_PROBE_CACHE, so
+    restarts with the same settings go straight to it instead of probing again.
+    """
+    cached = _read_probe_cache()
+    if cached and cached.get("backend") == "local":
+        try:
+            return _make_fallback_local_embeddings()
+        except Exception as e:
+            logger.warning("Cached local embedding backend failed, probing again: %s", e)
+    elif cached and cached.get("backend") == "azure":
+        known = [sig for sig in _AZURE_EMBED_SIGNATURES if sig[0] == cached.get("signature")]
+        try:
+            return _try_make_azure_embeddings(known)[0]
+        except Exception as e:
+            logger.warning("Cached Azure embedding signature failed, probing again: %s", e)
+
+    # First try Azure embeddings
+    try:
+        embeddings, signature = _try_make_azure_embeddings()
+        _write_probe_cache({"backend": "azure", "signature": signature})
+        return embeddings
+    except Exception as e:
+        logger.warning("Azure embeddings construction failed: %s", e)
+    # Try local fallback
+    try:
+        embeddings = _make_fallback_local_embeddings()
+        logger.info("Local HF embeddings created as fallback.")
+    except Exception as e2:
+        logger.exception("Local fallback also failed: %s", e2)
+        raise RuntimeError("Failed to obtain any embeddings backend.") from e2
+    _write_probe_cache({"backend": "local", "model": LOCAL_EMBED_MODEL})
+    return embeddings
 
 def load_vectorstore():
     """
     Load FAISS index using whichever embeddings we can construct.
     If embeddings construction fails for Azure, attempt local HF fallback (so testing can continue).
     """
-    global _cached_vectorstore
     if _cached_vectorstore is not None:
         return _cached_vectorstore
+    # the startup warm-up and a first request may both get here
+    with _load_lock:
+        if _cached_vectorstore is None:
+            _load_vectorstore()
+    return _cached_vectorstore
 
-    # First try Azure embeddings
-    try:
-        embeddings = _try_make_azure_embeddings()
-    except Exception as e:
-        logger.warning("Azure embeddings construction failed: %s", e)
-        # Try local fallback
-        try:
-            embeddings = _make_fallback_local_embeddings()
-            logger.info("Local HF embeddings created as fallback.")
-        except Exception as e2:
-            logger.exception("Local fallback also failed: %s", e2)
-            raise RuntimeError("Failed to obtain any embeddings backend.") from e2
+def _load_vectorstore():
+    global _cached_vectorstore, _cached_index_version, _cached_index_dir
+    embeddings = make_embeddings()
+
+    # query embeddings are served from the persistent cache when the same text was seen before
+    embeddings = with_cache(embeddings)
 
     # Now load FAISS index using the embeddings object
+    version = index_version(INDEX_PATH)
+    index_dir = resolve_index_dir(INDEX_PATH)
     try:
-        vs = FAISS.load_local(INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-        logger.info("Loaded FAISS index from %s", INDEX_PATH)
+        if has_chunk_store(index_dir):
+            # memory-mapped vectors + SQLite chunk store: no pickle, pages shared across workers
+            vs = load_mmap_vectorstore(index_dir, embeddings)
+        else:
+            vs = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+        logger.info("Loaded FAISS index from %s", index_dir)
+        # nprobe / efSearch for IVF / HNSW indexes (FAISS_NPROBE, FAISS_EF_SEARCH)
+        apply_search_params(vs.index)
     except Exception as e:
         logger.exception("Failed to load FAISS index: %s", e)
         raise
     _cached_vectorstore = vs
-    return vs
+    _cached_index_version = version
+    _cached_index_dir = index_dir
+
+def loaded_index_version() -> Optional[str]:
+    """Version of the index currently served (None until load_vectorstore has run)."""
+    return _cached_index_version
+
+class SpanCallbackHandler(BaseCallbackHandler):
+    """
+    Records the retriever and LLM steps of chain runs as metrics spans
+    (retriever.search, llm.generate); pass span_callbacks in the run config.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._started = {}
+
+    def _start(self, run_id):
+        self._started[run_id] = time.perf_counter()
+
+    def _end(self, name, run_id):
+        t0 = self._started.pop(run_id, None)
+        if t0 is not None:
+            record_span(name, time.perf_counter() - t0)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end("retriever.search", run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end("retriever.search", run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end("llm.generate", run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end("llm.generate", run_id)
+
+
+span_callbacks = [SpanCallbackHandler()]
+
+@timed("embedding.query")
+def embed_question(question: str):
+    """
+    Embed `question` with the vectorstore's (cached) query embeddings, so the retriever's
+    own embed_query for the same text is a cache hit.
+    """
+    return load_vectorstore().embedding_function.embed_query(question)
 
 def get_rag_chain():
     """
     Build and cache a RetrievalQA chain using AzureChatOpenAI.
     Ensure openai_api_version is passed.
     """
-    global _cached_qa
+    global _cached_qa, _cached_components
     if _cached_qa is not None:
         return _cached_qa
+    with _load_lock:
+        if _cached_qa is None:
+            _build_rag_chain()
+    return _cached_qa
 
+def _build_rag_chain():
+    global _cached_qa, _cached_components
     # create chat model (explicit azure params)
     chat = AzureChatOpenAI(
         deployment_name=CHAT_DEPLOY,
@@ -177,7 +282,12 @@ def get_rag_chain():
     )
 
     vs = load_vectorstore()
-    retriever = vs.as_retriever(search_type="similarity", search_kwargs={"k": 4})
+    # dense + BM25 with reciprocal-rank fusion (RETRIEVAL_MODE, RERANK_ENABLED, RETRIEVAL_BUDGET_MS)
+    if CONTEXT_PACKING_ENABLED:
+        # retrieve CONTEXT_CANDIDATES chunks, send a deduplicated, diverse subset within CONTEXT_TOKEN_BUDGET
+        retriever = PackingRetriever(base=make_retriever(vs, _cached_index_dir, k=CONTEXT_CANDIDATES))
+    else:
+        retriever = make_retriever(vs, _cached_index_dir)
 
     prompt = PromptTemplate(
         input_variables=["context", "question"],
@@ -198,5 +308,30 @@ def get_rag_chain():
     )
 
     _cached_qa = qa
+    # the streaming path drives the same pieces directly
+    _cached_components = {"llm": chat, "retriever": retriever, "prompt": prompt}
     logger.info("RAG chain initialized and cached.")
-    return qa
+
+def get_rag_components():
+    """
+    llm, retriever and prompt of the cached RAG chain, for callers that stream tokens.
+    """
+    if _cached_components is None:
+        get_rag_chain()
+    return _cached_components
+
+async def aretrieve(question: str) -> List:
+    return await get_rag_components()["retriever"].ainvoke(question, config={"callbacks": span_callbacks})
+
+async def astream_answer(question: str, docs: List) -> AsyncIterator[str]:
+    """
+    Stream the answer to `question` over `docs` token by token. The prompt is built the
+    same way as the "stuff" chain (chunks joined by blank lines), so streamed and
+    non-streamed answers match.
+    """
+    parts = get_rag_components()
+    context = "\n\n".join(doc.page_content for doc in docs)
+    text = parts["prompt"].format(context=context, question=question)
+    async for chunk in parts["llm"].astream(text, config={"callbacks": span_callbacks}):
+        if chunk.content:
+            yield chunk.content
@@ -0,0 +1,152 @@
+"""
+Hybrid retrieval for the clinical RAG chain.
+
+    dense   FAISS similarity search (what get_rag_chain used before)
+    sparse  BM25 over the chunk store (app.bm25)
+    fuse    reciprocal-rank fusion: score(d) = sum over lists of 1 / (RRF_K + rank)
+    rerank  optional local cross-encoder over the top RERANK_TOP_N fused chunks
+
+RETRIEVAL_BUDGET_MS caps the time spent per query: the rerank stage is skipped when
+dense + sparse already used the budget, or when its recent average latency would push
+the query over it. Indexes without a BM25 table are served dense-only.
+"""
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.bm25 import BM25Index
+from app.logger_conf import logger
+from app.metrics import record_span
+from app.mmap_store import CHUNK_STORE_FILE
+
+RETRIEVAL_MODES = ("dense", "bm25", "hybrid")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "4"))
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))  # candidates per list before fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "20"))
+RETRIEVAL_BUDGET_MS = float(os.getenv("RETRIEVAL_BUDGET_MS", "400"))  # 0 = no budget
+
+_cached_reranker = None
+
+
+def load_reranker(model_name: str = RERANK_MODEL):
+    """Local sentence-transformers CrossEncoder, loaded once per process."""
+    global _cached_reranker
+    if _cached_reranker is None:
+        from sentence_transformers import CrossEncoder
+        logger.info("Loading cross-encoder reranker %s", model_name)
+        _cached_reranker = CrossEncoder(model_name)
+    return _cached_reranker
+
+
+def _doc_key(doc: Document) -> str:
+    return doc.metadata.get("chunk_id") or doc.id or doc.page_content
+
+
+def rrf_fuse(ranked_lists: List[List[Document]], rrf_k: int = RRF_K) -> List[Tuple[Document, float]]:
+    """Reciprocal-rank fusion of several best-first document lists."""
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranked in ranked_lists:
+        for rank, doc in enumerate(ranked, start=1):
+            key = _doc_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+    order = sorted(scores, key=scores.get, reverse=True)
+    return [(docs[key], scores[key]) for key in order]
+
+
+class HybridRetriever(BaseRetriever):
+    vectorstore: Any
+    bm25: Optional[Any] = None
+    reranker: Optional[Any] = None
+    mode: str = RETRIEVAL_MODE
+    k: int = RETRIEVAL_K
+    fetch_k: int = RETRIEVAL_FETCH_K
+    rrf_k: int = RRF_K
+    rerank_top_n: int = RERANK_TOP_N
+    budget_ms: float = RETRIEVAL_BUDGET_MS
+    # moving average of rerank latency, used to decide whether it fits in the budget
+    rerank_ms_avg: float = 0.0
+    last_timings: Dict[str, float] = {}
+
+    def _sparse(self, query: str) -> List[Document]:
+        if self.bm25 is None:
+            return []
+        vs = self.vectorstore
+        docs = []
+        for pos, _ in self.bm25.search(query, self.fetch_k):
+            doc = vs.docstore.search(vs.index_to_docstore_id[pos])
+            if isinstance(doc, Document):
+                docs.append(doc)
+        return docs
+
+    def _rerank(self, query: str, docs: List[Document]) -> List[Document]:
+        scores = self.reranker.predict([(query, d.page_content) for d in docs])
+        order = sorted(range(len(docs)), key=lambda i: float(scores[i]), reverse=True)
+        return [docs[i] for i in order]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        t0 = time.perf_counter()
+        timings = {}
+        dense = self.vectorstore.similarity_search(query, k=self.fetch_k) if self.mode != "bm25" else []
+        timings["dense_ms"] = (time.perf_counter() - t0) * 1000
+        t1 = time.perf_counter()
+        sparse = self._sparse(query) if self.mode != "dense" else []
+        timings["sparse_ms"] = (time.perf_counter() - t1) * 1000
+
+        fused = [doc for doc, _ in rrf_fuse([dense, sparse], self.rrf_k)]
+        elapsed = (time.perf_counter() - t0) * 1000
+        if self.reranker is not None and fused:
+            if self.budget_ms and elapsed + self.rerank_ms_avg > self.budget_ms:
+                logger.info("Skipping rerank: %.0f ms used + ~%.0f ms rerank > %.0f ms budget",
+                            elapsed, self.rerank_ms_avg, self.budget_ms)
+            else:
+                t2 = time.perf_counter()
+                head = self._rerank(query, fused[:self.rerank_top_n])
+                fused = head + fused[self.rerank_top_n:]
+                took = (time.perf_counter() - t2) * 1000
+                timings["rerank_ms"] = took
+                self.rerank_ms_avg = took if not self.rerank_ms_avg else 0.8 * self.rerank_ms_avg + 0.2 * took
+        timings["total_ms"] = (time.perf_counter() - t0) * 1000
+        self.last_timings = timings
+        for stage in ("dense", "sparse", "rerank"):
+            if f"{stage}_ms" in timings:
+                record_span(f"retrieval.{stage}", timings[f"{stage}_ms"] / 1000)
+        logger.debug("Retrieval timings for %r: %s", query, timings)
+        return fused[:self.k]
+
+
+def make_retriever(vectorstore, index_dir: str, mode: Optional[str] = None, rerank: Optional[bool] = None,
+                   k: Optional[int] = None) -> BaseRetriever:
+    """
+    Retriever for get_rag_chain: hybrid when the index has a BM25 table, otherwise the
+    plain dense FAISS retriever. `k` overrides RETRIEVAL_K (documents returned).
+    """
+    mode = mode or RETRIEVAL_MODE
+    k = k or RETRIEVAL_K
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}'. Choose one of: {', '.join(RETRIEVAL_MODES)}")
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    bm25 = BM25Index(os.path.join(index_dir, CHUNK_STORE_FILE))
+    if mode != "dense" and not bm25.available:
+        logger.warning("No BM25 index in %s; using dense retrieval only", index_dir)
+        mode = "dense"
+    if mode == "dense" and not rerank:
+        return vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": k})
+    reranker = None
+    if rerank:
+        try:
+            reranker = load_reranker()
+        except Exception as e:
+            logger.warning("Cross-encoder reranker unavailable, continuing without it: %s", e)
+    logger.info("Retrieval mode=%s rerank=%s", mode, reranker is not None)
+    return HybridRetriever(vectorstore=vectorstore, bm25=bm25 if mode != "dense" else None,
+                           reranker=reranker, mode=mode, k=k)
@@ -0,0 +1,116 @@
+"""
+Semantic answer cache for the clinical RAG path.
+
+Stores (question embedding, answer, sources) in a fixed-size numpy matrix of unit
+vectors. A new question whose embedding has cosine similarity >= threshold with a
+cached one reuses that answer instead of running retrieval + the LLM again. Entries
+expire after `ttl` seconds, the least recently used entry is evicted when full, and
+the whole cache is dropped when the index version changes (answers are only valid
+for the index they were generated from).
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") != "0"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL_S = float(os.getenv("SEMANTIC_CACHE_TTL_S", "3600"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: float = SEMANTIC_CACHE_TTL_S,
+                 maxsize: int = SEMANTIC_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._vectors: Optional[np.ndarray] = None  # maxsize x dim, unit rows
+        self._valid = np.zeros(maxsize, dtype=bool)
+        self._created = np.zeros(maxsize)
+        self._used = np.zeros(maxsize)
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _reset(self, version: Optional[str]):
+        if self._valid.any():
+            self.invalidations += 1
+        self._version = version
+        self._vectors = None
+        self._valid[:] = False
+        self._entries = [None] * self.maxsize
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        v = np.asarray(embedding, dtype="float32")
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def lookup(self, embedding: Sequence[float], version: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached {"question", "answer", "sources", "similarity"} closest to
+        `embedding` if it clears the threshold, else None.
+        """
+        q = self._unit(embedding)
+        now = time.time()
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            if self._vectors is None or not self._valid.any() or self._vectors.shape[1] != q.shape[0]:
+                self.misses += 1
+                return None
+            self._valid &= (now - self._created) < self.ttl
+            sims = self._vectors @ q
+            sims[~self._valid] = -1.0
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._used[best] = now
+            self.hits += 1
+            return dict(self._entries[best], similarity=float(sims[best]))
+
+    def store(self, question: str, embedding: Sequence[float], answer: str, sources: List[Dict[str, Any]], version: str):
+        q = self._unit(embedding)
+        now = time.time()
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            if self._vectors is None or self._vectors.shape[1] != q.shape[0]:
+                self._vectors = np.zeros((self.maxsize, q.shape[0]), dtype="float32")
+                self._valid[:] = False
+            self._valid &= (now - self._created) < self.ttl
+            free = np.flatnonzero(~self._valid)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self._used))
+                self.evictions += 1
+            self._vectors[slot] = q
+            self._valid[slot] = True
+            self._created[slot] = now
+            self._used[slot] = now
+            self._entries[slot] = {"question": question, "answer": answer, "sources": sources}
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": int(self._valid.sum()),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "index_version": self._version,
+        }
+
+
+semantic_cache = SemanticCache()
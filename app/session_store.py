@@ -0,0 +1,311 @@
+"""
+Conversation session storage shared by the API workers.
+
+SESSION_BACKEND selects where sessions live:
+    memory  per-process TTL/LRU cache (single worker / development)
+    sqlite  WAL-mode SQLite file shared by all workers on one host (SESSION_DB_PATH)
+    redis   any Redis-protocol server (REDIS_URL), e.g. shared between hosts
+
+Sessions expire SESSION_TTL_S after their last save and at most SESSION_MAX are kept
+(least recently used go first; for redis the server's maxmemory policy does that).
+They are stored as compact JSON with patient records reduced to id + name; the full
+record stays in the patients table.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+from app.cache import TTLCache
+from app.db_pool import get_connection
+from app.logger_conf import logger
+
+SESSION_BACKENDS = ("memory", "sqlite", "redis")
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "1800"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "./data/sessions.sqlite")
+REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_TIMEOUT_S = float(os.getenv("REDIS_TIMEOUT_S", "2"))
+
+_PATIENT_KEYS = ("id", "patient_name")
+
+
+def _compact_patient(p: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    return {k: p[k] for k in _PATIENT_KEYS if k in p} if p else p
+
+
+def encode_session(session: Dict[str, Any]) -> bytes:
+    """
+    Compact JSON of `session`; `patient` and `candidates` keep only id + name.
+    """
+    out = dict(session)
+    if "patient" in out:
+        out["patient"] = _compact_patient(out["patient"])
+    if "candidates" in out:
+        out["candidates"] = [_compact_patient(c) for c in out["candidates"] or []]
+    return json.dumps(out, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def decode_session(raw: bytes) -> Dict[str, Any]:
+    return json.loads(raw)
+
+
+class SessionStore:
+    """
+    Backend-independent part: (de)serialization and hit/size metrics. Subclasses
+    implement _get_raw / _put_raw / delete / _backend_stats.
+    """
+
+    backend = "base"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.saves = 0
+        self.bytes_saved = 0
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raw = self._get_raw(session_id)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return decode_session(raw)
+
+    def save(self, session_id: str, session: Dict[str, Any]):
+        raw = encode_session(session)
+        self.saves += 1
+        self.bytes_saved += len(raw)
+        self._put_raw(session_id, raw)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        out = {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saves": self.saves,
+            "avg_bytes": self.bytes_saved / self.saves if self.saves else 0.0,
+        }
+        out.update(self._backend_stats())
+        return out
+
+    def _get_raw(self, session_id: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _put_raw(self, session_id: str, raw: bytes):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def _backend_stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemorySessionStore(SessionStore):
+    backend = "memory"
+
+    def __init__(self, ttl: float = SESSION_TTL_S, maxsize: int = SESSION_MAX):
+        super().__init__()
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def _get_raw(self, session_id):
+        return self._cache.get(session_id)
+
+    def _put_raw(self, session_id, raw):
+        self._cache.put(session_id, raw)
+
+    def delete(self, session_id):
+        self._cache.pop(session_id)
+
+    def _backend_stats(self):
+        s = self._cache.stats()
+        return {"size": s["size"], "maxsize": s["maxsize"], "evictions": s["evictions"], "expirations": s["expirations"]}
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a WAL-mode SQLite file. Expired rows are ignored on read and purged,
+    together with the least recently saved rows beyond `maxsize`, every
+    `sweep_every` saves.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL_S, maxsize: int = SESSION_MAX,
+                 sweep_every: int = 100):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.sweep_every = sweep_every
+        self.evictions = 0
+        self.expirations = 0
+        conn = get_connection(path)
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data BLOB NOT NULL, saved REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_saved ON sessions(saved)")
+        conn.commit()
+
+    def _get_raw(self, session_id):
+        row = get_connection(self.path).execute(
+            "SELECT data FROM sessions WHERE id = ? AND saved > ?", (session_id, time.time() - self.ttl)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _put_raw(self, session_id, raw):
+        conn = get_connection(self.path)
+        conn.execute("INSERT OR REPLACE INTO sessions (id, data, saved) VALUES (?, ?, ?)", (session_id, raw, time.time()))
+        conn.commit()
+        if self.saves % self.sweep_every == 0:
+            self.sweep()
+
+    def sweep(self):
+        conn = get_connection(self.path)
+        expired = conn.execute("DELETE FROM sessions WHERE saved <= ?", (time.time() - self.ttl,)).rowcount
+        evicted = conn.execute(
+            "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY saved DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,)
+        ).rowcount
+        conn.commit()
+        self.expirations += expired
+        self.evictions += evicted
+        if expired or evicted:
+            logger.info("Session sweep: %d expired, %d evicted", expired, evicted)
+
+    def delete(self, session_id):
+        conn = get_connection(self.path)
+        conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        conn.commit()
+
+    def _backend_stats(self):
+        size = get_connection(self.path).execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"size": size, "maxsize": self.maxsize, "evictions": self.evictions, "expirations": self.expirations}
+
+
+class RedisError(Exception):
+    pass
+
+
+class RespClient:
+    """
+    Minimal Redis (RESP2) client: one blocking connection per thread, reconnect on error.
+    Enough for GET / SET EX / DEL / DBSIZE / INFO without a redis-py dependency.
+    """
+
+    def __init__(self, url: str = REDIS_URL, timeout: float = REDIS_TIMEOUT_S):
+        u = urlparse(url)
+        self.host = u.hostname or "127.0.0.1"
+        self.port = u.port or 6379
+        self.password = u.password
+        self.db = int((u.path or "/0").lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock, self._local.reader = sock, sock.makefile("rb")
+        if self.password:
+            self._roundtrip("AUTH", self.password)
+        if self.db:
+            self._roundtrip("SELECT", self.db)
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for a in args:
+            b = a if isinstance(a, bytes) else str(a).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        return b"".join(parts)
+
+    def _read(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            return None if n < 0 else self._local.reader.read(n + 2)[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise RedisError(f"unexpected reply {line!r}")
+
+    def _roundtrip(self, *args):
+        self._local.sock.sendall(self._encode(args))
+        return self._read()
+
+    def execute(self, *args):
+        for attempt in (0, 1):
+            if getattr(self._local, "sock", None) is None:
+                self._connect()
+            try:
+                return self._roundtrip(*args)
+            except (OSError, ConnectionError):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessions as Redis strings with a TTL (SET EX); LRU is the server's maxmemory policy.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str = REDIS_URL, ttl: float = SESSION_TTL_S, prefix: str = "session:"):
+        super().__init__()
+        self.client = RespClient(url)
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    def _get_raw(self, session_id):
+        return self.client.execute("GET", self.prefix + session_id)
+
+    def _put_raw(self, session_id, raw):
+        self.client.execute("SET", self.prefix + session_id, raw, "EX", self.ttl)
+
+    def delete(self, session_id):
+        self.client.execute("DEL", self.prefix + session_id)
+
+    def _backend_stats(self):
+        out = {"size": self.client.execute("DBSIZE")}
+        names = {"evicted_keys": "evictions", "expired_keys": "expirations"}
+        for line in (self.client.execute("INFO", "stats") or b"").decode().splitlines():
+            key, _, value = line.partition(":")
+            if key in names:
+                out[names[key]] = int(value)
+        return out
+
+
+def make_session_store(backend: Optional[str] = None) -> SessionStore:
+    backend = backend or SESSION_BACKEND
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "redis":
+        return RedisSessionStore()
+    raise ValueError(f"Unknown session backend '{backend}'. Choose one of: {', '.join(SESSION_BACKENDS)}")
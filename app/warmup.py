@@ -0,0 +1,148 @@
+"""
+Background warm-up of the clinical pipeline, started with the API, so the first patient
+doesn't wait for the embedding backend, the FAISS index, the retriever models and the RAG
+chain to load. Requests are served while it runs; anything not loaded yet is loaded on
+first use as before (rag.py guards against loading twice).
+
+    WARMUP_ENABLED       0 = skip, load lazily on the first clinical question
+    WARMUP_EMBED_QUERY   1 = also embed a probe question (opens the connection to the
+                         embedding service / runs the local model once)
+    WARMUP_RETRY_S       delay before retrying failed steps, doubled each round up to
+                         WARMUP_RETRY_MAX_S; retries stop once the step succeeds
+
+/health/ready reports ready once every step has succeeded, or what it loads is in place
+anyway (e.g. the RAG chain was built lazily by a request after the step failed).
+"""
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.logger_conf import logger
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") != "0"
+WARMUP_EMBED_QUERY = os.getenv("WARMUP_EMBED_QUERY", "1") != "0"
+WARMUP_RETRY_S = float(os.getenv("WARMUP_RETRY_S", "5"))
+WARMUP_RETRY_MAX_S = float(os.getenv("WARMUP_RETRY_MAX_S", "300"))
+
+
+def _rag_chain():
+    from app.agents import load_clinical_stack
+    load_clinical_stack()
+
+
+def _embed_query():
+    from app.rag import embed_question
+    embed_question("warm-up: how much fluid should I drink per day?")
+
+
+def _tokenizer():
+    from app.context_packing import CONTEXT_PACKING_ENABLED, load_tokenizer
+    if CONTEXT_PACKING_ENABLED:
+        load_tokenizer()
+
+
+def _intent_model():
+    from app.intent import INTENT_EMBEDDING_FALLBACK, _embedding_classifier
+    if INTENT_EMBEDDING_FALLBACK and _embedding_classifier() is None:
+        raise RuntimeError("intent embedding classifier failed to load")
+
+
+def _rag_chain_loaded() -> bool:
+    rag = sys.modules.get("app.rag")
+    return rag is not None and rag._cached_qa is not None
+
+
+def _intent_model_settled() -> bool:
+    # intent.py gives up after one failed load and serves keyword matching only
+    intent = sys.modules.get("app.intent")
+    return intent is not None and (not intent.INTENT_EMBEDDING_FALLBACK or intent._classifier is not None
+                                   or intent._classifier_failed)
+
+
+def default_checks() -> Dict[str, Callable[[], bool]]:
+    return {"rag_chain": _rag_chain_loaded, "intent_model": _intent_model_settled}
+
+
+def default_steps() -> List[Tuple[str, Callable[[], Any]]]:
+    steps = [("rag_chain", _rag_chain)]
+    if WARMUP_EMBED_QUERY:
+        steps.append(("embed_query", _embed_query))
+    steps.append(("intent_model", _intent_model))
+    # last: without a shipped BPE file tiktoken downloads it, which must not hold up the other steps
+    steps.append(("tokenizer", _tokenizer))
+    return steps
+
+
+class Warmup:
+    """
+    Runs `steps` in order on a daemon thread and records the state and duration of each.
+    A failed step is logged, the remaining steps still run, and failed steps are retried
+    with backoff. `checks` maps a step name to a probe of the state it loads, so a step
+    that failed counts as ready once that state exists.
+    """
+
+    def __init__(self, steps: Optional[List[Tuple[str, Callable[[], Any]]]] = None, enabled: bool = WARMUP_ENABLED,
+                 checks: Optional[Dict[str, Callable[[], bool]]] = None, retry_s: float = WARMUP_RETRY_S,
+                 retry_max_s: float = WARMUP_RETRY_MAX_S):
+        self.steps = default_steps() if steps is None else steps
+        self.checks = default_checks() if checks is None else checks
+        self.enabled = enabled
+        self.retry_s = retry_s
+        self.retry_max_s = retry_max_s
+        self.status: Dict[str, Dict[str, Any]] = {
+            name: {"state": "pending" if enabled else "skipped"} for name, _ in self.steps
+        }
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "Warmup":
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run_step(self, name: str, fn: Callable[[], Any], attempt: int):
+        self.status[name] = {"state": "running", "attempt": attempt}
+        t0 = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            logger.exception("Warm-up step %s failed (attempt %d): %s", name, attempt, e)
+            self.status[name] = {"state": "failed", "error": str(e), "attempt": attempt}
+            return
+        self.status[name] = {"state": "ok", "ms": round((time.perf_counter() - t0) * 1000, 1), "attempt": attempt}
+
+    def run(self):
+        t_all = time.perf_counter()
+        for name, fn in self.steps:
+            self._run_step(name, fn, 1)
+        logger.info("Warm-up finished in %.1fs: %s", time.perf_counter() - t_all,
+                    {name: s["state"] for name, s in self.status.items()})
+
+        attempt, delay = 1, self.retry_s
+        while self.retry_s > 0:
+            failed = [(name, fn) for name, fn in self.steps
+                      if self.status[name]["state"] == "failed" and not self._loaded(name)]
+            if not failed:
+                return
+            time.sleep(delay)
+            attempt += 1
+            delay = min(delay * 2, self.retry_max_s)
+            for name, fn in failed:
+                self._run_step(name, fn, attempt)
+            logger.info("Warm-up retry %d: %s", attempt, {name: self.status[name]["state"] for name, _ in failed})
+
+    def _loaded(self, name: str) -> bool:
+        check = self.checks.get(name)
+        try:
+            return bool(check and check())
+        except Exception:
+            return False
+
+    @property
+    def ready(self) -> bool:
+        return all(s["state"] in ("ok", "skipped") or self._loaded(name) for name, s in self.status.items())
+
+    def report(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "steps": dict(self.status)}
@@ -1,99 +1,361 @@
+"""
+Web search for the clinical agent: Tavily (AI search) and Europe PMC (literature).
+
+Both providers are queried concurrently over pooled HTTP connections and their results
+merged (Tavily first) and de-duplicated. Per provider:
+  - a request still running after WEB_SEARCH_HEDGE_MS is hedged with a second one and
+    the first response wins,
+  - the whole search is capped at WEB_SEARCH_DEADLINE_S,
+  - a circuit breaker stops calling a provider after WEB_BREAKER_FAILURES consecutive
+    failures, for WEB_BREAKER_COOLDOWN_S, so a dead provider adds no latency.
+Non-empty results are cached in SQLite (WEB_CACHE_PATH) by normalized query for
+WEB_CACHE_TTL_S. TAVILY_BASE_URL / EUROPE_PMC_URL can point at local stub servers
+(scripts/stub_search_server.py).
+"""
+import asyncio
+import json
 import os
-from typing import List, Dict
+import re
+import threading
+import time
+import weakref
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from app.db_pool import get_connection
 from app.logger_conf import logger
-from tavily import TavilyClient
-import requests
+from app.metrics import span
 
-#PASTE YOUR API KEY BELOW
+TAVILY_API_KEY = os.getenv("TAVILY_API_KEY", "")
+TAVILY_BASE_URL = os.getenv("TAVILY_BASE_URL", "https://api.tavily.com")
+EUROPE_PMC_URL = os.getenv("EUROPE_PMC_URL", "https://www.ebi.ac.uk/europepmc/webservices/rest/search")
+WEB_SEARCH_TIMEOUT_S = float(os.getenv("WEB_SEARCH_TIMEOUT_S", "10"))  # per HTTP request
+WEB_SEARCH_DEADLINE_S = float(os.getenv("WEB_SEARCH_DEADLINE_S", "8"))  # whole fan-out
+WEB_SEARCH_HEDGE_MS = float(os.getenv("WEB_SEARCH_HEDGE_MS", "1500"))  # 0 = no hedging
+WEB_BREAKER_FAILURES = int(os.getenv("WEB_BREAKER_FAILURES", "3"))
+WEB_BREAKER_COOLDOWN_S = float(os.getenv("WEB_BREAKER_COOLDOWN_S", "60"))
+WEB_CACHE_PATH = os.getenv("WEB_CACHE_PATH", "./data/web_cache.sqlite")
+WEB_CACHE_TTL_S = float(os.getenv("WEB_CACHE_TTL_S", str(6 * 3600)))  # 0 = no cache
+WEB_MAX_RESULTS = 5
 
-TAVILY_API_KEY = "" 
+_HEADERS = {"User-Agent": "Mozilla/5.0"}
+_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
 
+# httpx.AsyncClient is tied to the event loop it first ran on: one pooled client per loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
 
-def tavily_search(query: str) -> List[Dict]:
+
+def _get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(timeout=WEB_SEARCH_TIMEOUT_S, headers=_HEADERS, limits=_LIMITS)
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_clients():
+    """Close the running loop's pooled client (app shutdown, end of a sync call)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _run(coro):
+    # asyncio.run makes a new loop, and with it a new client: close that client before the loop goes
+    async def main():
+        try:
+            return await coro
+        finally:
+            await aclose_clients()
+    return asyncio.run(main())
+
+
+class CircuitBreaker:
     """
-    TIER 1: Professional AI Search (Using Tavily API).
+    Consecutive-failure breaker: open after `failures` in a row, half-open (one trial
+    call) once `cooldown` seconds have passed, closed again on the first success.
     """
-    # Check if key is missing or still default
-    if not TAVILY_API_KEY or "tvly-xxxx" in TAVILY_API_KEY:
-        logger.warning("Tavily API Key is missing or invalid.")
+
+    def __init__(self, name: str, failures: int = WEB_BREAKER_FAILURES, cooldown: float = WEB_BREAKER_COOLDOWN_S):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """Give back a half-open trial that ended without a verdict."""
+        with self._lock:
+            self._trial = False
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self._consecutive = 0
+                self._opened_at = None
+                return
+            self._consecutive += 1
+            if self._consecutive >= self.failures:
+                if self._opened_at is None:
+                    logger.warning("Web search provider %s failing; circuit open for %.0fs", self.name, self.cooldown)
+                self._opened_at = time.monotonic()
+
+
+breakers = {"tavily": CircuitBreaker("tavily"), "europepmc": CircuitBreaker("europepmc")}
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(re.findall(r"[0-9a-z]+", query.lower()))
+
+
+class WebResultCache:
+    """
+    Persistent TTL cache of merged results, keyed by normalized query.
+    """
+
+    def __init__(self, path: str = WEB_CACHE_PATH, ttl: float = WEB_CACHE_TTL_S):
+        self.path = path
+        self.ttl = ttl
+        self._ready = False
+
+    def _conn(self):
+        conn = get_connection(self.path)
+        if not self._ready:
+            conn.execute("CREATE TABLE IF NOT EXISTS web_cache (key TEXT PRIMARY KEY, results TEXT NOT NULL, created REAL NOT NULL)")
+            conn.commit()
+            self._ready = True
+        return conn
+
+    def get(self, query: str) -> Optional[List[Dict]]:
+        if self.ttl <= 0:
+            return None
+        row = self._conn().execute(
+            "SELECT results FROM web_cache WHERE key = ? AND created > ?", (normalize_query(query), time.time() - self.ttl)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, query: str, results: List[Dict]):
+        if self.ttl <= 0 or not results:
+            return
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO web_cache VALUES (?, ?, ?)",
+                     (normalize_query(query), json.dumps(results), time.time()))
+        conn.execute("DELETE FROM web_cache WHERE created <= ?", (time.time() - self.ttl,))
+        conn.commit()
+
+
+web_cache = WebResultCache()
+
+
+def _tavily_results(response: Dict) -> List[Dict]:
+    results = []
+    # 1. If Tavily provides a direct AI answer, add it as the first result
+    if response.get("answer"):
+        results.append({
+            "title": "Direct Answer",
+            "link": "Tavily AI Summary",
+            "snippet": response.get("answer"),
+            "source": "Tavily AI"
+        })
+    # 2. Add the search results
+    for r in response.get("results", []):
+        results.append({
+            "title": r.get("title"),
+            "link": r.get("url"),
+            "snippet": r.get("content"),
+            "source": "Tavily"
+        })
+    return results
+
+
+def _europe_pmc_query(query: str) -> str:
+    return query.lower().replace("latest research on", "").strip()
+
+
+def _europe_pmc_results(data: Dict) -> List[Dict]:
+    hits = data.get("resultList", {}).get("result", [])
+    out = []
+    for h in hits:
+        out.append({
+            "title": h.get("title", "No Title"),
+            "snippet": (h.get("abstractText") or "No abstract.")[:500],
+            "link": f"https://europepmc.org/article/MED/{h.get('pmid', '')}",
+            "source": "EuropePMC"
+        })
+    return out
+
+
+async def _tavily_request(query: str) -> List[Dict]:
+    """
+    TIER 1: Professional AI Search (Tavily REST API). search_depth="basic" is faster and
+    cheaper; include_answer adds a short direct answer.
+    """
+    r = await _get_async_client().post(f"{TAVILY_BASE_URL}/search", json={
+        "api_key": TAVILY_API_KEY, "query": query, "search_depth": "basic",
+        "max_results": WEB_MAX_RESULTS, "include_answer": True,
+    })
+    r.raise_for_status()
+    return _tavily_results(r.json())
+
+
+async def _europe_pmc_request(query: str) -> List[Dict]:
+    """
+    TIER 2: Europe PMC literature search.
+    """
+    params = {"query": _europe_pmc_query(query), "format": "json", "pageSize": WEB_MAX_RESULTS}
+    r = await _get_async_client().get(EUROPE_PMC_URL, params=params)
+    r.raise_for_status()
+    return _europe_pmc_results(r.json())
+
+
+async def _hedged(call: Callable[[], Awaitable[List[Dict]]], hedge_after_s: float) -> List[Dict]:
+    """
+    Run call(); if it hasn't finished after hedge_after_s, start a second call and return
+    whichever succeeds first (the other is cancelled).
+    """
+    tasks = [asyncio.ensure_future(call())]
+    try:
+        if hedge_after_s <= 0:
+            return await tasks[0]
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after_s)
+        if done:
+            return tasks[0].result()
+        tasks.append(asyncio.ensure_future(call()))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # also when the caller is cancelled mid-wait: no request outlives the search
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def _search_provider(name: str, call: Callable[[str], Awaitable[List[Dict]]], query: str) -> List[Dict]:
+    breaker = breakers[name]
+    if not breaker.allow():
+        logger.info("Skipping %s search: circuit %s", name, breaker.state)
         return []
-    
     try:
-        logger.info(f"Attempting Tavily search for: {query}")
-        client = TavilyClient(api_key=TAVILY_API_KEY)
-        
-        # search_depth="basic" is faster and cheaper. Use "advanced" for deep research.
-        response = client.search(
-            query=query, 
-            search_depth="basic", 
-            max_results=5,
-            include_answer=True # Tavily can generate a short direct answer too
-        )
-        
-        results = []
-        
-        # 1. If Tavily provides a direct AI answer, add it as the first result
-        if response.get("answer"):
-            results.append({
-                "title": "Direct Answer",
-                "link": "Tavily AI Summary",
-                "snippet": response.get("answer"),
-                "source": "Tavily AI"
-            })
-
-        # 2. Add the search results
-        for r in response.get("results", []):
-            results.append({
-                "title": r.get("title"),
-                "link": r.get("url"),
-                "snippet": r.get("content"),
-                "source": "Tavily"
-            })
-        return results
+        logger.info("Attempting %s search for: %s", name, query)
+        with span(f"web.{name}"):
+            results = await _hedged(lambda: call(query), WEB_SEARCH_HEDGE_MS / 1000.0)
+    except asyncio.CancelledError:
+        # deadline hit / caller gave up: not the provider's fault
+        breaker.release()
+        raise
     except Exception as e:
-        logger.error(f"Tavily search failed: {e}")
+        breaker.record(False)
+        logger.error("%s search failed: %s", name, e)
         return []
+    breaker.record(True)
+    return results
 
-def europe_pmc_search(query: str) -> List[Dict]:
+
+def _dedupe(results: List[Dict]) -> List[Dict]:
+    """Drop results whose link or title was already seen (the same paper often comes back from both providers)."""
+    seen, out = set(), []
+    for r in results:
+        link = (r.get("link") or "").rstrip("/").lower()
+        keys = {normalize_query(r.get("title") or "")}
+        if link.startswith("http"):
+            keys.add(link)
+        keys.discard("")
+        if keys & seen:
+            continue
+        seen |= keys
+        out.append(r)
+    return out
+
+
+async def atavily_search(query: str) -> List[Dict]:
+    if not TAVILY_API_KEY or "tvly-xxxx" in TAVILY_API_KEY:
+        logger.warning("Tavily API Key is missing or invalid.")
+        return []
+    return await _search_provider("tavily", _tavily_request, query)
+
+
+async def aeurope_pmc_search(query: str) -> List[Dict]:
+    return await _search_provider("europepmc", _europe_pmc_request, query)
+
+
+async def aweb_search_combined(query: str) -> List[Dict]:
     """
-    TIER 2: Europe PMC (Fallback if Tavily quota runs out).
+    Tavily and Europe PMC concurrently, merged (Tavily first) and de-duplicated; whatever
+    has arrived by WEB_SEARCH_DEADLINE_S is returned.
     """
-    clean_q = query.lower().replace("latest research on", "").strip()
-    logger.info(f"Attempting Europe PMC search for: {clean_q}")
-    
+    cached = await asyncio.to_thread(web_cache.get, query)
+    if cached is not None:
+        logger.info("Web search cache hit for: %s", query)
+        return cached
+
+    tasks = [asyncio.ensure_future(atavily_search(query)), asyncio.ensure_future(aeurope_pmc_search(query))]
     try:
-        url = "https://www.ebi.ac.uk/europepmc/webservices/rest/search"
-        params = {"query": clean_q, "format": "json", "pageSize": 5}
-        headers = {"User-Agent": "Mozilla/5.0"} 
-        
-        r = requests.get(url, params=params, headers=headers, timeout=10)
-        if r.status_code != 200: return []
-            
-        data = r.json()
-        hits = data.get("resultList", {}).get("result", [])
-        
-        out = []
-        for h in hits:
-            out.append({
-                "title": h.get("title", "No Title"),
-                "snippet": h.get("abstractText", "No abstract.")[:500],
-                "link": f"https://europepmc.org/article/MED/{h.get('pmid', '')}",
-                "source": "EuropePMC"
-            })
-        return out
-    except Exception as e:
-        logger.error(f"Europe PMC error: {e}")
-        return []
+        done, pending = await asyncio.wait(tasks, timeout=WEB_SEARCH_DEADLINE_S)
+    finally:
+        # deadline hit, or the caller gave up (e.g. the speculative search was cancelled)
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    if pending:
+        logger.warning("Web search deadline (%.1fs) hit; %d provider(s) dropped", WEB_SEARCH_DEADLINE_S, len(pending))
+    merged = []
+    for task in tasks:
+        if task in done and task.exception() is None:
+            merged.extend(task.result())
+    results = _dedupe(merged)
+    await asyncio.to_thread(web_cache.put, query, results)
+    return results
+
+
+def tavily_search(query: str) -> List[Dict]:
+    """
+    TIER 1: Professional AI Search (Using Tavily API).
+    """
+    return _run(atavily_search(query))
+
+
+def europe_pmc_search(query: str) -> List[Dict]:
+    """
+    TIER 2: Europe PMC literature search.
+    """
+    return _run(aeurope_pmc_search(query))
+
 
 def web_search_combined(query: str) -> List[Dict]:
     """
-    Priority: Tavily -> Europe PMC -> Empty
+    Sync entry point for scripts; request handlers use aweb_search_combined.
     """
-    # 1. Try Tavily
-    res = tavily_search(query)
-    if res: 
-        return res
+    return _run(aweb_search_combined(query))
+
 
-    # 2. Fallback to Europe PMC
-    logger.info("Tavily failed or returned no results. Falling back to Europe PMC.")
-    return europe_pmc_search(query)
\ No newline at end of file
+def web_search_stats() -> Dict[str, Dict]:
+    return {name: {"state": b.state, "rejected": b.rejected} for name, b in breakers.items()}
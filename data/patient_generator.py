@@ -2,8 +2,6 @@ import json
 from faker import Faker
 import random
 import os
-fake = Faker()
-os.makedirs('./data', exist_ok=True)
 
 diagnoses = ["Chronic Kidney Disease Stage 3", "Acute Kidney Injury", "Nephrotic Syndrome", "Hypertensive Nephropathy"]
 meds_pool = [
@@ -13,11 +11,9 @@ meds_pool = [
     ["Losartan 50mg daily", "Atorvastatin 20mg nightly"]
 ]
 
-patients = []
-for i in range(30):
-    name = fake.name()
-    p = {
-        "patient_name": name,
+def make_patient(fake: Faker) -> dict:
+    patient = {
+        "patient_name": fake.name(),
         "discharge_date": fake.date_between(start_date='-180d', end_date='today').isoformat(),
         "primary_diagnosis": random.choice(diagnoses),
         "medications": random.choice(meds_pool),
@@ -26,9 +22,23 @@ for i in range(30):
         "warning_signs": "Swelling, shortness of breath, decreased urine output",
         "discharge_instructions": "Monitor blood pressure daily, weigh yourself daily"
     }
-    patients.append(p)
+    # stable source identifier: imports upsert on it, so re-importing an edited record updates it
+    return {"patient_id": fake.uuid4(), **patient}
 
-with open('./data/patients.json', 'w', encoding='utf-8') as f:
-    json.dump(patients, f, indent=2)
+def generate_patients(n: int, seed=None):
+    """Yield `n` synthetic patient records (lazily, so large workloads stay out of memory)."""
+    fake = Faker()
+    if seed is not None:
+        Faker.seed(seed)
+        random.seed(seed)
+    for _ in range(n):
+        yield make_patient(fake)
 
-print("Generated patients.json with", len(patients))
+if __name__ == "__main__":
+    os.makedirs('./data', exist_ok=True)
+    patients = list(generate_patients(30))
+
+    with open('./data/patients.json', 'w', encoding='utf-8') as f:
+        json.dump(patients, f, indent=2)
+
+    print("Generated patients.json with", len(patients))
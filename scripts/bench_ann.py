@@ -0,0 +1,97 @@
+"""
+ANN benchmark: recall@k vs. exact search, p50/p99 single-query latency and index
+memory for the index types in app.ann_index, on a synthetic clustered corpus.
+
+    python scripts/bench_ann.py [--n 1000000] [--dim 384] [--queries 1000] [--k 4]
+                                [--nprobe 8 16 32] [--ef-search 32 64 128]
+
+Vectors are drawn around random cluster centres so IVF cells are meaningful; queries
+are perturbed corpus vectors. Building IVF-PQ/HNSW on 1M x 384 takes a few minutes.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_logs", "bench.log"))
+
+from app.ann_index import apply_search_params, index_nbytes, make_index  # noqa: E402
+
+
+def synthetic_corpus(n, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim), dtype="float32")
+    out = np.empty((n, dim), dtype="float32")
+    step = 100_000
+    for s in range(0, n, step):
+        e = min(n, s + step)
+        out[s:e] = centres[rng.integers(0, clusters, e - s)] + 0.3 * rng.standard_normal((e - s, dim), dtype="float32")
+    return out
+
+
+def measure(index, queries, k):
+    lat = []
+    found = np.empty((len(queries), k), dtype="int64")
+    for i, q in enumerate(queries):
+        t0 = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        lat.append((time.perf_counter() - t0) * 1000)
+        found[i] = ids[0]
+    lat.sort()
+    return found, lat[len(lat) // 2], lat[max(0, int(len(lat) * 0.99) - 1)]
+
+
+def recall(found, truth, k):
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1_000_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--clusters", type=int, default=2000)
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32, 64])
+    ap.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    ap.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads (1 = per-request latency)")
+    args = ap.parse_args()
+    faiss.omp_set_num_threads(args.threads)
+
+    print(f"generating {args.n} x {args.dim} vectors ...")
+    xb = synthetic_corpus(args.n, args.dim, args.clusters)
+    rng = np.random.default_rng(1)
+    xq = xb[rng.choice(args.n, args.queries, replace=False)] + 0.1 * rng.standard_normal((args.queries, args.dim), dtype="float32")
+
+    flat = make_index("flat", xb)
+    truth, p50, p99 = measure(flat, xq, args.k)
+    rows = [("flat", "-", 0.0, 1.0, p50, p99, index_nbytes(flat))]
+
+    for kind, knob, values in (("ivf_flat", "nprobe", args.nprobe), ("ivf_pq", "nprobe", args.nprobe),
+                               ("hnsw", "efSearch", args.ef_search)):
+        t0 = time.perf_counter()
+        index = make_index(kind, xb)
+        build_s = time.perf_counter() - t0
+        size = index_nbytes(index)
+        for v in values:
+            if knob == "nprobe":
+                apply_search_params(index, nprobe=v, ef_search=0)
+            else:
+                apply_search_params(index, nprobe=0, ef_search=v)
+            found, p50, p99 = measure(index, xq, args.k)
+            rows.append((kind, f"{knob}={v}", build_s, recall(found, truth, args.k), p50, p99, size))
+        del index
+
+    print(f"\n{'index':>9} {'param':>13} {'build s':>8} {'recall@' + str(args.k):>9} {'p50 ms':>8} {'p99 ms':>8} {'memory MB':>10}")
+    for kind, param, build_s, rec, p50, p99, size in rows:
+        print(f"{kind:>9} {param:>13} {build_s:>8.1f} {rec:>9.3f} {p50:>8.3f} {p99:>8.3f} {size / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
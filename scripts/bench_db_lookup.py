@@ -0,0 +1,84 @@
+"""
+Micro-benchmark: patient lookups/sec with a fresh connection per call (old behaviour)
+vs. the pooled thread-local connections in app.db_pool, at several worker counts.
+
+    python scripts/bench_db_lookup.py [--db data/patients.db] [--lookups 20000] [--workers 1 8 64]
+
+The source DB is copied to a temp dir first so the WAL switch never touches it.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def lookup_connect_per_call(db_path, name):
+    # verbatim copy of the pre-pool lookup_patient_by_name body
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    try:
+        c.execute("SELECT id, patient_name, data FROM patients WHERE LOWER(patient_name) = ?", (name.lower(),))
+        rows = c.fetchall()
+        if not rows:
+            c.execute("SELECT id, patient_name, data FROM patients WHERE LOWER(patient_name) LIKE ?", (f"%{name.lower()}%",))
+            rows = c.fetchall()
+        return [{"id": r[0], "patient_name": r[1], "data": json.loads(r[2])} for r in rows]
+    finally:
+        conn.close()
+
+
+def run(fn, names, workers, lookups):
+    def task(i):
+        return fn(names[i % len(names)])
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        list(pool.map(task, range(lookups), chunksize=64))
+        elapsed = time.perf_counter() - start
+    return lookups / elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=os.path.join(ROOT, "data", "patients.db"))
+    ap.add_argument("--lookups", type=int, default=20000)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 8, 64])
+    args = ap.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_db_")
+    db_path = os.path.join(tmpdir, "patients.db")
+    shutil.copy(args.db, db_path)
+    os.environ["SQLITE_DB_PATH"] = db_path
+    os.environ.setdefault("LOG_FILE", os.path.join(tmpdir, "logs", "bench.log"))
+
+    from app.logger_conf import logger
+    from app import db_pool, db_tool
+    logger.setLevel(logging.WARNING)
+
+    conn = sqlite3.connect(db_path)
+    names = [r[0] for r in conn.execute("SELECT patient_name FROM patients")]
+    conn.close()
+    # mix exact hits with substring (fallback path) lookups
+    names = names + [n.split()[-1][:4] for n in names]
+
+    print(f"{'workers':>8} {'before (lookups/s)':>20} {'after (lookups/s)':>20} {'speedup':>8}")
+    try:
+        for w in args.workers:
+            before = run(lambda n: lookup_connect_per_call(db_path, n), names, w, args.lookups)
+            after = run(db_tool.lookup_patient_by_name, names, w, args.lookups)
+            print(f"{w:>8} {before:>20.0f} {after:>20.0f} {after / before:>7.1f}x")
+    finally:
+        db_pool.close_all()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Offline embedding throughput benchmark against scripts/stub_embedding_server.py.
+
+Compares the old one-text-per-request sequential path (chunk_size=1) with
+EmbeddingScheduler at a few batch-size / concurrency settings.
+
+    python scripts/bench_embedding.py [--texts 2000] [--latency-ms 50] [--rpm 0]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_logs", "bench.log"))
+
+from stub_embedding_server import start_server  # noqa: E402
+from app.embedding_scheduler import EmbeddingScheduler  # noqa: E402
+from app.logger_conf import logger  # noqa: E402
+
+
+class HttpError(Exception):
+    def __init__(self, err):
+        super().__init__(f"HTTP {err.code}")
+        self.response = err  # exposes .headers (Retry-After) like the openai client errors
+
+
+def http_embed_fn(url):
+    def embed(batch):
+        req = urllib.request.Request(url, data=json.dumps({"input": batch}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=30) as r:
+                data = json.loads(r.read())["data"]
+        except urllib.error.HTTPError as e:
+            raise HttpError(e) from e
+        return [d["embedding"] for d in sorted(data, key=lambda d: d["index"])]
+    return embed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--texts", type=int, default=2000)
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--per-item-ms", type=float, default=0.2)
+    ap.add_argument("--rpm", type=float, default=0, help="server-side limit; the scheduler is given the same quota")
+    args = ap.parse_args()
+    logger.setLevel(logging.ERROR)
+
+    server, stats = start_server(dim=args.dim, latency_ms=args.latency_ms, per_item_ms=args.per_item_ms, rpm=args.rpm)
+    url = f"http://127.0.0.1:{server.server_address[1]}/openai/deployments/stub/embeddings"
+    embed = http_embed_fn(url)
+    texts = [f"chunk {i}: " + "nephrology reference text " * 20 for i in range(args.texts)]
+
+    configs = [("sequential, 1/request (old)", 1, 1), ("batch 16, concurrency 1", 16, 1),
+               ("batch 64, concurrency 4", 64, 4), ("batch 128, concurrency 8", 128, 8)]
+    print(f"{'config':>30} {'texts/s':>10} {'requests':>9} {'429s':>6}")
+    baseline = None
+    for label, bs, conc in configs:
+        n = min(args.texts, 200) if bs == 1 else args.texts  # the old path is slow; sample it
+        before = dict(stats)
+        sched = EmbeddingScheduler(embed, batch_size=bs, max_concurrency=conc, requests_per_min=args.rpm,
+                                   tokens_per_min=0, backoff_base=0.2, progress=False)
+        t0 = time.perf_counter()
+        vectors = sched.embed(texts[:n])
+        rate = n / (time.perf_counter() - t0)
+        assert len(vectors) == n
+        baseline = baseline or rate
+        print(f"{label:>30} {rate:>10.0f} {stats['requests'] - before['requests']:>9} "
+              f"{stats['throttled'] - before['throttled']:>6}   ({rate / baseline:.0f}x)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Load test for app.embedding_worker: query embeddings/sec and latency at increasing
+client concurrency, per-request encoding (what HuggingFaceEmbeddings.embed_query does
+in each request thread) vs the micro-batching EmbeddingWorker.
+
+    python scripts/bench_embedding_worker.py [--model all-MiniLM-L6-v2] [--runtime torch|onnx|onnx-int8]
+    python scripts/bench_embedding_worker.py --fake [--fake-overhead-ms 4] [--fake-per-text-ms 0.4]
+
+--fake replaces the model with a cost model of CPU inference: a forward pass occupies
+the cores (one at a time) for a fixed overhead plus a per-text cost, so it runs without
+sentence-transformers installed.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_logs", "bench.log"))
+
+from app.embedding_worker import EmbeddingWorker, load_sentence_transformer  # noqa: E402
+
+QUESTIONS = [
+    "Can I take ibuprofen for my back pain?", "My ankles are swollen since yesterday",
+    "How much fluid should I drink per day?", "What is a normal potassium level?",
+    "Is it safe to eat bananas with kidney disease?", "Why is my urine foamy?",
+    "Should I skip my water pill before a long drive?", "What are the side effects of dapagliflozin?",
+]
+
+
+def fake_encoder(overhead_ms: float, per_text_ms: float, dim: int = 384):
+    cores = threading.Lock()
+
+    def encode(texts):
+        with cores:
+            time.sleep((overhead_ms + per_text_ms * len(texts)) / 1000.0)
+        return [[float(len(t))] * dim for t in texts]
+    return encode
+
+
+def percentiles(lat):
+    lat = sorted(lat)
+    return [lat[max(0, int(len(lat) * p) - 1)] for p in (0.5, 0.95)]
+
+
+def load(embed_one, clients: int, per_client: int):
+    def client(c):
+        lat = []
+        for i in range(per_client):
+            t0 = time.perf_counter()
+            embed_one(f"{QUESTIONS[(c + i) % len(QUESTIONS)]} ({c}-{i})")
+            lat.append((time.perf_counter() - t0) * 1000)
+        return lat
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        start = time.perf_counter()
+        lat = [ms for part in pool.map(client, range(clients)) for ms in part]
+        elapsed = time.perf_counter() - start
+    return (len(lat) / elapsed, *percentiles(lat))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default="all-MiniLM-L6-v2")
+    ap.add_argument("--runtime", default="torch")
+    ap.add_argument("--fake", action="store_true")
+    ap.add_argument("--fake-overhead-ms", type=float, default=4.0)
+    ap.add_argument("--fake-per-text-ms", type=float, default=0.4)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    ap.add_argument("--per-client", type=int, default=50)
+    ap.add_argument("--max-batch", type=int, default=32)
+    ap.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = ap.parse_args()
+
+    if args.fake:
+        encode = fake_encoder(args.fake_overhead_ms, args.fake_per_text_ms)
+        label = f"fake model ({args.fake_overhead_ms:g} ms + {args.fake_per_text_ms:g} ms/text)"
+    else:
+        model = load_sentence_transformer(args.model, args.runtime)
+        encode = lambda texts: model.encode(texts, batch_size=len(texts), show_progress_bar=False).tolist()  # noqa: E731
+        encode(QUESTIONS)  # first call allocates buffers / compiles kernels
+        label = f"{args.model} ({args.runtime})"
+
+    worker = EmbeddingWorker(encode, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    print(f"{label}, {args.per_client} queries per client, "
+          f"worker max batch {args.max_batch}, max wait {args.max_wait_ms:g} ms\n")
+    print(f"{'clients':>8} {'direct q/s':>11} {'p50 ms':>8} {'p95 ms':>8} {'worker q/s':>11} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'avg batch':>10}")
+    for clients in args.concurrency:
+        direct = load(lambda t: encode([t])[0], clients, args.per_client)
+        before = worker.stats()
+        batched = load(worker.embed, clients, args.per_client)
+        after = worker.stats()
+        avg_batch = (after["texts"] - before["texts"]) / max(1, after["batches"] - before["batches"])
+        print(f"{clients:>8} {direct[0]:>11.0f} {direct[1]:>8.1f} {direct[2]:>8.1f} "
+              f"{batched[0]:>11.0f} {batched[1]:>8.1f} {batched[2]:>8.1f} {avg_batch:>10.1f}")
+    worker.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Cold-start import cost of the API, measured with `python -X importtime` in fresh
+interpreters, plus a check that the receptionist path never loads the ML stack:
+
+    python scripts/bench_import_time.py [--runs 5] [--max-ms 800] [--top 10]
+
+Reports the median cumulative import time of app.main and the packages that cost the
+most (self time summed per top-level package). Exits with status 1 when the median is
+above --max-ms, or when importing app.main or serving a receptionist conversation
+imports any of HEAVY_PACKAGES, so it can be used as a regression gate.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# loaded by the clinical path only (app.rag, app.semantic_cache, app.web_search)
+HEAVY_PACKAGES = ("langchain", "langchain_core", "langchain_openai", "langchain_community", "langchain_classic",
+                  "faiss", "numpy", "torch", "transformers", "sentence_transformers", "httpx", "nltk")
+
+RECEPTIONIST_SCRIPT = """
+import json, sys
+import app.main
+from app.agents import receptionist_handle_message
+from app.db_tool import DB_PATH, get_connection
+name = get_connection(DB_PATH).execute("SELECT patient_name FROM patients LIMIT 1").fetchone()[0]
+session = {}
+for message in ("hi", name, "thanks, all good", "I have some leg swelling"):
+    receptionist_handle_message(session, message)
+print(json.dumps(sorted(m for m in sys.modules if m.split(".")[0] in %r)))
+"""
+
+
+def parse_importtime(stderr: str):
+    """[(self_us, cumulative_us, module)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        head, cumulative_us, name = line.split("|", 2)
+        rows.append((int(head.split(":")[1]), int(cumulative_us), name.strip()))
+    return rows
+
+
+def run_import(env, module: str):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=ROOT, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{out.stderr[-2000:]}")
+    return parse_importtime(out.stderr)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--module", default="app.main")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--max-ms", type=float, default=800.0)
+    ap.add_argument("--top", type=int, default=10)
+    args = ap.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_import_")
+    db_path = os.path.join(tmpdir, "patients.db")
+    shutil.copy(os.path.join(ROOT, "data", "patients.db"), db_path)
+    env = dict(os.environ, LOG_FILE=os.path.join(tmpdir, "logs", "bench.log"), SQLITE_DB_PATH=db_path,
+               LOG_CONSOLE_LEVEL="WARNING", PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])))
+
+    totals, runs = [], []
+    for _ in range(args.runs):
+        rows = run_import(env, args.module)
+        total = next(cum for _, cum, name in rows if name == args.module)
+        totals.append(total / 1000)
+        runs.append(rows)
+    median_ms = statistics.median(totals)
+
+    per_package = defaultdict(int)
+    for self_us, _, name in runs[-1]:
+        per_package[name.split(".")[0]] += self_us
+    heavy_on_import = sorted({name.split(".")[0] for _, _, name in runs[-1]} & set(HEAVY_PACKAGES))
+
+    out = subprocess.run([sys.executable, "-c", RECEPTIONIST_SCRIPT % (HEAVY_PACKAGES,)],
+                         cwd=ROOT, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise SystemExit(f"receptionist check failed:\n{out.stderr[-2000:]}")
+    heavy_on_receptionist = sorted({m.split(".")[0] for m in json.loads(out.stdout.strip().splitlines()[-1])})
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print(f"import {args.module}: median {median_ms:.0f} ms over {args.runs} runs "
+          f"(min {min(totals):.0f}, max {max(totals):.0f}); threshold {args.max_ms:.0f} ms\n")
+    print(f"{'package':>24} {'self ms':>9}")
+    for name, us in sorted(per_package.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"{name:>24} {us / 1000:>9.1f}")
+    print(f"\nheavy packages imported by {args.module}: {heavy_on_import or 'none'}")
+    print(f"heavy packages imported by a receptionist conversation: {heavy_on_receptionist or 'none'}")
+
+    failed = median_ms > args.max_ms or heavy_on_import or heavy_on_receptionist
+    if failed:
+        print("\nFAIL: import time regression")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
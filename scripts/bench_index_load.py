@@ -0,0 +1,128 @@
+"""
+Startup time and per-worker memory of the two index formats:
+
+    pickle  FAISS.load_local (index.faiss read into RAM + pickled docstore)
+    mmap    app.mmap_store (memory-mapped index.faiss + SQLite chunk store)
+
+Starts --workers processes per format (like uvicorn workers), each loads the index and
+runs a few searches; once all are loaded each reports load time, RSS and PSS (PSS splits
+shared pages between the processes mapping them, so it shows page-cache sharing).
+
+    python scripts/bench_index_load.py --index-dir data/faiss_index/v00001 --workers 4
+    python scripts/bench_index_load.py --synthetic 200000 --dim 1536 --workers 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_logs", "bench.log"))
+
+
+def _memory_kb():
+    out = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    out[key.lower()] = int(rest.split()[0])
+    except FileNotFoundError:
+        import resource
+        out["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return out
+
+
+def _random_embeddings(dim):
+    import numpy as np
+    from langchain_core.embeddings import Embeddings
+
+    class RandomEmbeddings(Embeddings):
+        def embed_documents(self, texts):
+            return [self.embed_query(t) for t in texts]
+
+        def embed_query(self, text):
+            return np.random.default_rng(abs(hash(text)) % 2**32).standard_normal(dim).astype("float32").tolist()
+
+    return RandomEmbeddings()
+
+
+def child(mode, index_dir, dim):
+    t0 = time.perf_counter()
+    from langchain_community.vectorstores import FAISS
+    embeddings = _random_embeddings(dim)
+    if mode == "mmap":
+        from app.mmap_store import load_mmap_vectorstore
+        vs = load_mmap_vectorstore(index_dir, embeddings)
+    else:
+        vs = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+    load_s = time.perf_counter() - t0
+    for i in range(50):
+        vs.similarity_search(f"query {i}", k=4)
+    print(json.dumps({"load_s": load_s}), flush=True)
+    sys.stdin.readline()  # wait until every worker has loaded, then measure
+    print(json.dumps(_memory_kb()), flush=True)
+
+
+def build_synthetic(n, dim, out_dir):
+    import numpy as np
+    from langchain_community.vectorstores import FAISS
+    from app.mmap_store import export_chunk_store
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((n, dim), dtype="float32")
+    texts = [f"synthetic chunk {i} " + "renal physiology " * 40 for i in range(n)]
+    metas = [{"source": "synthetic.pdf", "page": i // 10} for i in range(n)]
+    vs = FAISS.from_embeddings(list(zip(texts, vectors.tolist())), _random_embeddings(dim), metadatas=metas)
+    vs.save_local(out_dir)
+    export_chunk_store(vs, out_dir)
+
+
+def run(mode, index_dir, dim, workers):
+    procs = [subprocess.Popen([sys.executable, __file__, "--child", mode, "--index-dir", index_dir, "--dim", str(dim)],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) for _ in range(workers)]
+    loads = [json.loads(p.stdout.readline())["load_s"] for p in procs]
+    mems = []
+    for p in procs:
+        p.stdin.write("\n")
+        p.stdin.flush()
+    for p in procs:
+        mems.append(json.loads(p.stdout.readline()))
+        p.wait()
+    return loads, mems
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index-dir")
+    ap.add_argument("--synthetic", type=int, default=0, help="build a synthetic index with this many chunks")
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--child", choices=["pickle", "mmap"])
+    args = ap.parse_args()
+
+    if args.child:
+        return child(args.child, args.index_dir, args.dim)
+
+    index_dir = args.index_dir
+    if args.synthetic:
+        index_dir = tempfile.mkdtemp(prefix="bench_index_")
+        print(f"building synthetic index ({args.synthetic} x {args.dim}) in {index_dir} ...")
+        build_synthetic(args.synthetic, args.dim, index_dir)
+    if not index_dir:
+        ap.error("--index-dir or --synthetic is required")
+
+    print(f"{'format':>7} {'load s (avg)':>13} {'RSS MB/worker':>14} {'PSS MB/worker':>14} {'PSS MB total':>13}")
+    for mode in ("pickle", "mmap"):
+        loads, mems = run(mode, index_dir, args.dim, args.workers)
+        rss = sum(m.get("rss", 0) for m in mems) / len(mems) / 1024
+        pss = [m.get("pss", 0) / 1024 for m in mems]
+        print(f"{mode:>7} {sum(loads) / len(loads):>13.2f} {rss:>14.0f} {sum(pss) / len(pss):>14.0f} {sum(pss):>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Intent classification throughput and accuracy on data/intent_eval.jsonl:
+
+    legacy    the former is_clinical_question: one `k in text` scan per keyword list
+    intent    app.intent.classify_intent: kind, clinical and wants_latest from one phrase table
+
+    python scripts/bench_intent.py [--repeat 2000]
+
+Reports messages/sec for each, whether they agree on every labeled message, and the
+accuracy of classify_intent's clinical flag and kind.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_logs", "bench.log"))
+
+from app.intent import classify_intent  # noqa: E402
+
+CLINICAL = ["pain", "swelling", "shortness of breath", "dyspnea", "urine", "medication", "dose", "fever",
+            "bleeding", "worsen", "dizziness", "edema", "leg swelling", "ankle swelling", "fluid retention"]
+RESEARCH = ["latest", "recent", "research", "study", "studies", "trial", "evidence", "meta-analysis",
+            "systematic review", "what's new", "what is new", "guidelines", "safety", "side effects"]
+DRUGS = ["sglt2", "sglt2i", "sglt2 inhibitor", "dapagliflozin", "empagliflozin", "canagliflozin", "ertugliflozin"]
+PREFIXES = ("should i", "what should i", "do i need", "is it ok", "is it safe")
+
+
+def legacy_is_clinical(text):
+    if not text:
+        return False
+    textl = text.lower()
+    for triggers in (CLINICAL, RESEARCH, DRUGS):
+        if any(k in textl for k in triggers):
+            return True
+    return textl.strip().startswith(PREFIXES)
+
+
+def intent_is_clinical(text):
+    return classify_intent(text).clinical
+
+
+def throughput(fn, texts, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for t in texts:
+            fn(t)
+    return repeat * len(texts) / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--eval", default=os.path.join(ROOT, "data", "intent_eval.jsonl"))
+    ap.add_argument("--repeat", type=int, default=2000)
+    args = ap.parse_args()
+
+    with open(args.eval, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    texts = [r["text"] for r in rows]
+
+    disagree = [t for t in texts if legacy_is_clinical(t) != intent_is_clinical(t)]
+    clinical_ok = sum(intent_is_clinical(r["text"]) == r["clinical"] for r in rows)
+    kind_ok = sum(classify_intent(r["text"]).kind == r["kind"] for r in rows)
+
+    print(f"{len(rows)} labeled messages x {args.repeat}\n")
+    print(f"{'classifier':>10} {'msgs/s':>12}")
+    strategies = (("legacy", legacy_is_clinical), ("intent", intent_is_clinical))
+    for name, fn in strategies:
+        print(f"{name:>10} {throughput(fn, texts, args.repeat):>12,.0f}")
+    print(f"\nclinical accuracy {clinical_ok}/{len(rows)}, kind accuracy {kind_ok}/{len(rows)}, "
+          f"disagreements with legacy: {len(disagree)}")
+    for t in disagree:
+        print(f"  {t!r}")
+
+
+if __name__ == "__main__":
+    main()
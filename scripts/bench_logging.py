@@ -0,0 +1,122 @@
+"""
+Receptionist request latency with logging off, with the previous synchronous
+RotatingFileHandler, and with the queue-based pipeline in app.logger_conf:
+
+    python scripts/bench_logging.py [--requests 5000] [--workers 8] [--slow-disk-ms 2]
+
+Each request is one receptionist_handle_message call (patient lookup + its log lines).
+--slow-disk-ms adds that much delay to every flush of the log file, like a busy or
+network-backed volume: the synchronous handler pays it on the request thread for every
+record, the queue pipeline on its writer thread once per batch. Console output is left
+out in all modes.
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import RotatingFileHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+TMPDIR = tempfile.mkdtemp(prefix="bench_logging_")
+os.environ["LOG_FILE"] = os.path.join(TMPDIR, "queue", "system.log")
+os.environ["LOG_CONSOLE_LEVEL"] = "CRITICAL"
+# work on a copy so the benchmark never touches data/patients.db
+os.environ["SQLITE_DB_PATH"] = os.path.join(TMPDIR, "patients.db")
+shutil.copy(os.path.join(ROOT, "data", "patients.db"), os.environ["SQLITE_DB_PATH"])
+
+from app import logger_conf  # noqa: E402
+from app.agents import receptionist_handle_message  # noqa: E402
+from app.db_tool import DB_PATH, get_connection  # noqa: E402
+
+
+class SlowFile:
+    """File wrapper whose flush() takes `delay` seconds longer."""
+
+    def __init__(self, f, delay: float):
+        self._f = f
+        self.delay = delay
+
+    def flush(self):
+        if self.delay:
+            time.sleep(self.delay)
+        self._f.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+def percentiles(lat):
+    lat = sorted(lat)
+    return [lat[max(0, int(len(lat) * p) - 1)] for p in (0.5, 0.95, 0.99)]
+
+
+def run(names, requests, workers):
+    def request(i):
+        session = {"stage": "awaiting_name"}
+        t0 = time.perf_counter()
+        receptionist_handle_message(session, names[i % len(names)])
+        return (time.perf_counter() - t0) * 1000
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        lat = list(pool.map(request, range(requests)))
+        elapsed = time.perf_counter() - start
+    return (requests / elapsed, *percentiles(lat))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--slow-disk-ms", type=float, default=0.0)
+    args = ap.parse_args()
+    delay = args.slow_disk_ms / 1000.0
+
+    logger = logger_conf.logger
+    queue_handler = logger_conf._queue_handler
+    queue_file = logger_conf._listener.handlers[0]
+    queue_file.stream = SlowFile(queue_file.stream, delay)
+
+    # the previous configuration: text lines, one write + flush per record on the caller's thread
+    os.makedirs(os.path.join(TMPDIR, "sync"))
+    sync_handler = RotatingFileHandler(os.path.join(TMPDIR, "sync", "system.log"), maxBytes=5*1024*1024, backupCount=5)
+    sync_handler.setFormatter(logger_conf.text_formatter())
+    sync_handler.stream = SlowFile(sync_handler.stream, delay)
+
+    names = [r[0] for r in get_connection(DB_PATH).execute("SELECT patient_name FROM patients")]
+    run(names, 200, args.workers)  # warm the connection pool and patient cache
+
+    rows = []
+    try:
+        logger.disabled = True
+        rows.append(("off", *run(names, args.requests, args.workers)))
+        logger.disabled = False
+
+        logger.removeHandler(queue_handler)
+        logger.addHandler(sync_handler)
+        rows.append(("sync file", *run(names, args.requests, args.workers)))
+        logger.removeHandler(sync_handler)
+
+        logger.addHandler(queue_handler)
+        rows.append(("queue", *run(names, args.requests, args.workers)))
+        t0 = time.perf_counter()
+        logger_conf.stop_logging()
+        drain_ms = (time.perf_counter() - t0) * 1000
+    finally:
+        sync_handler.close()
+
+    print(f"{args.requests} requests, {args.workers} workers, +{args.slow_disk_ms:.1f} ms per log flush\n")
+    print(f"{'logging':>10} {'req/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, rps, p50, p95, p99 in rows:
+        print(f"{name:>10} {rps:>10.0f} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f}")
+    print(f"\nqueue pipeline: {logger_conf.log_stats()}, drained {drain_ms:.0f} ms after the last request")
+    shutil.rmtree(TMPDIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
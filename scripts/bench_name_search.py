@@ -0,0 +1,107 @@
+"""
+Benchmark: patient name lookups on a large synthetic table, comparing the old
+LOWER()/LIKE '%x%' scans with the name_norm index + trigram FTS5 path in app.db_tool.
+
+    python scripts/bench_name_search.py [--rows 1000000] [--queries 200] [--keep PATH]
+
+Rows come from data/patient_generator.py; generating 1M records with Faker takes a few minutes.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+OLD_EXACT = "SELECT id, patient_name, data FROM patients WHERE LOWER(patient_name) = ?"
+OLD_FUZZY = "SELECT id, patient_name, data FROM patients WHERE LOWER(patient_name) LIKE ?"
+
+
+def build_table(db_path, rows, batch=10000):
+    from data.patient_generator import generate_patients
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE patients (id INTEGER PRIMARY KEY AUTOINCREMENT, patient_name TEXT, data JSON)")
+    buf = []
+    start = time.perf_counter()
+    for p in generate_patients(rows, seed=42):
+        buf.append((p["patient_name"], json.dumps(p)))
+        if len(buf) >= batch:
+            conn.executemany("INSERT INTO patients (patient_name, data) VALUES (?, ?)", buf)
+            buf.clear()
+    if buf:
+        conn.executemany("INSERT INTO patients (patient_name, data) VALUES (?, ?)", buf)
+    conn.commit()
+    conn.close()
+    print(f"generated {rows} patients in {time.perf_counter() - start:.1f}s")
+
+
+def old_lookup(conn, name):
+    rows = conn.execute(OLD_EXACT, (name.lower(),)).fetchall()
+    if not rows:
+        rows = conn.execute(OLD_FUZZY, (f"%{name.lower()}%",)).fetchall()
+    return rows
+
+
+def timed(fn, queries):
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        lat.append((time.perf_counter() - t0) * 1000)
+    lat.sort()
+    return lat[len(lat) // 2], lat[int(len(lat) * 0.99) - 1 if len(lat) > 1 else 0]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--keep", help="reuse / keep the generated DB at this path")
+    args = ap.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_names_")
+    db_path = args.keep or os.path.join(tmpdir, "patients.db")
+    os.environ["SQLITE_DB_PATH"] = db_path
+    os.environ.setdefault("LOG_FILE", os.path.join(tmpdir, "logs", "bench.log"))
+    if not os.path.exists(db_path):
+        build_table(db_path, args.rows)
+
+    conn = sqlite3.connect(db_path)
+    names = [r[0] for r in conn.execute(
+        "SELECT patient_name FROM patients WHERE id IN (SELECT abs(random()) % (SELECT max(id) FROM patients) + 1 FROM patients LIMIT ?)",
+        (args.queries,))]
+    rnd = random.Random(7)
+    workloads = {
+        "exact": names,
+        "substring": [n.split()[-1][: rnd.randint(4, 6)] for n in names],
+        "miss": [f"zz{rnd.randint(0, 10**6)}qx" for _ in names],
+    }
+
+    from app.logger_conf import logger
+    from app import db_pool, db_tool
+    logger.setLevel(logging.WARNING)
+
+    print(f"{'workload':>10} {'old p50 ms':>11} {'old p99 ms':>11} {'new p50 ms':>11} {'new p99 ms':>11}")
+    try:
+        old = {k: timed(lambda q: old_lookup(conn, q), v) for k, v in workloads.items()}
+        t0 = time.perf_counter()
+        db_tool._ensure_ready()
+        print(f"(schema migration / FTS build: {time.perf_counter() - t0:.1f}s)")
+        for k, v in workloads.items():
+            new = timed(db_tool.lookup_patient_by_name, v)
+            print(f"{k:>10} {old[k][0]:>11.2f} {old[k][1]:>11.2f} {new[0]:>11.2f} {new[1]:>11.2f}")
+    finally:
+        conn.close()
+        db_pool.close_all()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
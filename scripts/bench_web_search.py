@@ -0,0 +1,87 @@
+"""
+Web search latency against the local stub servers (scripts/stub_search_server.py):
+
+    sequential  Tavily, then Europe PMC only if Tavily failed (the previous behaviour)
+    fan-out     app.web_search.aweb_search_combined: concurrent, hedged, circuit-broken
+
+    python scripts/bench_web_search.py [--queries 200] [--latency-ms 100] [--slow-rate 0.05]
+                                       [--tavily-down]
+
+--tavily-down points Tavily at a closed port to show the breaker taking it out of the path.
+The result cache is disabled so every query goes to the providers.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_logs", "bench.log"))
+
+from stub_search_server import PMC_PATH, start_server  # noqa: E402
+
+
+def percentiles(lat):
+    lat = sorted(lat)
+    return [lat[max(0, int(len(lat) * p) - 1)] for p in (0.5, 0.95, 0.99)]
+
+
+async def run(search, queries):
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter()
+        await search(q)
+        lat.append((time.perf_counter() - t0) * 1000)
+    return percentiles(lat)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--latency-ms", type=float, default=100.0)
+    ap.add_argument("--slow-rate", type=float, default=0.05)
+    ap.add_argument("--hedge-ms", type=float, default=250.0)
+    ap.add_argument("--tavily-down", action="store_true")
+    args = ap.parse_args()
+
+    server, stats = start_server(latency_ms=args.latency_ms, slow_rate=args.slow_rate)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.update({
+        "TAVILY_API_KEY": "stub",
+        "TAVILY_BASE_URL": "http://127.0.0.1:9" if args.tavily_down else base,
+        "EUROPE_PMC_URL": base + PMC_PATH,
+        "WEB_SEARCH_HEDGE_MS": str(args.hedge_ms),
+        "WEB_CACHE_TTL_S": "0",
+    })
+    from app import web_search as ws
+
+    async def sequential(q):
+        # previous behaviour: one provider after the other, no hedging, no breaker
+        try:
+            res = await ws._tavily_request(q)
+        except Exception:
+            res = []
+        if not res:
+            res = await ws._europe_pmc_request(q)
+        return res
+
+    queries = [f"sglt2 inhibitor question {i}" for i in range(args.queries)]
+    rows = []
+    for name, fn in (("sequential", sequential), ("fan-out", ws.aweb_search_combined)):
+        rows.append((name, *asyncio.run(run(fn, queries))))
+
+    print(f"{args.queries} queries, stub latency {args.latency_ms:.0f} ms, slow rate {args.slow_rate:.0%}"
+          f"{', Tavily down' if args.tavily_down else ''}\n")
+    print(f"{'strategy':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, p50, p95, p99 in rows:
+        print(f"{name:>10} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f}")
+    print(f"\nstub requests: {stats}; breakers: {ws.web_search_stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
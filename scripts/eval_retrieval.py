@@ -0,0 +1,101 @@
+"""
+Offline retrieval evaluation: hit rate, MRR and latency of dense, BM25, hybrid (RRF) and
+hybrid + cross-encoder rerank retrieval over the live index.
+
+    python scripts/eval_retrieval.py [--queries data/retrieval_eval.jsonl] [--k 4] [--rerank]
+
+Each line of the query set is {"query": ..., "expect": [terms]}; a retrieved chunk is
+relevant when it contains any expected term (case-insensitive). Query embeddings are
+computed once up front (and cached), so latencies compare retrieval rather than the
+embedding backend; pass --cold to include embedding time in the first configuration.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_logs", "bench.log"))
+
+from app.corpus import resolve_index_dir  # noqa: E402
+from app.rag import INDEX_PATH, load_vectorstore  # noqa: E402
+from app.retrieval import make_retriever  # noqa: E402
+
+
+def load_queries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def first_relevant_rank(docs, expect):
+    terms = [t.lower() for t in expect]
+    for rank, doc in enumerate(docs, start=1):
+        text = doc.page_content.lower()
+        if any(t in text for t in terms):
+            return rank
+    return 0
+
+
+def evaluate(retriever, queries):
+    ranks, lat = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        docs = retriever.invoke(q["query"])
+        lat.append((time.perf_counter() - t0) * 1000)
+        ranks.append(first_relevant_rank(docs, q["expect"]))
+    lat.sort()
+    n = len(queries)
+    return {
+        "hit_rate": sum(1 for r in ranks if r) / n,
+        "mrr": sum(1.0 / r for r in ranks if r) / n,
+        "p50_ms": lat[n // 2],
+        "p95_ms": lat[max(0, int(n * 0.95) - 1)],
+        "misses": [q["query"] for q, r in zip(queries, ranks) if not r],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--queries", default=os.path.join(ROOT, "data", "retrieval_eval.jsonl"))
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--rerank", action="store_true", help="also evaluate hybrid + cross-encoder rerank")
+    ap.add_argument("--cold", action="store_true", help="don't pre-embed the queries")
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    queries = load_queries(args.queries)
+    vs = load_vectorstore()
+    index_dir = resolve_index_dir(INDEX_PATH)
+    if not args.cold:
+        for q in queries:
+            vs.embedding_function.embed_query(q["query"])
+
+    configs = [("dense", "dense", False), ("bm25", "bm25", False), ("hybrid", "hybrid", False)]
+    if args.rerank:
+        configs.append(("hybrid+rerank", "hybrid", True))
+    results = {}
+    for name, mode, rerank in configs:
+        retriever = make_retriever(vs, index_dir, mode=mode, rerank=rerank)
+        if hasattr(retriever, "search_kwargs"):
+            retriever.search_kwargs["k"] = args.k
+        else:
+            retriever.k = args.k
+        results[name] = evaluate(retriever, queries)
+
+    print(f"{len(queries)} queries, k={args.k}, index {index_dir}\n")
+    print(f"{'retriever':>14} {'hit@' + str(args.k):>7} {'MRR':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, r in results.items():
+        print(f"{name:>14} {r['hit_rate']:>7.2f} {r['mrr']:>6.2f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
+    for name, r in results.items():
+        if r["misses"]:
+            print(f"\n{name} misses: " + "; ".join(r["misses"]))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Download the tiktoken BPE file used for context packing into the directory the API reads
+it from, so it can be shipped with the app (offline / air-gapped deploys):
+
+    python scripts/fetch_tokenizer.py [--encoding cl100k_base] [--dir data/tiktoken_cache]
+
+The API loads the encoding from TIKTOKEN_CACHE_DIR (default data/tiktoken_cache) during
+the startup warm-up; without the file it counts tokens as 4 characters each.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_logs", "bench.log"))
+
+
+def main():
+    from app.context_packing import CONTEXT_TOKENIZER, TOKENIZER_CACHE_DIR
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--encoding", default=CONTEXT_TOKENIZER)
+    ap.add_argument("--dir", default=os.getenv("TIKTOKEN_CACHE_DIR", TOKENIZER_CACHE_DIR))
+    args = ap.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    os.environ["TIKTOKEN_CACHE_DIR"] = args.dir
+    import tiktoken
+    enc = tiktoken.get_encoding(args.encoding)
+    print(f"{args.encoding}: {enc.n_vocab} tokens, cached in {args.dir}: {sorted(os.listdir(args.dir))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,36 @@
-import sqlite3, json, os
+import argparse, os, sys
 from dotenv import load_dotenv
 load_dotenv()
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.db_pool import close_all
+from app.ingest import ingest_patients
+
 # Use env path if present else default to project-root/data/patients.db
 DB_PATH = os.getenv("SQLITE_DB_PATH", "./data/patients.db")
 JSON_PATH = os.getenv("PATIENTS_JSON_PATH", "./data/patients.json")
 
+ap = argparse.ArgumentParser(description="Load patients (JSON array or JSONL) into the SQLite DB.")
+ap.add_argument("json_path", nargs="?", default=JSON_PATH)
+ap.add_argument("--batch-size", type=int, default=None)
+ap.add_argument("--force", action="store_true", help="re-import even if the file hash is unchanged")
+args = ap.parse_args()
+
 print("Project working dir:", os.getcwd())
 print("DB will be created at:", DB_PATH)
-print("JSON source:", JSON_PATH)
-
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-
-if not os.path.exists(JSON_PATH):
-    raise SystemExit(f"ERROR: patients.json not found at {JSON_PATH}. Run your patient generator first.")
-
-conn = sqlite3.connect(DB_PATH)
-c = conn.cursor()
-c.execute("""
-CREATE TABLE IF NOT EXISTS patients (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    patient_name TEXT,
-    data TEXT
-);
-""")
-conn.commit()
-
-with open(JSON_PATH, "r", encoding="utf-8") as f:
-    patients = json.load(f)
-
-inserted = 0
-for p in patients:
-    pname = p.get("patient_name", "").strip()
-    if not pname:
-        continue
-    # avoid duplicates
-    cur = c.execute("SELECT COUNT(1) FROM patients WHERE patient_name = ?", (pname,)).fetchone()
-    if cur and cur[0] > 0:
-        continue
-    c.execute("INSERT INTO patients (patient_name, data) VALUES (?, ?)", (pname, json.dumps(p)))
-    inserted += 1
-
-conn.commit()
-conn.close()
-print(f"Done. Inserted {inserted} records into {DB_PATH}")
+print("JSON source:", args.json_path)
+
+if not os.path.exists(args.json_path):
+    raise SystemExit(f"ERROR: patients file not found at {args.json_path}. Run your patient generator first.")
+
+try:
+    stats = ingest_patients(args.json_path, DB_PATH, batch_size=args.batch_size, force=args.force)
+finally:
+    close_all()
+
+if stats["skipped"]:
+    print(f"Done. {args.json_path} unchanged since last import; nothing to do (use --force to reload).")
+else:
+    print(f"Done. Read {stats['read']} records, inserted/updated {stats['changed']} "
+          f"({stats['skipped_invalid']} without a name, {stats['missing_id']} without an id) into {DB_PATH} "
+          f"in {stats['seconds']:.2f}s ({stats['rows_per_sec']:.0f} rows/sec)")
@@ -0,0 +1,316 @@
+"""
+Offline load test of the API: concurrent patient sessions (scripts/workload.py) against
+/receptionist/message, /clinical/query and /clinical/stream, with Azure OpenAI, Tavily
+and Europe PMC replaced by the local stubs.
+
+    python scripts/load_test.py --spawn [--index data/faiss_index] [--sessions 300] [--concurrency 32]
+                                [--ttft-ms 300] [--per-token-ms 15] [--search-latency-ms 120]
+                                [--json run.json] [--baseline previous.json --max-regression 20]
+    python scripts/load_test.py --url http://127.0.0.1:8000 [--patients-file data/patients.json]
+
+--spawn starts scripts/stub_llm_server.py (chat + embeddings) and stub_search_server.py
+in-process, and uvicorn app.main:app in a subprocess whose DB, caches and logs live in a
+temp directory. Unless --index is given, a FAISS index is first built from --corpus with
+the stub embeddings. The driver waits for /health/ready. Patients come from
+data/patient_generator.py. --url drives an API that is already running; its patients must
+include --patients-file. --questions 0 sends receptionist traffic only.
+
+Reported per endpoint: requests/s, p50/p95/p99 latency and error rate (HTTP or transport
+errors, `error` in the response, or a stream that ends in an error event). Per stage: the
+spans of each response's Server-Timing header (db.lookup_patient, embedding.query,
+retriever.search, llm.generate, web.*). /clinical/stream sends its headers before the
+answer, so for it the driver records time to first token (stream.ttft) instead.
+With --baseline, exits with status 1 when an endpoint's p95 or throughput is more than
+--max-regression percent worse, or its error rate rose by more than a point.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+import stub_llm_server  # noqa: E402
+import stub_search_server  # noqa: E402
+from workload import CLINICAL_STREAM, generate_patients, generate_sessions  # noqa: E402
+
+
+def percentiles(lat):
+    lat = sorted(lat)
+    return [lat[max(0, int(len(lat) * p) - 1)] if lat else 0.0 for p in (0.5, 0.95, 0.99)]
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    out = {}
+    for part in filter(None, (p.strip() for p in header.split(","))):
+        name, _, params = part.partition(";")
+        if params.startswith("dur="):
+            out[name] = float(params[4:])
+    return out
+
+
+class Results:
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.stages: Dict[str, List[float]] = defaultdict(list)
+
+
+async def _stream(client: httpx.AsyncClient, body: Dict, t0: float, results: Results) -> Optional[str]:
+    async with client.stream("POST", CLINICAL_STREAM, json=body) as r:
+        if r.status_code != 200:
+            await r.aread()
+            return f"http_{r.status_code}"
+        last = None
+        async for line in r.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if event.get("type") == "token" and last is None:
+                results.stages["stream.ttft"].append((time.perf_counter() - t0) * 1000)
+            last = event
+    if last is None or last.get("type") == "error":
+        return "stream_error"
+    return None
+
+
+async def run_step(client: httpx.AsyncClient, session_id: str, step: Dict, results: Results):
+    endpoint = step["endpoint"]
+    body = {"session_id": session_id, "message": step["message"]}
+    t0 = time.perf_counter()
+    try:
+        if endpoint == CLINICAL_STREAM:
+            error = await _stream(client, body, t0, results)
+        else:
+            r = await client.post(endpoint, json=body)
+            error = f"http_{r.status_code}" if r.status_code != 200 else ("app_error" if r.json().get("error") else None)
+            for name, ms in parse_server_timing(r.headers.get("server-timing", "")).items():
+                if name != "total":
+                    results.stages[name].append(ms)
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+    results.latency[endpoint].append((time.perf_counter() - t0) * 1000)
+    if error:
+        results.errors[endpoint][error] += 1
+
+
+async def run_sessions(url: str, sessions: List[Dict], concurrency: int, timeout_s: float) -> Tuple[Results, float]:
+    """Replay `sessions` with at most `concurrency` in flight; steps of a session run in order."""
+    results = Results()
+    queue: asyncio.Queue = asyncio.Queue()
+    for s in sessions:
+        queue.put_nowait(s)
+
+    async def worker(client):
+        while not queue.empty():
+            session = queue.get_nowait()
+            for step in session["steps"]:
+                await run_step(client, session["session_id"], step, results)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout_s, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def summarize(results: Results, elapsed: float) -> Dict:
+    endpoints = {}
+    for endpoint, lat in sorted(results.latency.items()):
+        p50, p95, p99 = percentiles(lat)
+        errors = dict(results.errors.get(endpoint, {}))
+        endpoints[endpoint] = {"requests": len(lat), "rps": round(len(lat) / elapsed, 2), "p50_ms": round(p50, 1),
+                               "p95_ms": round(p95, 1), "p99_ms": round(p99, 1),
+                               "error_rate": round(sum(errors.values()) / len(lat), 4), "errors": errors}
+    stages = {}
+    for name, lat in sorted(results.stages.items()):
+        p50, p95, p99 = percentiles(lat)
+        stages[name] = {"count": len(lat), "p50_ms": round(p50, 1), "p95_ms": round(p95, 1), "p99_ms": round(p99, 1)}
+    total = sum(len(lat) for lat in results.latency.values())
+    return {"elapsed_s": round(elapsed, 2), "requests": total, "rps": round(total / elapsed, 2),
+            "endpoints": endpoints, "stages": stages}
+
+
+def print_report(summary: Dict):
+    print(f"{summary['requests']} requests in {summary['elapsed_s']:.1f}s ({summary['rps']:.1f} req/s)\n")
+    print(f"{'endpoint':>22} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for endpoint, s in summary["endpoints"].items():
+        print(f"{endpoint:>22} {s['requests']:>9} {s['rps']:>8.1f} {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} "
+              f"{s['p99_ms']:>8.1f} {s['error_rate']:>7.1%}")
+        if s["errors"]:
+            print(f"{'':>22} errors: {s['errors']}")
+    print(f"\n{'stage':>22} {'count':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, s in summary["stages"].items():
+        print(f"{name:>22} {s['count']:>9} {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f}")
+
+
+def compare(summary: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """Regressions of `summary` against `baseline` (both from summarize())."""
+    regressions = []
+    limit = max_regression / 100.0
+    print(f"\n{'vs baseline':>22} {'req/s':>9} {'p95 ms':>9} {'errors':>8}")
+    for endpoint, s in summary["endpoints"].items():
+        b = baseline.get("endpoints", {}).get(endpoint)
+        if not b:
+            continue
+        d_rps = s["rps"] / b["rps"] - 1 if b["rps"] else 0.0
+        d_p95 = s["p95_ms"] / b["p95_ms"] - 1 if b["p95_ms"] else 0.0
+        d_err = s["error_rate"] - b["error_rate"]
+        print(f"{endpoint:>22} {d_rps:>+9.1%} {d_p95:>+9.1%} {d_err:>+8.1%}")
+        if d_rps < -limit:
+            regressions.append(f"{endpoint} throughput {d_rps:+.1%}")
+        if d_p95 > limit:
+            regressions.append(f"{endpoint} p95 {d_p95:+.1%}")
+        if d_err > 0.01:
+            regressions.append(f"{endpoint} error rate {d_err:+.1%}")
+    return regressions
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_api(args, tmpdir: str, patients_json: str):
+    """Start the stubs and the API; returns (process, base url, stub stats)."""
+    llm, llm_stats = stub_llm_server.start_server(ttft_ms=args.ttft_ms, per_token_ms=args.per_token_ms,
+                                                  answer_tokens=args.answer_tokens,
+                                                  not_found_rate=args.not_found_rate,
+                                                  embed_latency_ms=args.embed_latency_ms)
+    search, search_stats = stub_search_server.start_server(latency_ms=args.search_latency_ms)
+    llm_url = f"http://127.0.0.1:{llm.server_address[1]}"
+    search_url = f"http://127.0.0.1:{search.server_address[1]}"
+    env = dict(os.environ,
+               AZURE_OPENAI_API_KEY="stub", AZURE_OPENAI_ENDPOINT=llm_url,
+               AZURE_OPENAI_CHAT_DEPLOYMENT="stub-chat", AZURE_OPENAI_EMBED_DEPLOYMENT="stub-embed",
+               TAVILY_API_KEY="stub", TAVILY_BASE_URL=search_url,
+               EUROPE_PMC_URL=search_url + stub_search_server.PMC_PATH,
+               SQLITE_DB_PATH=os.path.join(tmpdir, "patients.db"), PATIENTS_JSON_PATH=patients_json,
+               FAISS_INDEX_PATH=args.index or os.path.join(tmpdir, "faiss_index"),
+               EMBED_CACHE_PATH=os.path.join(tmpdir, "embedding_cache.sqlite"),
+               EMBED_PROBE_CACHE=os.path.join(tmpdir, "embedding_backend.json"),
+               WEB_CACHE_PATH=os.path.join(tmpdir, "web_cache.sqlite"),
+               SESSION_DB_PATH=os.path.join(tmpdir, "sessions.sqlite"),
+               LOG_FILE=os.path.join(tmpdir, "logs", "system.log"), LOG_CONSOLE_LEVEL="WARNING",
+               PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])))
+    if not args.index and args.questions:
+        print(f"building FAISS index from {args.corpus} with stub embeddings ...")
+        built = subprocess.run([sys.executable, "-m", "app.index_builder", args.corpus], cwd=ROOT, env=env,
+                               capture_output=True, text=True)
+        if built.returncode != 0:
+            raise SystemExit(f"index build failed (pass --index or --questions 0):\n{built.stderr[-2000:]}")
+
+    port = _free_port()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                             "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"],
+                            cwd=ROOT, env=env, stderr=open(os.path.join(tmpdir, "uvicorn.err"), "w"))
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.ready_timeout
+    while True:
+        if proc.poll() is not None:
+            with open(os.path.join(tmpdir, "uvicorn.err")) as f:
+                raise SystemExit(f"API exited with status {proc.returncode}:\n{f.read()[-2000:]}")
+        try:
+            r = httpx.get(url + "/health/ready", timeout=2)
+            # receptionist-only runs don't need the RAG warm-up to succeed
+            if r.status_code == 200 or (not args.questions and httpx.get(url + "/health/live").status_code == 200):
+                break
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            proc.terminate()
+            raise SystemExit(f"API not ready after {args.ready_timeout:.0f}s")
+        time.sleep(0.5)
+    return proc, url, {"llm": llm_stats, "search": search_stats}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    target = ap.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="API that is already running")
+    target.add_argument("--spawn", action="store_true", help="start the stubs and the API locally")
+    ap.add_argument("--sessions", type=int, default=300)
+    ap.add_argument("--concurrency", type=int, default=32, help="sessions in flight")
+    ap.add_argument("--patients", type=int, default=200, help="--spawn: generated patients")
+    ap.add_argument("--patients-file", default=os.path.join(ROOT, "data", "patients.json"), help="--url: known patients")
+    ap.add_argument("--questions", type=int, default=2, help="clinical questions per session")
+    ap.add_argument("--research-rate", type=float, default=0.1)
+    ap.add_argument("--repeat-rate", type=float, default=0.2)
+    ap.add_argument("--stream-rate", type=float, default=0.5)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--timeout-s", type=float, default=60.0, help="per request")
+    ap.add_argument("--index", default=None, help="--spawn: existing FAISS index (default: build one)")
+    ap.add_argument("--corpus", default=os.path.join(ROOT, "data", "nephrology.pdf"))
+    ap.add_argument("--workers", type=int, default=1, help="--spawn: uvicorn workers")
+    ap.add_argument("--ready-timeout", type=float, default=120.0)
+    ap.add_argument("--ttft-ms", type=float, default=300.0)
+    ap.add_argument("--per-token-ms", type=float, default=15.0)
+    ap.add_argument("--answer-tokens", type=int, default=80)
+    ap.add_argument("--not-found-rate", type=float, default=0.1)
+    ap.add_argument("--embed-latency-ms", type=float, default=30.0)
+    ap.add_argument("--search-latency-ms", type=float, default=120.0)
+    ap.add_argument("--json", default=None, help="write the results here")
+    ap.add_argument("--baseline", default=None, help="results JSON of an earlier run to compare with")
+    ap.add_argument("--max-regression", type=float, default=20.0, help="percent")
+    args = ap.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="load_test_")
+    proc, stubs = None, {}
+    try:
+        if args.spawn:
+            records = generate_patients(args.patients + max(1, args.patients // 10), args.seed)
+            known, unknown = records[:args.patients], records[args.patients:]
+            patients_json = os.path.join(tmpdir, "patients.json")
+            with open(patients_json, "w", encoding="utf-8") as f:
+                json.dump(known, f)
+            proc, url, stubs = spawn_api(args, tmpdir, patients_json)
+        else:
+            url = args.url
+            with open(args.patients_file, encoding="utf-8") as f:
+                known = json.load(f)
+            unknown = generate_patients(max(1, len(known) // 10), args.seed)
+        sessions = list(generate_sessions(known, args.sessions, args.seed, args.questions,
+                                          research_rate=args.research_rate, repeat_rate=args.repeat_rate,
+                                          stream_rate=args.stream_rate, unknown=unknown))
+        print(f"{len(sessions)} sessions ({sum(len(s['steps']) for s in sessions)} requests), "
+              f"concurrency {args.concurrency}, {url}\n")
+        results, elapsed = asyncio.run(run_sessions(url, sessions, args.concurrency, args.timeout_s))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    summary = summarize(results, elapsed)
+    summary["config"] = {k: v for k, v in vars(args).items() if k not in ("json", "baseline")}
+    summary["stubs"] = stubs
+    print_report(summary)
+    if stubs:
+        print(f"\nstubs: {stubs}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(summary, json.load(f), args.max_regression)
+        if regressions:
+            print("\nFAIL: " + "; ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
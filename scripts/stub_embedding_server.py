@@ -0,0 +1,116 @@
+"""
+Local stand-in for the Azure OpenAI / OpenAI embeddings endpoint, for offline benchmarks.
+
+Serves POST .../embeddings (e.g. /openai/deployments/<name>/embeddings?api-version=...)
+with deterministic pseudo-random unit vectors derived from each input's hash, after a
+configurable latency. An optional requests-per-minute limit answers 429 + Retry-After
+like the real service.
+
+    python scripts/stub_embedding_server.py --port 8765 --latency-ms 80 --per-item-ms 0.5 --rpm 600
+
+Point AZURE_OPENAI_ENDPOINT at http://127.0.0.1:8765 to build an index against it.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_vector(item, dim: int):
+    key = item if isinstance(item, str) else json.dumps(item)
+    rnd = random.Random(hashlib.sha256(key.encode("utf-8")).digest())
+    v = [rnd.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(x * x for x in v)) or 1.0
+    return [x / norm for x in v]
+
+
+class _Limiter:
+    def __init__(self, rpm: float):
+        self.rpm = rpm
+        self.window_start = time.monotonic()
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.rpm <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 60.0:
+                self.window_start, self.count = now, 0
+            if self.count >= self.rpm:
+                return False
+            self.count += 1
+            return True
+
+
+def make_handler(dim: int, latency_ms: float, per_item_ms: float, limiter: _Limiter, stats: dict):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if not self.path.split("?")[0].endswith("/embeddings"):
+                return self._send(404, {"error": {"message": "not found"}})
+            if not limiter.allow():
+                stats["throttled"] += 1
+                return self._send(429, {"error": {"code": "429", "message": "Rate limit exceeded"}}, {"Retry-After": "1"})
+            req = json.loads(body or b"{}")
+            inputs = req.get("input", [])
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            time.sleep((latency_ms + per_item_ms * len(inputs)) / 1000.0)
+            stats["requests"] += 1
+            stats["items"] += len(inputs)
+            data = [{"object": "embedding", "index": i, "embedding": fake_vector(x, dim)} for i, x in enumerate(inputs)]
+            tokens = sum(len(x) // 4 + 1 if isinstance(x, str) else len(x) for x in inputs)
+            self._send(200, {"object": "list", "data": data, "model": req.get("model", "stub"),
+                             "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    return Handler
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, dim: int = 1536, latency_ms: float = 50.0,
+                 per_item_ms: float = 0.2, rpm: float = 0):
+    """
+    Start the stub in a daemon thread. Returns (server, stats); server.server_address has the bound port.
+    """
+    stats = {"requests": 0, "items": 0, "throttled": 0}
+    server = ThreadingHTTPServer((host, port), make_handler(dim, latency_ms, per_item_ms, _Limiter(rpm), stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--per-item-ms", type=float, default=0.2)
+    ap.add_argument("--rpm", type=float, default=0, help="requests per minute before answering 429 (0 = unlimited)")
+    args = ap.parse_args()
+    server, _ = start_server(args.host, args.port, args.dim, args.latency_ms, args.per_item_ms, args.rpm)
+    print(f"stub embedding server on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,161 @@
+"""
+Local stand-in for Azure OpenAI chat completions (and embeddings on the same port, so one
+AZURE_OPENAI_ENDPOINT serves AzureChatOpenAI and AzureOpenAIEmbeddings), for offline
+load tests.
+
+Serves
+    POST /openai/deployments/<name>/chat/completions   JSON, or SSE chunks with "stream": true
+    POST /openai/deployments/<name>/embeddings         as scripts/stub_embedding_server.py
+Answers are deterministic per prompt: --ttft-ms before the first token, then --per-token-ms
+per token. --not-found-rate answers "not found in reference" for that fraction of prompts
+(picked by prompt hash) so the clinical agent falls back to web search.
+
+    python scripts/stub_llm_server.py --port 8767 --ttft-ms 300 --per-token-ms 15 --answer-tokens 80
+
+    AZURE_OPENAI_API_KEY=stub AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8767 \
+    AZURE_OPENAI_CHAT_DEPLOYMENT=stub-chat AZURE_OPENAI_EMBED_DEPLOYMENT=stub-embed uvicorn app.main:app
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from stub_embedding_server import fake_vector
+
+WORDS = ("kidney", "fluid", "sodium", "potassium", "dose", "blood", "pressure", "daily", "monitor", "swelling",
+         "clinic", "urine", "diet", "weight", "medication", "symptoms", "doctor", "follow-up", "rest", "water")
+
+
+def fake_answer(prompt: str, n_tokens: int, not_found_rate: float) -> list:
+    """Answer for `prompt` as a list of token strings."""
+    h = hashlib.sha256(prompt.encode("utf-8")).digest()
+    if h[0] / 256.0 < not_found_rate:
+        return ["The", " answer", " is", " not", " found", " in", " reference", "."]
+    tokens = [" " + WORDS[(h[i % len(h)] + i) % len(WORDS)] for i in range(max(1, n_tokens - 2))]
+    return ["Based"] + tokens + [" [ref#1]."]
+
+
+def _prompt_text(req: dict) -> str:
+    parts = []
+    for m in req.get("messages", []):
+        content = m.get("content", "")
+        parts.append(content if isinstance(content, str) else json.dumps(content))
+    return "\n".join(parts)
+
+
+def make_handler(ttft_ms: float, per_token_ms: float, answer_tokens: int, not_found_rate: float,
+                 embed_dim: int, embed_latency_ms: float, stats: dict):
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # stream chunks go out as they are written
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _chunk(self, payload):
+            data = f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            req = json.loads(body or b"{}")
+            path = self.path.split("?")[0]
+            if path.endswith("/embeddings"):
+                return self._embeddings(req)
+            if not path.endswith("/chat/completions"):
+                return self._send(404, {"error": {"message": "not found"}})
+            prompt = _prompt_text(req)
+            tokens = fake_answer(prompt, min(answer_tokens, int(req.get("max_tokens") or answer_tokens)), not_found_rate)
+            usage = {"prompt_tokens": len(prompt) // 4 + 1, "completion_tokens": len(tokens),
+                     "total_tokens": len(prompt) // 4 + 1 + len(tokens)}
+            with lock:
+                stats["chat"] += 1
+                stats["prompt_tokens"] += usage["prompt_tokens"]
+                stats["completion_tokens"] += usage["completion_tokens"]
+            base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": req.get("model") or "stub-chat"}
+            time.sleep(ttft_ms / 1000.0)
+            if not req.get("stream"):
+                time.sleep(per_token_ms * len(tokens) / 1000.0)
+                return self._send(200, {**base, "object": "chat.completion", "usage": usage, "choices": [{
+                    "index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "".join(tokens)}}]})
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                chunk = {**base, "object": "chat.completion.chunk"}
+                self._chunk({**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""},
+                                                   "finish_reason": None}]})
+                for token in tokens:
+                    self._chunk({**chunk, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+                    time.sleep(per_token_ms / 1000.0)
+                self._chunk({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                if (req.get("stream_options") or {}).get("include_usage"):
+                    self._chunk({**chunk, "choices": [], "usage": usage})
+                self._chunk("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client stopped reading (request cancelled)
+
+        def _embeddings(self, req):
+            inputs = req.get("input", [])
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            time.sleep(embed_latency_ms / 1000.0)
+            with lock:
+                stats["embeddings"] += 1
+                stats["embedded_items"] += len(inputs)
+            data = [{"object": "embedding", "index": i, "embedding": fake_vector(x, embed_dim)} for i, x in enumerate(inputs)]
+            tokens = sum(len(x) // 4 + 1 if isinstance(x, str) else len(x) for x in inputs)
+            self._send(200, {"object": "list", "data": data, "model": req.get("model", "stub-embed"),
+                             "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    return Handler
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, ttft_ms: float = 300.0, per_token_ms: float = 15.0,
+                 answer_tokens: int = 80, not_found_rate: float = 0.0, embed_dim: int = 1536,
+                 embed_latency_ms: float = 30.0):
+    """
+    Start the stub in a daemon thread. Returns (server, stats); server.server_address has the bound port.
+    """
+    stats = {"chat": 0, "prompt_tokens": 0, "completion_tokens": 0, "embeddings": 0, "embedded_items": 0}
+    handler = make_handler(ttft_ms, per_token_ms, answer_tokens, not_found_rate, embed_dim, embed_latency_ms, stats)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8767)
+    ap.add_argument("--ttft-ms", type=float, default=300.0, help="latency before the first token")
+    ap.add_argument("--per-token-ms", type=float, default=15.0)
+    ap.add_argument("--answer-tokens", type=int, default=80)
+    ap.add_argument("--not-found-rate", type=float, default=0.0, help="fraction of prompts answered 'not found in reference'")
+    ap.add_argument("--embed-dim", type=int, default=1536)
+    ap.add_argument("--embed-latency-ms", type=float, default=30.0)
+    args = ap.parse_args()
+    server, _ = start_server(args.host, args.port, args.ttft_ms, args.per_token_ms, args.answer_tokens,
+                             args.not_found_rate, args.embed_dim, args.embed_latency_ms)
+    print(f"stub Azure OpenAI server on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
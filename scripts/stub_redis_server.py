@@ -0,0 +1,158 @@
+"""
+Local stand-in for a Redis server, enough for the redis session backend
+(app.session_store.RedisSessionStore) and its tests/benchmarks.
+
+Speaks RESP2 and supports PING, AUTH, SELECT, GET, SET [EX|PX], DEL, EXPIRE, TTL, DBSIZE,
+FLUSHDB and INFO. Keys expire lazily like Redis, and --max-keys evicts least recently
+used keys (like maxmemory-policy allkeys-lru), reported as evicted_keys in INFO.
+
+    python scripts/stub_redis_server.py --port 6390 --max-keys 10000
+    SESSION_BACKEND=redis REDIS_URL=redis://127.0.0.1:6390/0 uvicorn app.main:app --workers 4
+"""
+import argparse
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Error(str):
+    """Error reply (-ERR ...)."""
+
+
+class _Store:
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.data: "OrderedDict[bytes, tuple]" = OrderedDict()  # key -> (value, expires_at or None)
+        self.lock = threading.Lock()
+        self.stats = {"commands": 0, "evicted_keys": 0, "expired_keys": 0, "keyspace_hits": 0, "keyspace_misses": 0}
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            self.stats["expired_keys"] += 1
+            return None
+        self.data.move_to_end(key)
+        return entry
+
+    def command(self, args):
+        name = args[0].upper()
+        with self.lock:
+            self.stats["commands"] += 1
+            if name in (b"PING",):
+                return "+PONG"
+            if name in (b"AUTH", b"SELECT"):
+                return "+OK"
+            if name == b"GET":
+                entry = self._live(args[1])
+                self.stats["keyspace_hits" if entry else "keyspace_misses"] += 1
+                return entry[0] if entry else None
+            if name == b"SET":
+                expires = None
+                opts = [a.upper() for a in args[3:]]
+                if b"EX" in opts:
+                    expires = time.monotonic() + int(args[3 + opts.index(b"EX") + 1])
+                elif b"PX" in opts:
+                    expires = time.monotonic() + int(args[3 + opts.index(b"PX") + 1]) / 1000.0
+                self.data[args[1]] = (args[2], expires)
+                self.data.move_to_end(args[1])
+                while self.max_keys and len(self.data) > self.max_keys:
+                    self.data.popitem(last=False)
+                    self.stats["evicted_keys"] += 1
+                return "+OK"
+            if name == b"DEL":
+                return sum(1 for k in args[1:] if self.data.pop(k, None) is not None)
+            if name == b"EXPIRE":
+                entry = self._live(args[1])
+                if entry is None:
+                    return 0
+                self.data[args[1]] = (entry[0], time.monotonic() + int(args[2]))
+                return 1
+            if name == b"TTL":
+                entry = self._live(args[1])
+                if entry is None:
+                    return -2
+                return -1 if entry[1] is None else int(entry[1] - time.monotonic())
+            if name == b"DBSIZE":
+                return len(self.data)
+            if name == b"FLUSHDB":
+                self.data.clear()
+                return "+OK"
+            if name == b"INFO":
+                lines = ["# Stats"] + [f"{k}:{v}" for k, v in self.stats.items()]
+                return ("\r\n".join(lines) + "\r\n").encode()
+            return _Error(f"ERR unknown command '{name.decode(errors='replace')}'")
+
+
+def _encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, _Error):
+        return b"-" + reply.encode() + b"\r\n"
+    if isinstance(reply, str):
+        return reply.encode() + b"\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+
+def _read_command(rfile):
+    line = rfile.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()  # inline command (e.g. from telnet)
+    args = []
+    for _ in range(int(line[1:])):
+        n = int(rfile.readline()[1:])
+        args.append(rfile.read(n + 2)[:-2])
+    return args
+
+
+def make_handler(store: _Store):
+    class Handler(socketserver.StreamRequestHandler):
+        disable_nagle_algorithm = True
+
+        def handle(self):
+            while True:
+                try:
+                    args = _read_command(self.rfile)
+                except (ConnectionError, ValueError):
+                    return
+                if not args:
+                    return
+                self.wfile.write(_encode(store.command(args)))
+
+    return Handler
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, max_keys: int = 0):
+    """
+    Start the stub in a daemon thread. Returns (server, stats); server.server_address has the bound port.
+    """
+    store = _Store(max_keys)
+    server = _Server((host, port), make_handler(store))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, store.stats
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6390)
+    ap.add_argument("--max-keys", type=int, default=0, help="evict least recently used keys beyond this (0 = unlimited)")
+    args = ap.parse_args()
+    server, _ = start_server(args.host, args.port, args.max_keys)
+    print(f"stub redis server on redis://{args.host}:{server.server_address[1]}/0")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,115 @@
+"""
+Local stand-ins for the Tavily and Europe PMC search APIs, for offline tests and benchmarks.
+
+Serves
+    POST /search                                  Tavily-shaped {"answer", "results": [...]}
+    GET  /europepmc/webservices/rest/search       Europe PMC-shaped {"resultList": {"result": [...]}}
+with deterministic results per query after a configurable latency. --slow-rate makes a
+fraction of requests 10x slower (to exercise hedging) and --fail-rate answers 503 (to trip
+the circuit breaker).
+
+    python scripts/stub_search_server.py --port 8766 --latency-ms 120 --slow-rate 0.05
+
+    TAVILY_API_KEY=stub TAVILY_BASE_URL=http://127.0.0.1:8766 \
+    EUROPE_PMC_URL=http://127.0.0.1:8766/europepmc/webservices/rest/search uvicorn app.main:app
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PMC_PATH = "/europepmc/webservices/rest/search"
+
+
+def fake_hits(query: str, provider: str, n: int = 5):
+    h = hashlib.sha256(query.encode("utf-8")).hexdigest()
+    # the last hit has the same title for both providers so the merge has something to de-duplicate
+    return [(f"{h[:8]}{i}", f"{query} - {provider} finding {i}") for i in range(n - 1)] + [(h[:8] + "x", f"{query} - review")]
+
+
+def make_handler(latency_ms: float, slow_rate: float, fail_rate: float, stats: dict, seed: int = 0):
+    rnd = random.Random(seed)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client cancelled (e.g. the losing hedged request)
+
+        def _delay_or_fail(self, provider: str) -> bool:
+            with lock:
+                stats[provider] += 1
+                slow, fail = rnd.random() < slow_rate, rnd.random() < fail_rate
+            time.sleep(latency_ms * (10 if slow else 1) / 1000.0)
+            if fail:
+                stats["failed"] += 1
+                self._send(503, {"error": "unavailable"})
+            return not fail
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if urlparse(self.path).path != "/search":
+                return self._send(404, {"error": "not found"})
+            if not self._delay_or_fail("tavily"):
+                return
+            query = json.loads(body or b"{}").get("query", "")
+            results = [{"title": t, "url": f"https://example.org/{pid}", "content": f"Summary of {t}."}
+                       for pid, t in fake_hits(query, "tavily")]
+            self._send(200, {"answer": f"Stub answer for: {query}", "results": results})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != PMC_PATH:
+                return self._send(404, {"error": "not found"})
+            if not self._delay_or_fail("europepmc"):
+                return
+            query = parse_qs(url.query).get("query", [""])[0]
+            hits = [{"title": t, "pmid": pid, "abstractText": f"Abstract of {t}."} for pid, t in fake_hits(query, "europepmc")]
+            self._send(200, {"hitCount": len(hits), "resultList": {"result": hits}})
+
+    return Handler
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 100.0, slow_rate: float = 0.0,
+                 fail_rate: float = 0.0):
+    """
+    Start the stub in a daemon thread. Returns (server, stats); server.server_address has the bound port.
+    """
+    stats = {"tavily": 0, "europepmc": 0, "failed": 0}
+    server = ThreadingHTTPServer((host, port), make_handler(latency_ms, slow_rate, fail_rate, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--latency-ms", type=float, default=100.0)
+    ap.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests that take 10x latency")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = ap.parse_args()
+    server, _ = start_server(args.host, args.port, args.latency_ms, args.slow_rate, args.fail_rate)
+    print(f"stub search server on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
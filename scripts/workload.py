@@ -0,0 +1,127 @@
+"""
+Synthetic patient / question workload for scripts/load_test.py, built on
+data/patient_generator.py.
+
+    python scripts/workload.py --patients 200 --sessions 500 --out workload.jsonl \
+                               --patients-json patients.json
+
+Each session is one patient's conversation, replayed in order by the load driver:
+a receptionist greeting and name (exact, lower-cased, misspelled or unknown), then
+clinical questions built from the patient's record (symptoms from the warning signs,
+medication and diet questions, some "latest research" questions that go to web search).
+--repeat-rate reuses earlier questions verbatim so the semantic answer cache sees hits.
+--patients-json writes the generated records so the API under test can load them
+(PATIENTS_JSON_PATH); names marked unknown are left out of it.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RECEPTIONIST = "/receptionist/message"
+CLINICAL = "/clinical/query"
+CLINICAL_STREAM = "/clinical/stream"
+
+SYMPTOM_QUESTIONS = ("I have {sign} since yesterday, is that normal?", "Should I worry about {sign}?",
+                     "What should I do about {sign} after discharge?")
+MEDICATION_QUESTIONS = ("Can I take ibuprofen together with {drug}?", "What are the side effects of {drug}?",
+                        "I missed a dose of {drug}, what should I do?", "Can I drink alcohol while taking {drug}?")
+DIET_QUESTIONS = ("How much fluid can I drink per day with {diagnosis}?", "Can I eat bananas with {diagnosis}?",
+                  "Which foods are high in potassium and should I avoid them?")
+RESEARCH_QUESTIONS = ("What is the latest research on {diagnosis}?", "Are there new clinical trials for {diagnosis}?")
+SMALL_TALK = ("thanks, all good", "ok, thank you")
+
+
+def misspell(name: str, rnd: random.Random) -> str:
+    i = rnd.randrange(1, max(2, len(name) - 1))
+    return name[:i] + name[i + 1:] if name[i] != " " else name
+
+
+def generate_patients(n: int, seed: int) -> List[Dict]:
+    from data.patient_generator import generate_patients as _generate
+    return list(_generate(n, seed=seed))
+
+
+def clinical_question(patient: Dict, rnd: random.Random, research_rate: float) -> str:
+    if rnd.random() < research_rate:
+        return rnd.choice(RESEARCH_QUESTIONS).format(diagnosis=patient["primary_diagnosis"])
+    kind = rnd.choice(("symptom", "medication", "diet"))
+    if kind == "symptom":
+        sign = rnd.choice(patient["warning_signs"].split(", ")).lower()
+        return rnd.choice(SYMPTOM_QUESTIONS).format(sign=sign)
+    if kind == "medication":
+        drug = rnd.choice(patient["medications"]).split()[0]
+        return rnd.choice(MEDICATION_QUESTIONS).format(drug=drug)
+    return rnd.choice(DIET_QUESTIONS).format(diagnosis=patient["primary_diagnosis"])
+
+
+def generate_sessions(patients: List[Dict], sessions: int, seed: int = 0, questions_per_session: int = 2,
+                      unknown_rate: float = 0.05, typo_rate: float = 0.1, research_rate: float = 0.1,
+                      repeat_rate: float = 0.2, stream_rate: float = 0.5,
+                      unknown: Optional[List[Dict]] = None) -> Iterator[Dict]:
+    """
+    Yield {"session_id", "patient", "steps": [{"endpoint", "message"}]} for `sessions`
+    conversations over `patients` (and `unknown`, patients missing from the database).
+    """
+    rnd = random.Random(seed)
+    asked: List[str] = []
+    for _ in range(sessions):
+        known = not unknown or rnd.random() >= unknown_rate
+        patient = rnd.choice(patients if known else unknown)
+        name = patient["patient_name"]
+        roll = rnd.random()
+        if known and roll < typo_rate:
+            name = misspell(name, rnd)
+        elif known and roll < typo_rate + 0.2:
+            name = name.lower()
+        steps = [{"endpoint": RECEPTIONIST, "message": "hi"}, {"endpoint": RECEPTIONIST, "message": name}]
+        if known:
+            steps.append({"endpoint": RECEPTIONIST, "message": rnd.choice(SMALL_TALK)})
+            for _ in range(questions_per_session):
+                if asked and rnd.random() < repeat_rate:
+                    question = rnd.choice(asked)
+                else:
+                    question = clinical_question(patient, rnd, research_rate)
+                    asked.append(question)
+                endpoint = CLINICAL_STREAM if rnd.random() < stream_rate else CLINICAL
+                steps.append({"endpoint": endpoint, "message": question})
+        yield {"session_id": uuid.UUID(int=rnd.getrandbits(128)).hex, "patient": patient["patient_name"],
+               "steps": steps}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--patients", type=int, default=200)
+    ap.add_argument("--sessions", type=int, default=500)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--questions", type=int, default=2, help="clinical questions per session")
+    ap.add_argument("--unknown-rate", type=float, default=0.05)
+    ap.add_argument("--typo-rate", type=float, default=0.1)
+    ap.add_argument("--research-rate", type=float, default=0.1)
+    ap.add_argument("--repeat-rate", type=float, default=0.2)
+    ap.add_argument("--stream-rate", type=float, default=0.5)
+    ap.add_argument("--out", default="-", help="JSONL file (default stdout)")
+    ap.add_argument("--patients-json", default=None, help="write the known patients here for PATIENTS_JSON_PATH")
+    args = ap.parse_args()
+
+    records = generate_patients(args.patients + max(1, args.patients // 10), args.seed)
+    known, unknown = records[:args.patients], records[args.patients:]
+    if args.patients_json:
+        with open(args.patients_json, "w", encoding="utf-8") as f:
+            json.dump(known, f, indent=2)
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    for session in generate_sessions(known, args.sessions, args.seed, args.questions, args.unknown_rate,
+                                     args.typo_rate, args.research_rate, args.repeat_rate, args.stream_rate, unknown):
+        out.write(json.dumps(session) + "\n")
+    if out is not sys.stdout:
+        out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ Notes:
 - Uses st.rerun() instead of the removed experimental API.
 """
 
+import json
 import os
 import uuid
 import requests
@@ -77,6 +78,88 @@ for role, text in st.session_state.history:
     elif role == "agent":
         st.markdown(f"**Agent:** {text}")
 
+def iter_sse_events(resp):
+    """Yield the JSON payload of each `data:` line of a server-sent events response."""
+    for line in resp.iter_lines(decode_unicode=True):
+        if line and line.startswith("data:"):
+            yield json.loads(line[len("data:"):].strip())
+
+def stream_clinical_answer(message, placeholder):
+    """
+    Call /clinical/stream and render answer tokens into `placeholder` as they arrive.
+    Returns the final result dict (same shape as /clinical/query), or None after an error.
+    """
+    try:
+        resp_c = requests.post(
+            f"{API_URL}/clinical/stream",
+            json={"session_id": st.session_state.session_id, "message": message},
+            timeout=ST_TIMEOUT * 2,
+            stream=True,
+        )
+    except Exception as e:
+        st.session_state.history.append(("agent", f"Clinical Agent request failed: {e}"))
+        return None
+
+    # handle non-200 quickly
+    if resp_c.status_code != 200:
+        st.session_state.history.append(("agent", f"Clinical Agent backend error: {resp_c.status_code}"))
+        # show text for debugging
+        st.session_state.history.append(("agent", f"Debug (truncated): {resp_c.text[:1200]}"))
+        return None
+
+    text = ""
+    try:
+        with resp_c:
+            for event in iter_sse_events(resp_c):
+                if event.get("type") == "token":
+                    text += event.get("text", "")
+                    placeholder.markdown(f"**Agent:** Clinical Agent: {text}▌")
+                elif event.get("type") == "error":
+                    return {"error": event.get("error")}
+                elif event.get("type") == "done":
+                    return event
+    except Exception as e:
+        st.session_state.history.append(("agent", f"Clinical Agent stream failed: {e}"))
+        return None
+    st.session_state.history.append(("agent", "Clinical Agent stream ended without a result."))
+    return None
+
+def append_clinical_result(c):
+    # display clinical result
+    if c.get("error"):
+        st.session_state.history.append(("agent", f"Clinical Agent error: {c.get('error')}"))
+    elif c.get("web"):
+        st.session_state.history.append(("agent", "Clinical Agent: I searched the web (results below):"))
+        # be careful with long web_results — stringify/truncate
+        web_results = c.get("web_results", [])
+        if not web_results:
+            st.session_state.history.append(("agent", "Clinical Agent: No web results found."))
+        else:
+            # render each result as markdown with clickable link and short snippet
+            for i, res in enumerate(web_results, start=1):
+                title = res.get("title") or f"Result {i}"
+                snippet = res.get("snippet") or ""
+                link = res.get("link") or ""
+                if link:
+                    md = f"**{i}. [{title}]({link})**  \n{snippet}"
+                else:
+                    md = f"**{i}. {title}**  \n{snippet}"
+                st.session_state.history.append(("agent", md))
+    else:
+        answer = c.get("answer")
+        sources = c.get("sources")
+        if answer:
+            st.session_state.history.append(("agent", f"Clinical Agent: {answer}"))
+        else:
+            st.session_state.history.append(("agent", "Clinical Agent: No answer returned."))
+
+        if sources:
+            # show short citation list
+            st.session_state.history.append(("agent", "Sources:"))
+            for s in sources:
+                # s might be dict with 'ref' and 'excerpt'
+                st.session_state.history.append(("agent", str(s)))
+
 # user input box
 user_input = st.text_input("Enter message", key="input")
 
@@ -111,67 +194,13 @@ if st.button("Send"):
     if r.get("reply"):
         st.session_state.history.append(("agent", r["reply"]))
 
-    # If receptionist requests a handoff to clinical agent, call it
+    # If receptionist requests a handoff to clinical agent, stream its answer
     if r.get("handoff"):
-        try:
-            resp_c = requests.post(
-                f"{API_URL}/clinical/query",
-                json={"session_id": st.session_state.session_id, "message": user_input},
-                timeout=ST_TIMEOUT * 2
-            )
-        except Exception as e:
-            st.session_state.history.append(("agent", f"Clinical Agent request failed: {e}"))
-            st.rerun()
-
-        # handle non-200 quickly
-        if resp_c.status_code != 200:
-            st.session_state.history.append(("agent", f"Clinical Agent backend error: {resp_c.status_code}"))
-            # show text for debugging
-            st.session_state.history.append(("agent", f"Debug (truncated): {resp_c.text[:1200]}"))
-            st.rerun()
-
-        # parse JSON safely
-        try:
-            c = resp_c.json()
-        except Exception as e:
-            st.session_state.history.append(("agent", f"Clinical Agent returned invalid JSON: {e}"))
-            st.session_state.history.append(("agent", f"Raw (truncated): {resp_c.text[:1200]}"))
-            st.rerun()
-
-        # display clinical result
-        if c.get("error"):
-            st.session_state.history.append(("agent", f"Clinical Agent error: {c.get('error')}"))
-        elif c.get("web"):
-            st.session_state.history.append(("agent", "Clinical Agent: I searched the web (results below):"))
-            # be careful with long web_results — stringify/truncate
-            web_results = c.get("web_results", [])
-            if not web_results:
-                st.session_state.history.append(("agent", "Clinical Agent: No web results found."))
-            else:
-    # render each result as markdown with clickable link and short snippet
-                for i, res in enumerate(web_results, start=1):
-                    title = res.get("title") or f"Result {i}"
-                    snippet = res.get("snippet") or ""
-                    link = res.get("link") or ""
-                    if link:
-                        md = f"**{i}. [{title}]({link})**  \n{snippet}"
-                    else:
-                        md = f"**{i}. {title}**  \n{snippet}"
-                    st.session_state.history.append(("agent", md))
-        else:
-            answer = c.get("answer")
-            sources = c.get("sources")
-            if answer:
-                st.session_state.history.append(("agent", f"Clinical Agent: {answer}"))
-            else:
-                st.session_state.history.append(("agent", "Clinical Agent: No answer returned."))
-
-            if sources:
-                # show short citation list
-                st.session_state.history.append(("agent", "Sources:"))
-                for s in sources:
-                    # s might be dict with 'ref' and 'excerpt'
-                    st.session_state.history.append(("agent", str(s)))
+        placeholder = st.empty()
+        c = stream_clinical_answer(user_input, placeholder)
+        placeholder.empty()
+        if c is not None:
+            append_clinical_result(c)
 
     # finished handling this message — rerun to refresh UI
     st.rerun()